@@ -0,0 +1,151 @@
+"""
+Rolling-window aggregates (count, mean, min, max) of each (monitor, physio_id)
+
+The windows match the averaging periods the IntelliVue itself offers
+(POLL_EXT_PERIOD_NU_AVG_12SEC, _60SEC and _300SEC), but are computed here,
+from the (1 s) numerics Einstein already polls for.
+
+Each window updates in amortised O(1): a running sum for the mean,
+and monotonic deques for the min and max.
+Non-finite values (NaN, infinities) aren't aggregated.
+"""
+
+from collections import deque
+import math
+
+import api
+
+
+WINDOWS = (12, 60, 300)  # Seconds
+
+
+class RollingWindow(object):
+
+    def __init__(self, length):
+        self.length = length
+        self.points = deque()  # (time, value), oldest first
+        self.minima = deque()  # (time, value), values increasing; the first is the window's min
+        self.maxima = deque()  # (time, value), values decreasing; the first is the window's max
+        self.total = 0.0
+
+
+    def add(self, time, value):
+        self.expire(time)
+        if math.isinf(value) or math.isnan(value):
+            return
+
+        point = (time, value)
+        self.points.append(point)
+        self.total += value
+
+        while self.minima and self.minima[-1][1] >= value:
+            self.minima.pop()
+        self.minima.append(point)
+        while self.maxima and self.maxima[-1][1] <= value:
+            self.maxima.pop()
+        self.maxima.append(point)
+
+
+    def expire(self, now):
+        cutoff = now - self.length
+        while self.points and self.points[0][0] <= cutoff:
+            _, value = self.points.popleft()
+            self.total -= value
+        while self.minima and self.minima[0][0] <= cutoff:
+            self.minima.popleft()
+        while self.maxima and self.maxima[0][0] <= cutoff:
+            self.maxima.popleft()
+
+        if not self.points:
+            self.total = 0.0  # Drop any accumulated rounding error
+
+
+    def summary(self):
+        """
+        (count, mean, min, max), or None if the window is empty
+        """
+        count = len(self.points)
+        if not count:
+            return None
+        return count, self.total / count, self.minima[0][1], self.maxima[0][1]
+
+
+class Series(object):
+
+    def __init__(self, unit_code):
+        self.unit_code = unit_code
+        self.windows = dict((length, RollingWindow(length)) for length in WINDOWS)
+
+
+class Aggregates(object):
+    """
+    Rolling aggregates for every (monitor, physio_id) seen,
+    shared by IntellivueInterface (which records into it) and the web server (which queries it)
+    """
+
+    def __init__(self):
+        self.series = {}  # Mapping of monitor_id -> physio_id -> Series
+        self.emitted = {}  # Mapping of (monitor_id, window) -> when aggregates were last delivered for it
+
+
+    def record(self, monitor_id, time, observations):
+        series = self.series.setdefault(monitor_id, {})
+        for observation in observations:
+            s = series.get(observation.physio_id)
+            if s is None:
+                s = series[observation.physio_id] = Series(observation.unit_code)
+            s.unit_code = observation.unit_code
+            for window in s.windows.values():
+                window.add(time, observation.value)
+
+
+    def query(self, monitor_id, window, now, physio_ids=None):
+        """
+        api.Aggregates over the last window seconds, for those of physio_ids (or all) with any points in it
+        """
+        series = self.series.get(monitor_id, {})
+        if physio_ids is None:
+            physio_ids = series.keys()
+
+        aggregates = []
+        for physio_id in physio_ids:
+            s = series.get(physio_id)
+            if s is None:
+                continue
+            rolling = s.windows[window]
+            rolling.expire(now)
+            summary = rolling.summary()
+            if summary is not None:
+                count, mean, minimum, maximum = summary
+                aggregates.append(api.Aggregate(
+                    physio_id=physio_id,
+                    unit_code=s.unit_code,
+                    window=window,
+                    count=count,
+                    mean=mean,
+                    min=minimum,
+                    max=maximum,
+                ))
+        return aggregates
+
+
+    def due(self, monitor_id, now):
+        """
+        The windows whose aggregates for monitor_id should be delivered (to aggregate subscriptions) now:
+        those that haven't been for a whole window
+        """
+        windows = []
+        for window in WINDOWS:
+            last = self.emitted.get((monitor_id, window))
+            if last is None:
+                self.emitted[(monitor_id, window)] = now  # Wait for a whole window of points first
+            elif now - last >= window:
+                self.emitted[(monitor_id, window)] = now
+                windows.append(window)
+        return windows
+
+
+    def stats(self):
+        return {
+            "series": sum(len(series) for series in self.series.values()),
+        }
@@ -26,8 +26,35 @@ class Payload(object):
     datetime = attr.ib(factory=datetime.datetime.now)
     observations = attr.ib(factory=list)
 
+@attr.s
+class Aggregate(object):
+    physio_id = attr.ib(default="")
+    unit_code = attr.ib(default="")
+    window = attr.ib(default=60)  # Seconds
+    count = attr.ib(default=0)
+    mean = attr.ib(default=0)
+    min = attr.ib(default=0)
+    max = attr.ib(default=0)
+
+
+@attr.s
+class AggregatePayload(object):
+    monitor_id = attr.ib()
+    window = attr.ib()
+    datetime = attr.ib(factory=datetime.datetime.now)
+    aggregates = attr.ib(factory=list)
+
+
 @attr.s
 class Subscription(object):
     monitor_id = attr.ib()
     url = attr.ib()
     subscription_id = attr.ib(factory=lambda: str(uuid.uuid4()))
+    physio_ids = attr.ib(default=None)  # The physio_ids (labels) to deliver, or None for all of them
+    changed_only = attr.ib(default=False)  # See filters
+    deadbands = attr.ib(default=None)  # See filters
+    max_interval = attr.ib(default=None)  # See filters
+    content_encoding = attr.ib(default=None)  # None for plain JSON, or "gzip"
+    batch_size = attr.ib(default=None)  # If batching, the most Payloads to send in one request
+    batch_delay = attr.ib(default=None)  # If batching, the longest (in seconds) to hold a Payload back for
+    aggregate = attr.ib(default=None)  # One of aggregate.WINDOWS, to be sent AggregatePayloads (once a window) instead of Payloads
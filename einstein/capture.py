@@ -0,0 +1,242 @@
+"""
+Packet capture, to pcap files
+
+Datagrams are written as received, with synthesised IPv4 and UDP headers
+(so tools like Wireshark still see the addresses and ports) under LINKTYPE_RAW,
+into a buffer that's flushed when it fills or periodically, to a file that's kept open,
+and rotated once it reaches a size or an age.
+
+Writes can optionally be made on a thread of their own, off the reactor thread.
+
+readCapture reads them back (as well as older captures, of bare Scapy packets).
+"""
+
+import os
+import Queue
+import socket
+import struct
+import threading
+
+from scapy.utils import RawPcapReader
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+import structlog
+
+import intellivue
+
+log = structlog.get_logger()
+
+
+PCAP_HEADER = struct.Struct("<IHHiIII")  # magic, version major, minor, thiszone, sigfigs, snaplen, network
+PCAP_RECORD_HEADER = struct.Struct("<IIII")  # seconds, microseconds, captured length, original length
+IPV4_HEADER = struct.Struct("!BBHHHBBH4s4s")
+UDP_HEADER = struct.Struct("!HHHH")
+
+PCAP_MAGIC = 0xa1b2c3d4
+LINKTYPE_RAW = 101  # Packets start with an IPv4 (or IPv6) header
+SNAPLEN = 65535
+IPPROTO_UDP = 17
+
+UNKNOWN_SOURCE = ("127.0.0.1", intellivue.PORT_PROTOCOL)  # For captures without IP headers
+
+DEFAULT_BUFFER_BYTES = 1 << 16
+DEFAULT_FLUSH_INTERVAL = 1  # Seconds
+
+
+def ipv4Checksum(header):
+    total = sum(struct.unpack("!10H", header))
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+def packAddress(host):
+    try:
+        return socket.inet_aton(host)
+    except socket.error:
+        return "\x00\x00\x00\x00"
+
+
+def record(data, src, dst, timestamp):
+    """
+    A pcap record of a UDP datagram from src to dst (each a (host, port) pair)
+    """
+    length = IPV4_HEADER.size + UDP_HEADER.size + len(data)
+    ip = IPV4_HEADER.pack(0x45, 0, length, 0, 0, 64, IPPROTO_UDP, 0, packAddress(src[0]), packAddress(dst[0]))
+    ip = ip[:10] + struct.pack("!H", ipv4Checksum(ip)) + ip[12:]
+    udp = UDP_HEADER.pack(src[1], dst[1], UDP_HEADER.size + len(data), 0)  # A zero checksum means "none"
+
+    seconds = int(timestamp)
+    microseconds = int(round((timestamp - seconds) * 1e6))
+    if microseconds == 1000000:
+        seconds, microseconds = seconds + 1, 0
+    return PCAP_RECORD_HEADER.pack(seconds, microseconds, length, length) + ip + udp + data
+
+
+class CaptureFiles(object):
+    """
+    The capture files themselves: filename, then (on rotation) filename's root.1.ext, root.2.ext, ...
+    Files that already exist aren't overwritten (or appended to); the next free name is used instead.
+    """
+
+    def __init__(self, filename, max_bytes=None, max_seconds=None):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.index = 0
+        self.file = None
+        self.opened = None
+        self.size = 0
+
+
+    def path(self, index):
+        if index == 0:
+            return self.filename
+        root, ext = os.path.splitext(self.filename)
+        return "%s.%d%s" % (root, index, ext)
+
+
+    def write(self, data, now):
+        if self.file is not None and self.due(now):
+            self.file.close()
+            self.file = None
+            self.index += 1
+        if self.file is None:
+            self.open(now)
+
+        self.file.write(data)
+        self.size += len(data)
+
+
+    def due(self, now):
+        return (self.max_bytes is not None and self.size >= self.max_bytes) or \
+            (self.max_seconds is not None and now - self.opened >= self.max_seconds)
+
+
+    def open(self, now):
+        while os.path.exists(self.path(self.index)) and os.path.getsize(self.path(self.index)):
+            self.index += 1
+        self.file = open(self.path(self.index), "wb")
+        self.file.write(PCAP_HEADER.pack(PCAP_MAGIC, 2, 4, 0, 0, SNAPLEN, LINKTYPE_RAW))
+        self.size = PCAP_HEADER.size
+        self.opened = now
+        log.info("Opened capture file", path=self.path(self.index))
+
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class CaptureWriter(object):
+    """
+    Buffers records, and writes them to CaptureFiles when the buffer fills or every flush_interval seconds
+    (on a thread of its own, if threaded)
+    """
+
+    def __init__(self, filename, max_bytes=None, max_seconds=None, buffer_bytes=DEFAULT_BUFFER_BYTES, flush_interval=DEFAULT_FLUSH_INTERVAL, threaded=False, clock=reactor):
+        self.files = CaptureFiles(filename, max_bytes, max_seconds)
+        self.buffer_bytes = buffer_bytes
+        self.clock = clock
+        self.buffer = []
+        self.buffered = 0
+        self.written = 0
+
+        self.queue = None
+        self.thread = None
+        if threaded:
+            self.queue = Queue.Queue()
+            self.thread = threading.Thread(target=self._writeQueued, name="capture")
+            self.thread.daemon = True
+            self.thread.start()
+
+        self.loop = LoopingCall(self.flush)
+        self.loop.clock = clock
+        self.loop.start(flush_interval, now=False)
+
+
+    def write(self, data, src, dst):
+        now = self.clock.seconds()
+        r = record(data, src, dst, now)
+        self.buffer.append(r)
+        self.buffered += len(r)
+        if self.buffered >= self.buffer_bytes:
+            self.flush()
+
+
+    def flush(self):
+        if not self.buffer:
+            return
+
+        data = "".join(self.buffer)
+        self.buffer = []
+        self.buffered = 0
+        self.written += len(data)
+
+        if self.queue is not None:
+            self.queue.put((data, self.clock.seconds()))
+        else:
+            self._write(data, self.clock.seconds())
+
+
+    def _write(self, data, now):
+        self.files.write(data, now)
+        self.files.flush()
+
+
+    def _writeQueued(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                self._write(*item)
+            except Exception:
+                log.exception("Could not write capture")
+
+
+    def stats(self):
+        return {
+            "buffered": self.buffered,
+            "written": self.written,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "file": self.files.path(self.files.index),
+        }
+
+
+    def close(self):
+        if self.loop.running:
+            self.loop.stop()
+        self.flush()
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+        self.files.close()
+
+
+def readCapture(path):
+    """
+    Yield (timestamp, datagram, source address) for each packet in a capture
+    """
+    reader = RawPcapReader(path)
+    try:
+        for data, meta in reader:
+            seconds, microseconds = meta[0], meta[1]
+            timestamp = seconds + microseconds / 1e6
+            if reader.linktype == LINKTYPE_RAW:
+                ihl = (ord(data[0]) & 0x0f) * 4
+                if ord(data[9]) != IPPROTO_UDP:
+                    continue
+                host = ".".join(str(ord(b)) for b in data[12:16])
+                port, = struct.unpack("!H", data[ihl:ihl + 2])
+                yield timestamp, data[ihl + 8:], (host, port)
+            else:
+                yield timestamp, data, UNKNOWN_SOURCE
+    finally:
+        reader.close()
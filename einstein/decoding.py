@@ -0,0 +1,258 @@
+"""
+Decoding of action results (in practice, poll replies), inline or off the reactor thread
+
+    INLINE   on the reactor thread, as each arrives
+    THREAD   on a pool of threads (which keeps the reactor responsive, though Scapy still holds the GIL)
+    PROCESS  on a pool of processes, which are sent the datagrams' bytes and return plain tuples
+
+Whichever's used, results are handed back on the reactor thread, and in the order each monitor's datagrams arrived in.
+A datagram that can't be decoded (or whose decoding takes longer than timeout, e.g. because a pool process died)
+is handed back as None, so those after it aren't held back.
+
+A pool is handed no more datagrams than it has workers, so each one's timeout starts as a worker takes it;
+the rest wait, up to max_queued, beyond which they're dropped (and handed back as None straight away).
+"""
+
+import collections
+import multiprocessing
+
+from twisted.internet import defer, reactor
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+import structlog
+
+import intellivue as packets
+
+log = structlog.get_logger()
+
+
+INLINE = "inline"
+THREAD = "thread"
+PROCESS = "process"
+BACKENDS = (INLINE, THREAD, PROCESS)
+
+DEFAULT_THREADS = 4
+DEFAULT_TIMEOUT = 5  # Seconds for a pool to decode a datagram
+DEFAULT_MAX_QUEUED = 1024  # Datagrams submitted to a pool and not yet decoded, beyond which they're dropped
+
+
+def decodeActionResult(data):
+    """
+    (ro_type, invoke_id, linked state, linked count, numerics) for an action result,
+    where numerics are (physio_id, state, unit_code, value) tuples, or None if it isn't a poll reply;
+    or None if it isn't a remote operation at all
+    """
+    ids = packets.remoteOperationIds(data)
+    if ids is None:
+        return None
+
+    try:
+        numerics = packets.decodePollReplyExtNumerics(data)
+    except ValueError:
+        log.warning("Could not decode poll reply, falling back to full dissection", exc_info=True)
+        numerics = None
+
+    if numerics is None:
+        message = packets.dissectLazily(packets.SPpdu, data)
+        if packets.PollInfoList in message:
+            numerics = packets.pollReplyNumerics(message)
+
+    return ids + (numerics,)
+
+
+def _decodeSafely(data):
+    # Exceptions in a multiprocessing.Pool are only raised by AsyncResult.get, so they're returned instead
+    try:
+        return True, decodeActionResult(data)
+    except Exception as e:
+        return False, "%s: %s" % (type(e).__name__, e)
+
+
+class DecodeError(Exception):
+    pass
+
+
+def makeDecoder(backend, workers=None, timeout=DEFAULT_TIMEOUT, max_queued=DEFAULT_MAX_QUEUED, clock=reactor):
+    if backend == INLINE:
+        return InlineDecoder(clock=clock)
+    if backend == THREAD:
+        return ThreadDecoder(threads=workers or DEFAULT_THREADS, timeout=timeout, max_queued=max_queued, clock=clock)
+    if backend == PROCESS:
+        return ProcessDecoder(processes=workers, timeout=timeout, max_queued=max_queued, clock=clock)
+    raise ValueError("Unknown decoding backend %r" % (backend,))
+
+
+class InlineDecoder(object):
+
+    backend = INLINE
+
+    def __init__(self, clock=reactor):
+        self.clock = clock
+        self.decoded = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+
+    def submit(self, host, data, callback):
+        """
+        Decode data (from host), and call callback(host, decoded), where decoded is None if it couldn't be decoded
+        """
+        start = self.clock.seconds()
+        decoded = decodeActionResult(data)
+        self.record(start)
+        callback(host, decoded)
+
+
+    def record(self, start):
+        latency = self.clock.seconds() - start
+        self.decoded += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+
+
+    def stats(self):
+        return {
+            "backend": self.backend,
+            "decoded": self.decoded,
+            "latency_mean": self.latency_total / self.decoded if self.decoded else None,
+            "latency_max": self.latency_max,
+        }
+
+
+    def close(self):
+        pass
+
+
+class PoolDecoder(InlineDecoder):
+    """
+    Decodes elsewhere, holding each monitor's results back until those before them are ready.
+
+    decode(data) returns a Deferred firing (on the reactor thread) with decodeActionResult(data);
+    it's called for no more than workers datagrams at once.
+    clock must be a reactor (its callFromThread is used too).
+    """
+
+    PENDING = object()
+
+    def __init__(self, decode, workers, timeout=DEFAULT_TIMEOUT, max_queued=DEFAULT_MAX_QUEUED, clock=reactor):
+        InlineDecoder.__init__(self, clock)
+        self.decode = decode
+        self.workers = workers
+        self.timeout = timeout
+        self.max_queued = max_queued
+        self.queues = {}  # Mapping of host -> deque of [decoded (or PENDING), callback]
+        self.waiting = collections.deque()  # (host, data, entry, submission time), not yet handed to decode
+        self.decoding = 0  # Handed to decode, and not yet decoded
+        self.queued = 0  # Submitted, and not yet decoded
+        self.failed = 0
+        self.dropped = 0
+
+
+    def submit(self, host, data, callback):
+        if self.queued >= self.max_queued:
+            self.dropped += 1
+            log.warning("Decoding queue full, dropping action result", host=host)
+            callback(host, None)
+            return
+
+        entry = [self.PENDING, callback]
+        self.queues.setdefault(host, collections.deque()).append(entry)
+        self.queued += 1
+        self.waiting.append((host, data, entry, self.clock.seconds()))
+        self._next()
+
+
+    def _next(self):
+        """
+        Hand waiting datagrams to decode while there are workers free, each timed from then
+        """
+        while self.waiting and self.decoding < self.workers:
+            host, data, entry, start = self.waiting.popleft()
+            self.decoding += 1
+            d = self.decode(data)
+            d.addTimeout(self.timeout, self.clock)
+            d.addErrback(self._failed, host)
+            d.addCallback(self._decoded, host, entry, start)
+
+
+    def _failed(self, f, host):
+        self.failed += 1
+        log.error("Could not decode action result", host=host, error=f.getErrorMessage())
+        return None
+
+
+    def _decoded(self, decoded, host, entry, start):
+        self.decoding -= 1
+        self.queued -= 1
+        self.record(start)
+        entry[0] = decoded
+
+        queue = self.queues[host]
+        while queue and queue[0][0] is not self.PENDING:
+            decoded, callback = queue.popleft()
+            try:
+                callback(host, decoded)
+            except Exception:
+                log.exception("Could not handle decoded action result", host=host)
+        if not queue:
+            del self.queues[host]
+        self._next()
+
+
+    def stats(self):
+        stats = InlineDecoder.stats(self)
+        stats.update({
+            "queued": self.queued,
+            "reordering": sum(len(queue) for queue in self.queues.values()) - self.queued,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        })
+        return stats
+
+
+class ThreadDecoder(PoolDecoder):
+
+    backend = THREAD
+
+    def __init__(self, threads=DEFAULT_THREADS, timeout=DEFAULT_TIMEOUT, max_queued=DEFAULT_MAX_QUEUED, clock=reactor):
+        PoolDecoder.__init__(self, self._decodeInThread, threads, timeout, max_queued, clock)
+        self.threadpool = ThreadPool(minthreads=1, maxthreads=threads, name="decoding")
+        self.threadpool.start()
+
+
+    def _decodeInThread(self, data):
+        return deferToThreadPool(self.clock, self.threadpool, decodeActionResult, data)
+
+
+    def close(self):
+        self.threadpool.stop()
+
+
+class ProcessDecoder(PoolDecoder):
+
+    backend = PROCESS
+
+    def __init__(self, processes=None, timeout=DEFAULT_TIMEOUT, max_queued=DEFAULT_MAX_QUEUED, clock=reactor):
+        PoolDecoder.__init__(self, self._decodeInProcess, processes or multiprocessing.cpu_count(), timeout, max_queued, clock)
+        self.pool = multiprocessing.Pool(processes)
+
+
+    def _decodeInProcess(self, data):
+        d = defer.Deferred()
+        self.pool.apply_async(_decodeSafely, (data,), callback=lambda result: self.clock.callFromThread(self._result, d, result))
+        return d
+
+
+    def _result(self, d, result):
+        if d.called:
+            return  # Timed out
+        ok, decoded = result
+        if ok:
+            d.callback(decoded)
+        else:
+            d.errback(DecodeError(decoded))
+
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
@@ -0,0 +1,242 @@
+"""
+Webhook delivery
+
+Deliveries share a persistent connection pool, are limited per destination,
+time out, and queue (boundedly) per subscription,
+so a slow receiver can't make requests (and memory) pile up without limit.
+"""
+
+from collections import deque
+import urlparse
+
+from twisted.internet import defer, reactor
+from twisted.web.client import Agent, HTTPConnectionPool
+import structlog
+import treq
+from treq.client import HTTPClient
+
+import serialize
+
+log = structlog.get_logger()
+
+
+DROP_OLDEST = "drop_oldest"  # Discard the oldest queued delivery to make room
+DROP_NEWEST = "drop_newest"  # Discard the new delivery
+COALESCE = "coalesce"  # Replace the newest queued delivery with the new one
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, COALESCE)
+
+DEFAULT_BATCH_DELAY = 10  # Seconds, for batches that only set a batch_size
+
+
+class SubscriptionQueue(object):
+    """
+    Deliveries waiting for one subscription.
+    At most one is in flight at a time, so a subscriber receives them in order.
+    """
+
+    def __init__(self, maxlen, overflow):
+        self.pending = deque()
+        self.maxlen = maxlen
+        self.overflow = overflow
+        self.busy = False
+
+
+    def put(self, delivery):
+        """
+        Queue a delivery, applying the overflow policy if the queue is full.
+        Returns whether a delivery was dropped.
+        """
+        if len(self.pending) < self.maxlen:
+            self.pending.append(delivery)
+            return False
+
+        if self.overflow == DROP_OLDEST:
+            self.pending.popleft()
+            self.pending.append(delivery)
+        elif self.overflow == COALESCE:
+            self.pending[-1] = delivery
+        return True
+
+
+class WebhookDelivery(object):
+
+    def __init__(self, clock=reactor, client=None, max_queue=16, overflow=DROP_OLDEST, max_per_destination=4, timeout=10):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy %r" % (overflow,))
+        if max_queue < 1:
+            raise ValueError("max_queue must be at least 1, not %r" % (max_queue,))
+
+        self.clock = clock
+        self.pool = None
+        if client is None:
+            self.pool = HTTPConnectionPool(clock, persistent=True)
+            self.pool.maxPersistentPerHost = max_per_destination
+            client = HTTPClient(Agent(clock, pool=self.pool))
+        self.client = client
+
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.max_per_destination = max_per_destination
+        self.timeout = timeout
+
+        self.queues = {}  # Mapping of SubscriptionId -> SubscriptionQueue, for subscriptions with deliveries queued or in flight
+        self.destinations = {}  # Mapping of (scheme, netloc) -> DeferredSemaphore
+
+        self.delivered = 0
+        self.failed = 0
+        self.dropped = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+
+    def deliver(self, subscription, body, headers=None):
+        queue = self.queues.get(subscription.subscription_id)
+        if queue is None:
+            queue = self.queues[subscription.subscription_id] = SubscriptionQueue(self.max_queue, self.overflow)
+
+        if queue.put((subscription.url, body, headers, self.clock.seconds())):
+            self.dropped += 1
+            log.warning("Webhook queue full, dropping a delivery", subscription_id=subscription.subscription_id, overflow=self.overflow)
+
+        self._drain(subscription.subscription_id, queue)
+
+
+    def _drain(self, subscription_id, queue):
+        if queue.busy:
+            return
+        if not queue.pending:
+            del self.queues[subscription_id]
+            return
+
+        queue.busy = True
+        url, body, headers, queued_at = queue.pending.popleft()
+
+        d = self._destination(url).run(self._post, url, body, headers)
+
+        def delivered(code):
+            if code >= 400:
+                self.failed += 1
+                log.warning("Webhook rejected", subscription_id=subscription_id, url=url, code=code)
+            else:
+                self.delivered += 1
+                latency = self.clock.seconds() - queued_at
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+
+        def failed(failure):
+            self.failed += 1
+            log.warning("Webhook delivery failed", subscription_id=subscription_id, url=url, error=failure.getErrorMessage())
+
+        def done(_):
+            queue.busy = False
+            self._drain(subscription_id, queue)
+
+        d.addCallbacks(delivered, failed)
+        d.addBoth(done)
+
+
+    def _post(self, url, body, headers):
+        d = self.client.post(url, data=body, headers=headers, timeout=self.timeout, reactor=self.clock)
+
+        def consumed(response):
+            # Reading the body lets the connection go back to the pool
+            return treq.content(response).addCallback(lambda _: response.code)
+
+        # treq's timeout only covers the response headers; a body that never arrives mustn't hold the delivery's slots forever
+        return d.addCallback(consumed).addTimeout(self.timeout, self.clock)
+
+
+    def _destination(self, url):
+        parsed = urlparse.urlsplit(url)
+        key = (parsed.scheme, parsed.netloc)
+        semaphore = self.destinations.get(key)
+        if semaphore is None:
+            semaphore = self.destinations[key] = defer.DeferredSemaphore(self.max_per_destination)
+        return semaphore
+
+
+    def stats(self):
+        return {
+            "queued": sum(len(q.pending) for q in self.queues.values()),
+            "in_flight": sum(1 for q in self.queues.values() if q.busy),
+            "queue_depths": dict((subscription_id, len(q.pending)) for (subscription_id, q) in self.queues.items()),
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "latency_mean": self.latency_total / self.delivered if self.delivered else None,
+            "latency_max": self.latency_max,
+        }
+
+
+    def close(self):
+        if self.pool is not None:
+            return self.pool.closeCachedConnections()
+        return defer.succeed(None)
+
+
+class Batch(object):
+
+    def __init__(self, subscription, timer):
+        self.subscription = subscription
+        self.timer = timer
+        self.bodies = []
+
+
+class WebhookBatches(object):
+    """
+    Gathers serialised Payloads for batching subscriptions,
+    delivering them together (as a JSON array) once there are batch_size of them,
+    or batch_delay seconds after the first, whichever comes first.
+    A subscription's batch is dropped when it's removed (so observe the registry with it).
+    """
+
+    def __init__(self, webhooks, clock=reactor):
+        self.webhooks = webhooks
+        self.clock = clock
+        self.batches = {}  # Mapping of SubscriptionId -> Batch, for batches with Payloads waiting
+
+
+    def add(self, subscription, body):
+        batch = self.batches.get(subscription.subscription_id)
+        if batch is None:
+            delay = subscription.batch_delay if subscription.batch_delay is not None else DEFAULT_BATCH_DELAY
+            timer = self.clock.callLater(delay, self.flush, subscription.subscription_id)
+            batch = self.batches[subscription.subscription_id] = Batch(subscription, timer)
+
+        batch.bodies.append(body)
+        if subscription.batch_size is not None and len(batch.bodies) >= subscription.batch_size:
+            self.flush(subscription.subscription_id)
+
+
+    def flush(self, subscription_id):
+        batch = self.batches.pop(subscription_id, None)
+        if batch is None:
+            return
+        if batch.timer.active():
+            batch.timer.cancel()
+
+        body, headers = serialize.batchEncoded(batch.bodies, batch.subscription.content_encoding)
+        self.webhooks.deliver(batch.subscription, body, headers=headers)
+
+
+    def flushAll(self):
+        for subscription_id in self.batches.keys():
+            self.flush(subscription_id)
+
+
+    def subscriptionAdded(self, subscription):
+        pass
+
+
+    def subscriptionRemoved(self, subscription):
+        # Its waiting Payloads go with it
+        batch = self.batches.pop(subscription.subscription_id, None)
+        if batch is not None and batch.timer.active():
+            batch.timer.cancel()
+
+
+    def stats(self):
+        return {
+            "batches": len(self.batches),
+            "payloads": sum(len(batch.bodies) for batch in self.batches.values()),
+        }
@@ -0,0 +1,273 @@
+"""
+Which monitors' data is wanted, so that only those are polled at the full rate
+
+A monitor's data is wanted if a subscription or a stream is following it (or all monitors),
+or if everything's being retained (in the observation log). The rest are still polled, every idle_interval,
+to keep their associations alive (and the in-memory history of them roughly current).
+
+The subscriptions and streams are observed, so each monitor's poll rate follows them as they're added and removed.
+
+Where every subscription to a monitor wants only particular physio_ids (and nothing else wants all of them),
+its numerics priority list can be set to just those, so that it leaves the rest out of its poll replies;
+see PriorityLists.
+"""
+
+from twisted.internet import reactor
+import structlog
+
+import observation_log
+
+log = structlog.get_logger()
+
+
+class PollDemand(object):
+
+    def __init__(self, scheduler, subscriptions, streams, host_to_mac, retained=False):
+        self.scheduler = scheduler
+        self.subscriptions = subscriptions
+        self.streams = streams
+        self.host_to_mac = host_to_mac  # The IntellivueInterface's, kept up to date by it
+        self.retained = retained
+
+        self.changes = 0
+
+        self.subscriptions.observe(self)
+        self.streams.observe(self)
+
+
+    def wanted(self, host):
+        if self.retained:
+            return True
+        mac = self.host_to_mac.get(host)
+        if mac is None:
+            return True  # Can't tell, so don't hold back
+        return bool(self.subscriptions.forMonitor(mac) or self.streams.following(mac))
+
+
+    def refresh(self):
+        """
+        Poll each monitor according to whether it's wanted now
+        """
+        self.changes += 1
+        for host in self.scheduler.targets.keys():
+            self.scheduler.setWanted(host, self.wanted(host))
+
+
+    def subscriptionAdded(self, subscription):
+        self.refresh()
+
+
+    def subscriptionRemoved(self, subscription):
+        self.refresh()
+
+
+    def followersChanged(self):
+        self.refresh()
+
+
+    def stats(self):
+        wanted = sum(1 for target in self.scheduler.targets.values() if target.wanted)
+        return {
+            "retained": self.retained,
+            "wanted": wanted,
+            "idle": len(self.scheduler.targets) - wanted,
+            "changes": self.changes,
+        }
+
+
+DEFAULT_PRIORITY_LIST_TIMEOUT = 10  # Seconds to wait for a priority list Get or Set to be answered
+PRIORITY_LIST_ATTEMPTS = 3  # Unanswered Gets or Sets before giving up on a monitor's priority list
+
+
+class PriorityLists(object):
+    """
+    Keeps each connected monitor's numerics priority list (which needs POLL_EXT_NU_PRIO_LIST on association)
+    to the union of the physio_ids its subscriptions want, or to the monitor's own list when anything wants them all.
+
+    The monitor's own list is read (with a Get) when it connects, and restored when nothing is restricted.
+    Monitors that refuse a Get or Set, or don't answer, are left alone.
+
+    Only subscriptions, streams and the observation log count: the in-memory history and aggregates don't,
+    as they've no followers to ask, only queries. So while a monitor's list is restricted,
+    they only have the physio_ids on it, and /observations and /aggregates queries for the rest come back empty.
+
+    What's sent is up to the handler (the IntellivueInterface), which returns the request's invoke_id (or None if it couldn't send it):
+        handler.getPriorityList(host), handler.setPriorityList(host, physio_ids)
+    """
+
+    GET = None  # What a request is for, in place of the physio_ids set
+
+    def __init__(self, subscriptions, streams, host_to_mac, retained=False, clock=reactor, timeout=DEFAULT_PRIORITY_LIST_TIMEOUT, handler=None):
+        self.subscriptions = subscriptions
+        self.streams = streams
+        self.host_to_mac = host_to_mac
+        self.retained = retained
+        self.clock = clock
+        self.timeout = timeout
+        self.handler = handler
+
+        self.hosts = set()  # Connected monitors
+        self.defaults = {}  # Mapping of host -> frozenset of the physio_ids in its own list
+        self.current = {}  # Mapping of host -> frozenset of the physio_ids in its list now
+        self.requests = {}  # Mapping of host -> (invoke_id, physio_ids set or GET, timeout's DelayedCall)
+        self.attempts = {}  # Mapping of host -> unanswered requests
+        self.unsupported = set()
+
+        self.gets = 0
+        self.sets = 0
+        self.failures = 0
+
+        self.subscriptions.observe(self)
+        self.streams.observe(self)
+
+
+    def wanted(self, host):
+        """
+        The physio_ids that host's subscriptions want (as a frozenset), or None if they, or anything else, want them all
+        """
+        mac = self.host_to_mac.get(host)
+        if self.retained or mac is None or self.streams.following(mac):
+            return None
+
+        subscriptions = self.subscriptions.forMonitor(mac)
+        if not subscriptions:
+            return None  # Nothing to restrict it to
+        physio_ids = set()
+        for subscription in subscriptions:
+            if subscription.physio_ids is None:
+                return None
+            try:
+                physio_ids.update(observation_log.identifierCode(physio_id) for physio_id in subscription.physio_ids)
+            except ValueError:
+                return None  # A label we can't put on the list
+        return frozenset(physio_ids)
+
+
+    def connected(self, host):
+        self.hosts.add(host)
+        self.refresh(host)
+
+
+    def forget(self, host):
+        self.hosts.discard(host)
+        request = self.requests.pop(host, None)
+        if request is not None and request[2].active():
+            request[2].cancel()
+        for state in (self.defaults, self.current, self.attempts):
+            state.pop(host, None)
+        self.unsupported.discard(host)
+
+
+    def refresh(self, host):
+        """
+        Bring host's priority list up to date, unless a request to it is already outstanding
+        """
+        if host not in self.hosts or host in self.unsupported or host in self.requests:
+            return
+
+        if host not in self.defaults:
+            self._send(host, self.GET, self.handler.getPriorityList(host))
+            return
+
+        physio_ids = self.wanted(host)
+        if physio_ids is None:
+            physio_ids = self.defaults[host]
+        if physio_ids != self.current[host]:
+            log.info("Setting numerics priority list", host=host, physio_ids=sorted(physio_ids))
+            self._send(host, physio_ids, self.handler.setPriorityList(host, sorted(physio_ids)))
+
+
+    def _send(self, host, physio_ids, invoke_id):
+        if invoke_id is None:
+            return  # Tried again on the next refresh
+        if physio_ids is self.GET:
+            self.gets += 1
+        else:
+            self.sets += 1
+        call = self.clock.callLater(self.timeout, self._timedOut, host, invoke_id)
+        self.requests[host] = (invoke_id, physio_ids, call)
+
+
+    def _pop(self, host, invoke_id):
+        request = self.requests.get(host)
+        if request is None or request[0] != invoke_id:
+            return None
+        del self.requests[host]
+        if request[2].active():
+            request[2].cancel()
+        return request
+
+
+    def received(self, host, invoke_id, physio_ids):
+        """
+        A GetResult or SetResult, with the priority list it gave (if it did)
+        """
+        request = self._pop(host, invoke_id)
+        if request is None:
+            return
+        self.attempts.pop(host, None)
+
+        _, requested, _ = request
+        if requested is self.GET:
+            if physio_ids is None:
+                self._giveUp(host, "No priority list in GetResult")
+                return
+            self.defaults[host] = self.current[host] = frozenset(physio_ids)
+        else:
+            if physio_ids is not None and frozenset(physio_ids) != requested:
+                log.warning("Monitor changed the priority list it was set to", host=host, requested=sorted(requested), physio_ids=sorted(physio_ids))
+            self.current[host] = requested  # Not what the monitor made of it, so as not to set it again and again
+        self.refresh(host)  # In case what's wanted changed in the meantime
+
+
+    def failed(self, host, invoke_id):
+        if self._pop(host, invoke_id) is not None:
+            self._giveUp(host, "Priority list request refused")
+
+
+    def _timedOut(self, host, invoke_id):
+        del self.requests[host]
+        self.attempts[host] = self.attempts.get(host, 0) + 1
+        if self.attempts[host] >= PRIORITY_LIST_ATTEMPTS:
+            self._giveUp(host, "Priority list requests unanswered")
+        else:
+            self.refresh(host)
+
+
+    def _giveUp(self, host, reason):
+        log.warning(reason + ", leaving it alone", host=host)
+        self.failures += 1
+        self.unsupported.add(host)
+
+
+    def refreshAll(self):
+        for host in list(self.hosts):
+            self.refresh(host)
+
+
+    def subscriptionAdded(self, subscription):
+        self.refreshAll()
+
+
+    def subscriptionRemoved(self, subscription):
+        self.refreshAll()
+
+
+    def followersChanged(self):
+        self.refreshAll()
+
+
+    def stop(self):
+        for host in list(self.hosts):
+            self.forget(host)
+
+
+    def stats(self):
+        return {
+            "monitors": len(self.hosts),
+            "restricted": sum(1 for host in self.current if self.current[host] != self.defaults.get(host)),
+            "unsupported": len(self.unsupported),
+            "gets": self.gets,
+            "sets": self.sets,
+            "failures": self.failures,
+        }
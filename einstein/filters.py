@@ -0,0 +1,89 @@
+"""
+Per-subscription observation filters, evaluated before anything is serialised
+
+physio_ids: only deliver these physio_ids
+changed_only: only deliver an observation if its value or state has changed since it was last delivered
+deadbands: a mapping of physio_id -> threshold; only deliver those physio_ids' observations
+    once their value has moved by more than the threshold since it was last delivered
+max_interval: deliver an observation that changed_only or deadbands would hold back anyway,
+    if it hasn't been delivered for this many seconds
+"""
+
+import math
+
+
+def isStateful(subscription):
+    return bool(subscription.changed_only or subscription.deadbands)
+
+
+class ObservationFilters(object):
+    """
+    Selects which of a Payload's observations to deliver to each subscription,
+    remembering what was last delivered to those that need it.
+
+    Observes a subscriptions.SubscriptionRegistry, to forget subscriptions once they're removed.
+    """
+
+    def __init__(self):
+        self.last_sent = {}  # Mapping of SubscriptionId -> {(monitor_id, physio_id) -> (state, value, time)}
+
+
+    def select(self, subscription, monitor_id, observations, now):
+        """
+        The indices (as a tuple) of the observations to deliver to subscription,
+        or None to deliver them all
+        """
+        if subscription.physio_ids is None and not isStateful(subscription):
+            return None
+
+        wanted = subscription.physio_ids
+        if wanted is not None:
+            wanted = set(wanted)
+
+        if not isStateful(subscription):
+            selected = [i for (i, observation) in enumerate(observations) if observation.physio_id in wanted]
+            return None if len(selected) == len(observations) else tuple(selected)
+
+        last_sent = self.last_sent.setdefault(subscription.subscription_id, {})
+        deadbands = subscription.deadbands or {}
+        selected = []
+        for i, observation in enumerate(observations):
+            if wanted is not None and observation.physio_id not in wanted:
+                continue
+
+            key = (monitor_id, observation.physio_id)
+            last = last_sent.get(key)
+            if last is None or _due(subscription, deadbands.get(observation.physio_id), last, observation, now):
+                last_sent[key] = (observation.state, observation.value, now)
+                selected.append(i)
+
+        if len(selected) == len(observations):
+            return None
+        return tuple(selected)
+
+
+    def subscriptionAdded(self, subscription):
+        self.last_sent.pop(subscription.subscription_id, None)
+
+
+    def subscriptionRemoved(self, subscription):
+        self.last_sent.pop(subscription.subscription_id, None)
+
+
+def _due(subscription, deadband, last, observation, now):
+    state, value, time = last
+
+    if subscription.max_interval is not None and now - time >= subscription.max_interval:
+        return True
+
+    if deadband is not None:
+        return _moved(value, observation.value, deadband)
+    elif subscription.changed_only:
+        return state != observation.state or _moved(value, observation.value, 0)
+    return True
+
+
+def _moved(last, value, threshold):
+    if math.isnan(last) or math.isnan(value):
+        return math.isnan(last) != math.isnan(value)
+    return abs(value - last) > threshold
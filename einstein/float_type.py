@@ -6,30 +6,55 @@ These functions handle this encoding.
 Note that the exponent is decimal, so there should be none of the common
 binary/decimal representation issues that IEEE-754 has.
 
+decode and encode work on a single value,
+decode_many and encode_many on whole NumPy arrays (or buffers of wire-format values) at once.
+
 PIPG-40
 """
 
 import math
 
+import numpy
+
+
+# Special values key on the mantissa
+NAN = 0x7fffff
+NRES = 0x800000  # "Not at this resolution"
+POSITIVE_INFINITY = 0x7ffffe
+NEGATIVE_INFINITY = 0x800002
+
+MANTISSA_MAX = 0x7ffffd  # The largest magnitude (of either sign) that isn't a special value
+LOG10_MANTISSA_MAX = math.log10(MANTISSA_MAX)
+EXPONENT_MIN = -128
+EXPONENT_MAX = 127
+
+WIRE_DTYPE = numpy.dtype(">u4")
+
+# Scaling by a power of ten (rather than e.g. multiplying by 0.1) keeps results correctly rounded.
+# Powers up to 10 ** 22 are exact as floats; beyond that the table is shared
+# so that the scalar and vectorised functions still agree.
+POWERS_OF_TEN = [float(10 ** k) for k in xrange(EXPONENT_MAX + 3)]
+POWERS_OF_TEN_ARRAY = numpy.array(POWERS_OF_TEN)
+
 
 def count_hex_digits(num):
     return int(math.ceil(math.log(num + 1) / math.log(16)))
 
 
 def decode(encoded):
-    if count_hex_digits(encoded) > 8:
+    if encoded >> 32:  # More than 8 hex digits
         raise ValueError
 
     mantissa = encoded & 0x00FFFFFF
 
     # Special cases key on mantissa
-    if mantissa == 0x7fffff:
+    if mantissa == NAN:
         return float("NaN")
-    elif mantissa == 0x800000:
+    elif mantissa == NRES:
         return float("NaN") # TODO Need an encoding for NRes ("Not at this resolution")
-    elif mantissa == 0x7ffffe:
+    elif mantissa == POSITIVE_INFINITY:
         return float("Inf")
-    elif mantissa == 0x800002:
+    elif mantissa == NEGATIVE_INFINITY:
         return float("-Inf")
 
     if mantissa >> 23 == 1:  # Is the most significant (i.e. sign) bit set)
@@ -39,7 +64,128 @@ def decode(encoded):
     if exponent >> 7 == 1:  # Is the most significant (i.e. sign) bit set)
         exponent = exponent - 0xFF - 1
 
+    if exponent < 0:
+        return mantissa / POWERS_OF_TEN[-exponent]
     return mantissa * (10 ** exponent)
 
+
 def encode(num):
-    raise NotImplementedError
+    """
+    Encode num with as few significant digits as represent it (to the precision of a 24-bit mantissa).
+
+    Values too large to represent are encoded as infinities.
+    """
+    if math.isnan(num):
+        return NAN
+    elif math.isinf(num):
+        return POSITIVE_INFINITY if num > 0 else NEGATIVE_INFINITY
+    elif num == 0:
+        return 0
+
+    exponent = min(max(int(math.ceil(math.log10(abs(num)) - LOG10_MANTISSA_MAX)), EXPONENT_MIN), EXPONENT_MAX + 1)
+    mantissa = int(numpy.rint(_scale(num, -exponent)))
+    if abs(mantissa) > MANTISSA_MAX:  # Either log10 was a little out, or rounding carried into another digit
+        exponent += 1
+        mantissa = int(numpy.rint(_scale(num, -exponent)))
+
+    if mantissa == 0:
+        return 0
+    elif exponent > EXPONENT_MAX:
+        return POSITIVE_INFINITY if num > 0 else NEGATIVE_INFINITY
+
+    while mantissa % 10 == 0 and exponent < EXPONENT_MAX:
+        mantissa //= 10
+        exponent += 1
+
+    return ((exponent & 0xFF) << 24) | (mantissa & 0xFFFFFF)
+
+
+def _scale(num, exponent):
+    if exponent < 0:
+        return num / POWERS_OF_TEN[-exponent]
+    return num * POWERS_OF_TEN[exponent]
+
+
+def decode_many(encoded, masks=False):
+    """
+    Decode an array of encoded values (or a buffer of big-endian wire-format values) into float64s.
+
+    As with decode, NaN and NRes both decode to NaN.
+    If masks is True, also return a dict of boolean arrays,
+    marking where each of "nan", "nres", "inf" and "-inf" occurred.
+    """
+    encoded = _as_encoded_array(encoded)
+
+    unsigned_mantissa = (encoded & 0x00FFFFFF).astype(numpy.int32)
+    mantissa = numpy.where(unsigned_mantissa >> 23 == 1, unsigned_mantissa - 0xFFFFFF - 1, unsigned_mantissa)
+    exponent = (encoded >> 24).astype(numpy.uint8).view(numpy.int8)
+
+    values = _scale_many(mantissa.astype(numpy.float64), exponent.astype(numpy.int16))
+
+    special = {
+        "nan": unsigned_mantissa == NAN,
+        "nres": unsigned_mantissa == NRES,
+        "inf": unsigned_mantissa == POSITIVE_INFINITY,
+        "-inf": unsigned_mantissa == NEGATIVE_INFINITY,
+    }
+    values[special["nan"] | special["nres"]] = numpy.nan
+    values[special["inf"]] = numpy.inf
+    values[special["-inf"]] = -numpy.inf
+
+    if masks:
+        return values, special
+    return values
+
+
+def encode_many(values):
+    """
+    Encode an array of numbers into an array of (native uint32) encoded values, exactly as encode would.
+
+    Use .astype(WIRE_DTYPE) to get wire-format values.
+    """
+    values = numpy.asarray(values, dtype=numpy.float64)
+    encoded = numpy.zeros(values.shape, dtype=numpy.uint32)
+
+    encoded[numpy.isnan(values)] = NAN
+    encoded[values == numpy.inf] = POSITIVE_INFINITY
+    encoded[values == -numpy.inf] = NEGATIVE_INFINITY
+
+    finite = numpy.isfinite(values) & (values != 0)
+    num = values[finite]
+
+    exponent = numpy.ceil(numpy.log10(numpy.abs(num)) - LOG10_MANTISSA_MAX).astype(numpy.int64)
+    exponent = numpy.clip(exponent, EXPONENT_MIN, EXPONENT_MAX + 1)
+    mantissa = numpy.rint(_scale_many(num, -exponent))
+    carried = numpy.abs(mantissa) > MANTISSA_MAX
+    exponent[carried] += 1
+    mantissa[carried] = numpy.rint(_scale_many(num[carried], -exponent[carried]))
+    mantissa = mantissa.astype(numpy.int64)
+
+    while True:
+        trailing_zero = (mantissa != 0) & (mantissa % 10 == 0) & (exponent < EXPONENT_MAX)
+        if not trailing_zero.any():
+            break
+        mantissa[trailing_zero] //= 10
+        exponent[trailing_zero] += 1
+
+    words = ((exponent & 0xFF) << 24) | (mantissa & 0xFFFFFF)
+    words[mantissa == 0] = 0
+    overflow = (exponent > EXPONENT_MAX) & (mantissa != 0)
+    words[overflow] = numpy.where(num[overflow] > 0, POSITIVE_INFINITY, NEGATIVE_INFINITY)
+
+    encoded[finite] = words
+    return encoded
+
+
+def _scale_many(num, exponent):
+    scaled = num.copy()
+    negative = exponent < 0
+    scaled[negative] /= POWERS_OF_TEN_ARRAY[-exponent[negative]]
+    scaled[~negative] *= POWERS_OF_TEN_ARRAY[exponent[~negative]]
+    return scaled
+
+
+def _as_encoded_array(encoded):
+    if isinstance(encoded, (str, bytearray, buffer, memoryview)):
+        return numpy.frombuffer(encoded, dtype=WIRE_DTYPE).astype(numpy.uint32)
+    return numpy.asarray(encoded, dtype=numpy.uint32)
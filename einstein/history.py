@@ -0,0 +1,139 @@
+"""
+Recent observation history, kept in memory
+
+For each (monitor, physio_id), a fixed-capacity ring buffer of (time, value) pairs,
+held in NumPy arrays (16 bytes a point) rather than as api.Observations.
+Times are seconds since the epoch, as from reactor.seconds().
+"""
+
+import numpy
+
+
+DEFAULT_CAPACITY = 3600  # Two hours of points, at one per 2 s poll
+INITIAL_CAPACITY = 64  # Buffers grow (by doubling) to their capacity, as points arrive
+
+
+class RingBuffer(object):
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        size = min(INITIAL_CAPACITY, capacity)
+        self.times = numpy.empty(size)
+        self.values = numpy.empty(size)
+        self.start = 0  # Index of the oldest point
+        self.count = 0
+
+
+    def __len__(self):
+        return self.count
+
+
+    def append(self, time, value):
+        if self.count == len(self.times) and self.count < self.capacity:
+            self._grow()
+
+        if self.count:
+            # Queries binary search on time, so keep times in order even if the clock steps backwards
+            time = max(time, self.times[(self.start + self.count - 1) % len(self.times)])
+
+        if self.count < len(self.times):
+            end = (self.start + self.count) % len(self.times)
+            self.count += 1
+        else:
+            end = self.start
+            self.start = (self.start + 1) % len(self.times)
+
+        self.times[end] = time
+        self.values[end] = value
+
+
+    def _grow(self):
+        size = min(len(self.times) * 2, self.capacity)
+        times, values = self.ordered()
+        self.times = numpy.empty(size)
+        self.values = numpy.empty(size)
+        self.times[:self.count] = times
+        self.values[:self.count] = values
+        self.start = 0
+
+
+    def segments(self):
+        """
+        The buffer's points, oldest first, as (at most two) (times, values) array views
+        """
+        end = self.start + self.count
+        if end <= len(self.times):
+            return [(self.times[self.start:end], self.values[self.start:end])]
+        end %= len(self.times)
+        return [
+            (self.times[self.start:], self.values[self.start:]),
+            (self.times[:end], self.values[:end]),
+        ]
+
+
+    def ordered(self):
+        segments = self.segments()
+        if len(segments) == 1:
+            return segments[0]
+        (times, values), (more_times, more_values) = segments
+        return numpy.concatenate((times, more_times)), numpy.concatenate((values, more_values))
+
+
+    def range(self, since=None, until=None):
+        """
+        (times, values) arrays for the points with since <= time <= until
+        """
+        selected_times = []
+        selected_values = []
+        for times, values in self.segments():
+            first = 0 if since is None else numpy.searchsorted(times, since, side="left")
+            last = len(times) if until is None else numpy.searchsorted(times, until, side="right")
+            selected_times.append(times[first:last])
+            selected_values.append(values[first:last])
+        return numpy.concatenate(selected_times), numpy.concatenate(selected_values)
+
+
+class ObservationHistory(object):
+    """
+    Ring buffers for every (monitor, physio_id) seen,
+    shared by IntellivueInterface (which records into it) and the web server (which queries it)
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.buffers = {}  # Mapping of monitor_id -> physio_id -> RingBuffer
+
+
+    def record(self, monitor_id, time, observations):
+        buffers = self.buffers.setdefault(monitor_id, {})
+        for observation in observations:
+            buffer = buffers.get(observation.physio_id)
+            if buffer is None:
+                buffer = buffers[observation.physio_id] = RingBuffer(self.capacity)
+            buffer.append(time, observation.value)
+
+
+    def query(self, monitor_id, physio_ids=None, since=None, until=None):
+        """
+        A mapping of physio_id -> (times, values) arrays, for those of physio_ids (or all) with points in range
+        """
+        buffers = self.buffers.get(monitor_id, {})
+        if physio_ids is None:
+            physio_ids = buffers.keys()
+
+        results = {}
+        for physio_id in physio_ids:
+            buffer = buffers.get(physio_id)
+            if buffer is not None:
+                times, values = buffer.range(since, until)
+                if len(times):
+                    results[physio_id] = (times, values)
+        return results
+
+
+    def stats(self):
+        return {
+            "series": sum(len(buffers) for buffers in self.buffers.values()),
+            "points": sum(len(buffer) for buffers in self.buffers.values() for buffer in buffers.values()),
+            "bytes": sum(buffer.times.nbytes + buffer.values.nbytes for buffers in self.buffers.values() for buffer in buffers.values()),
+        }
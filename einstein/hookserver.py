@@ -4,6 +4,7 @@ Sample/testing webservice for working with Einstein webhooks
 
 from klein import Klein
 import json
+import zlib
 import structlog
 import api
 
@@ -28,7 +29,10 @@ class HookServer(object):
     def hook(self, request):
         logger.info("Got hook!", request=request)
 
-        body = json.load(request.content)
+        body = request.content.read()
+        if request.getHeader("Content-Encoding") == "gzip":
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        body = json.loads(body)
         for observation in body["observations"]:
             o = api.Observation(
                 physio_id=observation["physio_id"],
@@ -12,16 +12,8 @@ from .protocol_command_structure import *
 from .protocol_commands import *
 from .association import *
 from .attribute_data_types import *
-
-PORT_CONNECTION_INDICATION = 24005  # PIPG-279
-PORT_PROTOCOL = 24105  # PIPG-29
-
-
-
-
-# TODO Relocate / flesh these out
-NOM_MOC_VMO_METRIC_NU = 6
-NOM_MOC_VMS_MDS = 33
+from .fast_path import *
+from .templates import *
 
 bind_layers(Nomenclature, ROapdus)
 bind_layers(SPpdu, ROapdus)
@@ -32,9 +24,13 @@ bind_layers(ROapdus, ROLRSapdu, ro_type=ROLRS_APDU)
 bind_layers(ROIVapdu, EventReportArgument, command_type=CMD_EVENT_REPORT)
 bind_layers(ROIVapdu, EventReportArgument, command_type=CMD_CONFIRMED_EVENT_REPORT)
 bind_layers(ROIVapdu, ActionArgument, command_type=CMD_CONFIRMED_ACTION)
+bind_layers(ROIVapdu, GetArgument, command_type=CMD_GET)
+bind_layers(ROIVapdu, SetArgument, command_type=CMD_CONFIRMED_SET)
 bind_layers(RORSapdu, EventReportResult, command_type=CMD_CONFIRMED_EVENT_REPORT)
 bind_layers(RORSapdu, ActionResult, command_type=CMD_CONFIRMED_ACTION)
 bind_layers(ROLRSapdu, ActionResult, command_type=CMD_CONFIRMED_ACTION)
+bind_layers(RORSapdu, GetResult, command_type=CMD_GET)
+bind_layers(RORSapdu, SetResult, command_type=CMD_CONFIRMED_SET)
 bind_layers(EventReportArgument, MDSCreateInfo, event_type=NOM_NOTI_MDS_CREAT)
 bind_layers(ActionArgument, PollMdibDataReq, action_type=NOM_ACT_POLL_MDIB_DATA)
 bind_layers(ActionArgument, PollMdibDataReqExt, action_type=NOM_ACT_POLL_MDIB_DATA_EXT)
@@ -46,6 +42,8 @@ bind_layers(AVAType, AbsoluteTime, attribute_id=NOM_ATTR_TIME_STAMP_ABS)
 bind_layers(AVAType, IpAddressInfo, attribute_id=NOM_ATTR_NET_ADDR_INFO)
 bind_layers(AVAType, PollProfileSupport, attribute_id=NOM_POLL_PROFILE_SUPPORT)
 bind_layers(AVAType, PollProfileExt, attribute_id=NOM_ATTR_POLL_PROFILE_EXT)
+bind_layers(AVAType, TextIdList, attribute_id=NOM_ATTR_POLL_NU_PRIO_LIST)
+bind_layers(AVAType, TextIdList, attribute_id=NOM_ATTR_POLL_RTSA_PRIO_LIST)
 
 bind_layers(SessionHeader, AssocReqSessionData, type=CN_SPDU_SI)
 bind_layers(AssocReqSessionData, AssocReqPresentationHeaderHeader)
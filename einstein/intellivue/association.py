@@ -175,6 +175,8 @@ POLL_EXT_ENUM = 0x04000000
 POLL_EXT_NU_PRIO_LIST = 0x02000000
 POLL_EXT_DYN_MODALITIES = 0x01000000
 
+DEFAULT_POLL_OPTIONS = POLL_EXT_PERIOD_NU_1SEC | POLL_EXT_PERIOD_RTSA | POLL_EXT_ENUM
+
 
 PollProfileExtOptionsField = XIntField  # PIPG-71 TODO Use some kind of flag field
 
@@ -197,9 +199,40 @@ class AssocReqPresentationTrailer(Packet):
     ]
 
 
-def makeAssociationRequest():
-    packet = SessionHeader(type=CN_SPDU_SI) / AssocReqSessionData() / AssocReqPresentationHeaderHeader() / AssocReqPresentationHeaderData() / AssocReqUserData() / AssocReqPresentationTrailer()
-    return raw(packet)
+def AssociationRequest(poll_options=DEFAULT_POLL_OPTIONS):
+    """
+    An Association Request advertising support for the Poll Profile, with the given extended poll options
+    """
+    return SessionHeader(type=CN_SPDU_SI) / AssocReqSessionData() / AssocReqPresentationHeaderHeader() / AssocReqPresentationHeaderData() / AssocReqUserData(
+        MDSEUserInfoStd=MDSEUserInfoStd(
+            supported_aprofiles=AttributeList(
+                value=[
+                    AVAType(
+                        attribute_id=NOM_POLL_PROFILE_SUPPORT,
+                    ) /
+                    PollProfileSupport(
+                        optional_packages=AttributeList(
+                            value=[
+                                AVAType(
+                                    attribute_id=NOM_ATTR_POLL_PROFILE_EXT,
+                                ) /
+                                PollProfileExt(
+                                    options=poll_options,
+                                ),
+                            ],
+                        ),
+                    ),
+                ],
+            ),
+        ),
+    ) / AssocReqPresentationTrailer()
+
+
+def makeAssociationRequest(poll_options=DEFAULT_POLL_OPTIONS):
+    """
+    An AssociationRequest's bytes
+    """
+    return raw(AssociationRequest(poll_options))
 
 
 ReleaseRequest = "\x09\x18\xC1\x16\x61\x80\x30\x80\x02\x01\x01\xA0\x80\x62\x80\x80\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00"  # PIPG-301
@@ -43,6 +43,23 @@ ENUM_MEASUREMENT_STATE = {
     MSMT_STATE_AL_INHIBITED: "MSMT_STATE_AL_INHIBITED",
 }
 
+def _measurementStateNames(word):
+    return tuple(name for (flag, name) in sorted(ENUM_MEASUREMENT_STATE.items(), reverse=True) if word & flag)
+
+
+_HIGH_BYTE_STATE_NAMES = [_measurementStateNames(b << 8) for b in xrange(0x100)]
+_LOW_BYTE_STATE_NAMES = [_measurementStateNames(b) for b in xrange(0x100)]
+
+"""
+Every possible MeasurementState word, mapped to (names of the flags set, most significant first; whether the measurement is valid).
+Built once, so decoding a state is a lookup rather than a loop over the flags.
+"""
+MEASUREMENT_STATES = tuple(
+    (_HIGH_BYTE_STATE_NAMES[word >> 8] + _LOW_BYTE_STATE_NAMES[word & 0xff], word < 0x1000)  # PIPG-77, as in measurementIsValid
+    for word in xrange(0x10000)
+)
+
+
 def MeasurementStateField(name, default):  # PIPG-76
     flags = [v for (_, v) in sorted(ENUM_MEASUREMENT_STATE.items())]
     return FlagsField(name, default, 16, flags)
@@ -71,3 +88,25 @@ class IpAddressInfo(Packet):  # PIPG-109
         IPField("ip_address", 0),
         IPField("subnet_mask", 0),
     ]
+
+
+class TextIdList(NonContainerPacket):
+    """
+    The value of a priority list (NOM_ATTR_POLL_NU_PRIO_LIST or NOM_ATTR_POLL_RTSA_PRIO_LIST):
+    the labels of the numerics (or waves) the monitor is to include when polled.
+    A label is a TextId; for a physio_id, that's the physio_id in the SCADA partition (see textId).
+    """
+    name = "TextIdList"
+    fields_desc = [
+        FieldLenField("count", None, count_of="value"),
+        FieldLenField("length", None, length_of="value"),
+        FieldListField("value", [], TextIDField("", 0), count_from=lambda p: p.count),
+    ]
+
+
+def textId(physio_id):
+    return (NOM_PART_SCADA << 16) | physio_id
+
+
+def textIdPhysioId(text_id):
+    return text_id & 0xffff
@@ -4,6 +4,10 @@ Common Data Types - PIPG-36
 
 from scapy.all import *
 
+import contextlib
+import struct
+import threading
+
 import float_type
 
 from .const import *
@@ -109,12 +113,133 @@ class AVAType(Packet):  # PIPG-38
         return p[:self.length], p[self.length:]
 
 
+_lazy = threading.local()
+
+
+@contextlib.contextmanager
+def lazyAttributes(allow=None):
+    """
+    Within this context, AttributeLists are dissected lazily:
+    only each attribute's (attribute_id, offset, length) is recorded,
+    and its AVAType is dissected the first time it's accessed.
+
+    If allow is given, attributes whose ids aren't in it are skipped over by length,
+    and don't appear in AttributeList values at all.
+    This applies to every AttributeList dissected in the context.
+    """
+    previous = getattr(_lazy, "allow", None), getattr(_lazy, "enabled", False)
+    _lazy.allow = frozenset(allow) if allow is not None else None
+    _lazy.enabled = True
+    try:
+        yield
+    finally:
+        _lazy.allow, _lazy.enabled = previous
+
+
+def dissectLazily(cls, data, allow=None):
+    with lazyAttributes(allow):
+        return cls(data)
+
+
+class AttributeValueList(list):
+    """
+    The value of a lazily dissected AttributeList.
+
+    This should be treated as read-only;
+    the packet it came from is rebuilt from the original bytes,
+    not from the (decoded) attributes.
+    """
+
+    def __init__(self, data, entries):
+        list.__init__(self, [None] * len(entries))
+        self.data = data
+        self.entries = entries  # (attribute_id, offset, length) of each attribute's value within data
+
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(len(self)))]
+
+        ava = list.__getitem__(self, index)
+        if ava is None:
+            _, offset, length = self.entries[index]
+            ava = AVAType(self.data[offset - 4:offset + length])
+            list.__setitem__(self, index, ava)
+        return ava
+
+
+    def __getslice__(self, i, j):
+        return self.__getitem__(slice(i, j))
+
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+
+    def __eq__(self, other):
+        if isinstance(other, AttributeValueList):
+            return self.data == other.data and self.entries == other.entries
+        return list(self) == other
+
+
+    def __ne__(self, other):
+        return not self == other
+
+
+    def copy(self):
+        return AttributeValueList(self.data, self.entries)
+
+
+    def get(self, attribute_id):
+        for i, entry in enumerate(self.entries):
+            if entry[0] == attribute_id:
+                return self[i]
+        return None
+
+
+AVA_HEADER = struct.Struct("!HH")
+
+
+class AVAListField(PacketListField):
+    """
+    A PacketListField of AVATypes that can be dissected lazily - see lazyAttributes
+    """
+
+    def getfield(self, pkt, s):
+        if not getattr(_lazy, "enabled", False):
+            return PacketListField.getfield(self, pkt, s)
+
+        allow = _lazy.allow
+        length = self.length_from(pkt)
+        count = self.count_from(pkt)
+        data = s[:length]
+
+        entries = []
+        offset = 0
+        while count > 0 and offset + AVA_HEADER.size <= len(data):
+            attribute_id, attribute_length = AVA_HEADER.unpack_from(data, offset)
+            offset += AVA_HEADER.size
+            if allow is None or attribute_id in allow:
+                entries.append((attribute_id, offset, attribute_length))
+            offset += attribute_length
+            count -= 1
+
+        return s[length:], AttributeValueList(data, entries)
+
+
+    def do_copy(self, x):
+        if isinstance(x, AttributeValueList):
+            return x.copy()
+        return PacketListField.do_copy(self, x)
+
+
 class AttributeList(NonContainerPacket):  # PIPG-39
     name = "AttributeList"
     fields_desc = [
         FieldLenField("count", None, count_of="value"),
         FieldLenField("length", None, length_of="value"),
-        PacketListField("value", [], AVAType, length_from=lambda p: p.length, count_from=lambda p: p.count),
+        AVAListField("value", [], AVAType, length_from=lambda p: p.length, count_from=lambda p: p.count),
     ]
 
 
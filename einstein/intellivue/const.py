@@ -5,6 +5,10 @@ Taken from all over the PIPG
 """
 
 
+PORT_CONNECTION_INDICATION = 24005  # PIPG-279
+PORT_PROTOCOL = 24105  # PIPG-29
+
+
 # PIPG-37
 NOM_PART_OBJ = 1
 NOM_PART_SCADA = 2
@@ -21,6 +25,12 @@ ROER_APDU = 3
 ROLRS_APDU = 5
 
 
+# PIPG-44
+RORLS_FIRST = 1
+RORLS_NOT_FIRST_NOT_LAST = 2
+RORLS_LAST = 3
+
+
 # PIPG-47
 CMD_EVENT_REPORT = 0
 CMD_CONFIRMED_EVENT_REPORT = 1
@@ -30,6 +40,13 @@ CMD_CONFIRMED_SET = 5
 CMD_CONFIRMED_ACTION = 7
 
 
+# PIPG-51 - AttributeModEntry modify_operator
+REPLACE = 0
+ADD_VALUES = 1
+REMOVE_VALUES = 2
+SET_TO_DEFAULT = 3
+
+
 # PIPG-45
 NO_SUCH_OBJECT_CLASS = 0
 NO_SUCH_OBJECT_INSTANCE = 1
@@ -43,6 +60,11 @@ INVALID_SCOPE = 16
 INVALID_OBJECT_INSTANCE = 17
 
 
+# TODO Flesh these out
+NOM_MOC_VMO_METRIC_NU = 6
+NOM_MOC_VMS_MDS = 33
+
+
 NOM_POLL_PROFILE_SUPPORT = 1
 NOM_DIM_DIMLESS = 512
 NOM_DIM_PERCENT = 544
@@ -67,6 +89,8 @@ NOM_SAT_O2_TONE_FREQ = 61448
 NOM_PRESS_BLD_NONINV_PULS_RATE = 61669
 NOM_ATTR_NET_ADDR_INFO = 61696
 NOM_ACT_POLL_MDIB_DATA_EXT = 61755
+NOM_ATTR_POLL_NU_PRIO_LIST = 61961
+NOM_ATTR_POLL_RTSA_PRIO_LIST = 61962
 
 ENUM_IDENTIFIERS = {
     NOM_POLL_PROFILE_SUPPORT: "NOM_POLL_PROFILE_SUPPORT",
@@ -92,5 +116,13 @@ ENUM_IDENTIFIERS = {
     NOM_PRESS_BLD_NONINV_PULS_RATE: "NOM_PRESS_BLD_NONINV_PULS_RATE",
     NOM_ATTR_NET_ADDR_INFO: "NOM_ATTR_NET_ADDR_INFO",
     NOM_ACT_POLL_MDIB_DATA_EXT: "NOM_ACT_POLL_MDIB_DATA_EXT",
+    NOM_ATTR_POLL_NU_PRIO_LIST: "NOM_ATTR_POLL_NU_PRIO_LIST",
+    NOM_ATTR_POLL_RTSA_PRIO_LIST: "NOM_ATTR_POLL_RTSA_PRIO_LIST",
 }
 
+
+"""
+The label for every possible OIDType code, falling back to the code in hex (e.g. "0x04d2") where it isn't in ENUM_IDENTIFIERS,
+so that labels are always strings (as subscriptions' physio_ids are).
+"""
+IDENTIFIER_LABELS = tuple(ENUM_IDENTIFIERS.get(code, "0x%04x" % code) for code in xrange(0x10000))
@@ -0,0 +1,183 @@
+"""
+Scapy-free decoding of the messages that arrive on every poll.
+
+Dissecting a PollMdibDataReplyExt with Scapy builds the whole layer tree
+(ROapdus -> RORSapdu -> ActionResult -> PollMdibDataReplyExt -> PollInfoList -> ...)
+just to get at a handful of numbers.
+The functions here walk the datagram with struct instead,
+following the same structures (and the same length fields) as the Scapy packet definitions,
+which remain the reference implementation.
+"""
+
+import struct
+
+import float_type
+
+from .const import *
+from .association import SessionHeaderTypeField
+from .attribute_data_types import NuObsValue
+from .protocol_command_structure import CMDTypeField, ROTypeField
+from .protocol_commands import PollInfoList
+
+
+NUMERIC = struct.Struct("!HHHI")  # NuObsValue - PIPG-76: physio_id, state, unit_code, FLOAT-Type value
+USHORT = struct.Struct("!H")
+USHORT_PAIR = struct.Struct("!HH")
+RORLS_ID = struct.Struct("!BBH")  # RorlsId state and count, then invoke_id - PIPG-44
+
+SESSION_ID = "\xe1\x00"  # SPpdu session_id - PIPG-42
+NOMENCLATURE_VERSION = "\x00\x00\x01\x00"  # Nomenclature - PIPG-53
+
+RORS_HEADER_LENGTH = 14  # SPpdu + ROapdus + RORSapdu
+ROLRS_HEADER_LENGTH = 16  # SPpdu + ROapdus + ROLRSapdu, which has a leading RorlsId
+INVOKE_ID_OFFSET = 8  # SPpdu + ROapdus
+ACTION_TYPE_OFFSET = 6  # ManagedObjectId - PIPG-49
+ACTION_RESULT_LENGTH = 10
+POLL_INFO_LIST_OFFSET = 22  # poll_number, sequence_no, rel_time_stamp, abs_time_stamp, polled_obj_type, polled_attr_grp - PIPG-62
+
+
+"""
+The classes of datagram classifyDatagram distinguishes, by name.
+"""
+CONNECT_INDICATION = "ConnectIndication"
+SESSION_DATAGRAMS = dict(SessionHeaderTypeField("type", 0).i2s)  # By SessionHeader type
+REMOTE_OPERATION_DATAGRAMS = dict(  # By (ro_type, command_type); ROERapdus have no command_type
+    ((ro_type, command_type), "%s %s" % (ro_type_name, command_type_name))
+    for (ro_type, ro_type_name) in ROTypeField("ro_type", 0).i2s.items()
+    for (command_type, command_type_name) in CMDTypeField("command_type", 0).i2s.items()
+    if ro_type != ROER_APDU
+)
+REMOTE_OPERATION_DATAGRAMS[(ROER_APDU, None)] = "ROER_APDU"
+UNKNOWN_REMOTE_OPERATION = "Unknown remote operation"
+UNKNOWN = "Unknown"
+
+
+def classifyDatagram(data, port):
+    """
+    Classify a datagram by its first few bytes, and the (local) port it arrived on, without dissecting it.
+    """
+    if data[0:2] == SESSION_ID:
+        if len(data) < RORS_HEADER_LENGTH:
+            return UNKNOWN_REMOTE_OPERATION
+
+        ro_type, = USHORT.unpack_from(data, 4)
+        if ro_type == ROER_APDU:
+            command_type = None
+        elif ro_type == ROLRS_APDU:
+            command_type, = USHORT.unpack_from(data, ROLRS_HEADER_LENGTH - 4)
+        else:
+            command_type, = USHORT.unpack_from(data, RORS_HEADER_LENGTH - 4)
+        return REMOTE_OPERATION_DATAGRAMS.get((ro_type, command_type), UNKNOWN_REMOTE_OPERATION)
+
+    if port == PORT_CONNECTION_INDICATION and data[0:4] == NOMENCLATURE_VERSION:
+        return CONNECT_INDICATION
+
+    if data:
+        return SESSION_DATAGRAMS.get(ord(data[0]), UNKNOWN)
+
+    return UNKNOWN
+
+
+def remoteOperationIds(data):
+    """
+    (ro_type, invoke_id, linked state, linked count) of a remote operation, without dissecting it;
+    the linked state and count are a ROLRSapdu's RorlsId, and None otherwise.
+
+    Returns None if data is not a remote operation.
+    """
+    if data[0:2] != SESSION_ID or len(data) < ROLRS_HEADER_LENGTH:
+        return None
+
+    ro_type, = USHORT.unpack_from(data, 4)
+    if ro_type == ROLRS_APDU:
+        state, count, invoke_id = RORLS_ID.unpack_from(data, INVOKE_ID_OFFSET)
+        return ro_type, invoke_id, state, count
+
+    invoke_id, = USHORT.unpack_from(data, INVOKE_ID_OFFSET)
+    return ro_type, invoke_id, None, None
+
+
+def decodePollReplyExtNumerics(data, raw=False):
+    """
+    Extract (physio_id, state, unit_code, value) for every NOM_ATTR_NU_VAL_OBS attribute in a
+    PollMdibDataReplyExt (either a RORSapdu or a ROLRSapdu linked result).
+    If raw, values are left FLOAT-Type encoded (e.g. for float_type.decode_many).
+
+    Returns None if data is not a PollMdibDataReplyExt,
+    and raises ValueError if it claims to be but is truncated.
+    """
+    if data[0:2] != SESSION_ID or len(data) < RORS_HEADER_LENGTH:
+        return None
+
+    ro_type, = USHORT.unpack_from(data, 4)
+    if ro_type == RORS_APDU:
+        offset = RORS_HEADER_LENGTH
+    elif ro_type == ROLRS_APDU:
+        offset = ROLRS_HEADER_LENGTH
+    else:
+        return None
+
+    command_type, = USHORT.unpack_from(data, offset - 4)
+    if command_type != CMD_CONFIRMED_ACTION:
+        return None
+
+    try:
+        action_type, = USHORT.unpack_from(data, offset + ACTION_TYPE_OFFSET)
+        if action_type != NOM_ACT_POLL_MDIB_DATA_EXT:
+            return None
+
+        offset += ACTION_RESULT_LENGTH + POLL_INFO_LIST_OFFSET
+        return _pollInfoListNumerics(data, offset, raw)
+    except struct.error as e:
+        raise ValueError("Truncated PollMdibDataReplyExt: %s" % e)
+
+
+def _pollInfoListNumerics(data, offset, raw=False):
+    numerics = []
+
+    # PollInfoList - PIPG-57
+    length, = USHORT.unpack_from(data, offset + 2)
+    offset += 4
+    end = offset + length
+    while offset < end:
+
+        # SingleContextPoll - PIPG-58
+        length, = USHORT.unpack_from(data, offset + 4)
+        offset += 6
+        context_end = offset + length
+        while offset < context_end:
+
+            # ObservationPoll - PIPG-58, whose AttributeList is PIPG-39
+            attribute_count, length = USHORT_PAIR.unpack_from(data, offset + 2)
+            offset += 6
+            attributes_end = offset + length
+            for _ in xrange(attribute_count):
+                if offset >= attributes_end:
+                    break
+
+                # AVAType - PIPG-38
+                attribute_id, length = USHORT_PAIR.unpack_from(data, offset)
+                if attribute_id == NOM_ATTR_NU_VAL_OBS:
+                    physio_id, state, unit_code, value = NUMERIC.unpack_from(data, offset + 4)
+                    numerics.append((physio_id, state, unit_code, value if raw else float_type.decode(value)))
+                offset += 4 + length
+            offset = attributes_end
+
+    if offset > len(data):
+        raise ValueError("Truncated PollInfoList: needs %d bytes, have %d" % (offset, len(data)))
+
+    return numerics
+
+
+def pollReplyNumerics(message):
+    """
+    The Scapy equivalent of decodePollReplyExtNumerics, from an already dissected message.
+    """
+    numerics = []
+    for single_context_poll in message[PollInfoList].value:
+        for observation_poll in single_context_poll.value:
+            for attribute in observation_poll.attributes.value:
+                if attribute.attribute_id == NOM_ATTR_NU_VAL_OBS:
+                    obsValue = attribute[NuObsValue]
+                    numerics.append((obsValue.physio_id, int(obsValue.state), obsValue.unit_code, obsValue.value))
+    return numerics
@@ -141,3 +141,73 @@ class ActionResult(Packet):  # PIPG-49
         OIDTypeField("action_type", 0),
         LenField("length", None),
     ]
+
+
+class AttributeIdList(NonContainerPacket):  # PIPG-50
+    name = "AttributeIdList"
+    fields_desc = [
+        FieldLenField("count", None, count_of="value"),
+        FieldLenField("length", None, length_of="value"),
+        FieldListField("value", [], OIDTypeField("", 0), count_from=lambda p: p.count),
+    ]
+
+
+class GetArgument(Packet):  # PIPG-50
+    name = "GetArgument"
+    fields_desc = [
+        PacketField("managed_object", ManagedObjectId(), ManagedObjectId),
+        IntField("scope", 0),
+        PacketField("attribute_id_list", AttributeIdList(), AttributeIdList),
+    ]
+
+
+class GetResult(Packet):  # PIPG-50
+    name = "GetResult"
+    fields_desc = [
+        PacketField("managed_object", ManagedObjectId(), ManagedObjectId),
+        PacketField("attribute_list", AttributeList(), AttributeList),
+    ]
+
+
+def ModifyOperatorField(name, default):  # PIPG-51
+    enum = {
+        REPLACE: "REPLACE",
+        ADD_VALUES: "ADD_VALUES",
+        REMOVE_VALUES: "REMOVE_VALUES",
+        SET_TO_DEFAULT: "SET_TO_DEFAULT",
+    }
+    return ShortEnumField(name, default, enum)
+
+
+class AttributeModEntry(NonContainerPacket):  # PIPG-51
+    name = "AttributeModEntry"
+    fields_desc = [
+        ModifyOperatorField("modify_operator", REPLACE),
+        PacketField("attribute", AVAType(), AVAType),
+    ]
+
+
+class ModificationList(NonContainerPacket):  # PIPG-51
+    name = "ModificationList"
+    fields_desc = [
+        FieldLenField("count", None, count_of="value"),
+        FieldLenField("length", None, length_of="value"),
+        PacketListField("value", [], AttributeModEntry, length_from=lambda p: p.length),
+    ]
+
+
+class SetArgument(Packet):  # PIPG-51
+    name = "SetArgument"
+    fields_desc = [
+        PacketField("managed_object", ManagedObjectId(), ManagedObjectId),
+        IntField("scope", 0),
+        PacketField("modification_list", ModificationList(), ModificationList),
+    ]
+
+
+class SetResult(Packet):  # PIPG-51
+    name = "SetResult"
+    fields_desc = [
+        PacketField("managed_object", ManagedObjectId(), ManagedObjectId),
+        PacketField("attribute_list", AttributeList(), AttributeList),
+    ]
@@ -5,6 +5,7 @@ Protocol Commands - PIPG-52
 from scapy.all import *
 
 from .protocol_command_structure import *
+from .attribute_data_types import TextIdList, textId, textIdPhysioId
 
 
 class Nomenclature(Packet):  # PIPG-53
@@ -102,3 +103,55 @@ class PollMdibDataReplyExt(Packet):  # PIPG-62
         OIDTypeField("polled_attr_grp", 0),
         PacketField("poll_info_list", PollInfoList(), PollInfoList),
     ]
+
+
+def PollAction(invoke_id=0, poll_number=0, partition=NOM_PART_OBJ, code=NOM_MOC_VMO_METRIC_NU, polled_attr_grp=NOM_ATTR_GRP_METRIC_VAL_OBS):  # PIPG-55
+    """
+    By default polls for Numerics (i.e. numbers about the attached patient), and their observed values
+    """
+    return SPpdu() / ROapdus(ro_type=ROIV_APDU) / ROIVapdu(invoke_id=invoke_id, command_type=CMD_CONFIRMED_ACTION) / ActionArgument(
+        managed_object=ManagedObjectId(m_obj_class=NOM_MOC_VMS_MDS),
+        action_type=NOM_ACT_POLL_MDIB_DATA_EXT,
+    ) / PollMdibDataReqExt(
+        poll_number=poll_number,
+        polled_obj_type=TYPE(partition=partition, code=code),
+        polled_attr_grp=polled_attr_grp,
+    )
+
+
+def GetPriorityList(invoke_id=0, attribute_id=NOM_ATTR_POLL_NU_PRIO_LIST):  # PIPG-50
+    """
+    By default gets the numerics priority list: the numerics an extended poll returns,
+    if POLL_EXT_NU_PRIO_LIST was asked for on association
+    """
+    return SPpdu() / ROapdus(ro_type=ROIV_APDU) / ROIVapdu(invoke_id=invoke_id, command_type=CMD_GET) / GetArgument(
+        managed_object=ManagedObjectId(m_obj_class=NOM_MOC_VMS_MDS),
+        attribute_id_list=AttributeIdList(value=[attribute_id]),
+    )
+
+
+def SetPriorityList(physio_ids, invoke_id=0, attribute_id=NOM_ATTR_POLL_NU_PRIO_LIST):  # PIPG-51
+    """
+    By default replaces the numerics priority list with physio_ids
+    """
+    return SPpdu() / ROapdus(ro_type=ROIV_APDU) / ROIVapdu(invoke_id=invoke_id, command_type=CMD_CONFIRMED_SET) / SetArgument(
+        managed_object=ManagedObjectId(m_obj_class=NOM_MOC_VMS_MDS),
+        modification_list=ModificationList(value=[
+            AttributeModEntry(
+                modify_operator=REPLACE,
+                attribute=AVAType(attribute_id=attribute_id) / TextIdList(value=[textId(physio_id) for physio_id in physio_ids]),
+            ),
+        ]),
+    )
+
+
+def priorityListPhysioIds(message, attribute_id=NOM_ATTR_POLL_NU_PRIO_LIST):
+    """
+    The physio_ids of the priority list in a (dissected) GetResult or SetResult, or None if it doesn't have one
+    """
+    for layer in (GetResult, SetResult):
+        if layer in message:
+            ava = [ava for ava in message[layer].attribute_list.value if ava.attribute_id == attribute_id]
+            if ava and TextIdList in ava[0]:
+                return [textIdPhysioId(text_id) for text_id in ava[0][TextIdList].value]
+    return None
@@ -0,0 +1,70 @@
+"""
+Precompiled request templates.
+
+Building a nested Scapy packet and serialising it is expensive,
+and most requests we send only ever differ in a few fixed-size fields.
+A RequestTemplate serialises a packet once,
+then patches those fields directly into a preallocated buffer.
+"""
+
+import struct
+
+from .protocol_commands import *
+
+
+class RequestTemplate(object):
+    """
+    A serialised packet with named, patchable, fixed-size fields.
+
+    fields maps a name to a (layer, field) pair,
+    where field is a dotted path for fields nested inside PacketFields,
+    e.g. {"code": (PollMdibDataReqExt, "polled_obj_type.code")}
+
+    Fields that aren't given to render keep the value they were last rendered with
+    (initially the packet's own value).
+    """
+
+    def __init__(self, packet, fields):
+        raw = str(packet)
+        self.buffer = bytearray(raw)
+        self.fields = {}
+        for name, (layer, path) in fields.items():
+            layer_offset = len(raw) - len(str(packet[layer]))
+            field_offset, field = fieldOffset(packet[layer], path.split("."))
+            self.fields[name] = (layer_offset + field_offset, struct.Struct(field.fmt))
+
+
+    def render(self, **values):
+        for name, value in values.iteritems():
+            offset, fmt = self.fields[name]
+            fmt.pack_into(self.buffer, offset, value)
+        return str(self.buffer)
+
+
+def fieldOffset(packet, path):
+    """
+    The offset of a (possibly nested) field from the start of packet, and the field itself
+    """
+    offset = 0
+    for field in packet.fields_desc:
+        if field.name == path[0]:
+            break
+        offset += len(field.addfield(packet, "", packet.getfieldval(field.name)))
+    else:
+        raise KeyError(path[0])
+
+    if len(path) > 1:
+        nested_offset, field = fieldOffset(packet.getfieldval(field.name), path[1:])
+        offset += nested_offset
+
+    return offset, field
+
+
+def PollActionTemplate():
+    return RequestTemplate(PollAction(), {
+        "invoke_id": (ROIVapdu, "invoke_id"),
+        "poll_number": (PollMdibDataReqExt, "poll_number"),
+        "partition": (PollMdibDataReqExt, "polled_obj_type.partition"),
+        "code": (PollMdibDataReqExt, "polled_obj_type.code"),
+        "polled_attr_grp": (PollMdibDataReqExt, "polled_attr_grp"),
+    })
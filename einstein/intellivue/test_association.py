@@ -10,4 +10,5 @@ def test_assoc_req_presentation_header_header():
 
 
 def test_association_request():
-    makeAssociationRequest()
+    p = SessionHeader(makeAssociationRequest(DEFAULT_POLL_OPTIONS | POLL_EXT_NU_PRIO_LIST))
+    assert p[PollProfileExt].options == DEFAULT_POLL_OPTIONS | POLL_EXT_NU_PRIO_LIST
@@ -0,0 +1,22 @@
+import intellivue
+
+
+def test_measurement_states_match_flags():
+    for word in xrange(0x10000):
+        names, valid = intellivue.MEASUREMENT_STATES[word]
+        expected = [name for (flag, name) in intellivue.ENUM_MEASUREMENT_STATE.items() if word & flag]
+
+        assert sorted(names) == sorted(expected)
+        assert valid == (word < 0x1000)  # As NuObsValue.measurementIsValid
+
+
+def test_measurement_states_order():
+    names, valid = intellivue.MEASUREMENT_STATES[intellivue.INVALID | intellivue.MSMT_STATE_IN_ALARM]
+
+    assert names == ("INVALID", "MSMT_STATE_IN_ALARM")
+    assert not valid
+
+
+def test_identifier_labels():
+    assert intellivue.IDENTIFIER_LABELS[intellivue.NOM_PULS_OXIM_SAT_O2] == "NOM_PULS_OXIM_SAT_O2"
+    assert intellivue.IDENTIFIER_LABELS[1234] == "0x04d2"
@@ -0,0 +1,39 @@
+from test_intellivue import SAMPLE_CONNECT_INDICATION
+import intellivue
+
+
+def test_lazy_attribute_list():
+    ci = intellivue.dissectLazily(intellivue.Nomenclature, SAMPLE_CONNECT_INDICATION)
+    attributes = ci[intellivue.AttributeList].value
+
+    assert isinstance(attributes, intellivue.AttributeValueList)
+    assert len(attributes) == ci[intellivue.AttributeList].count
+    assert list.__getitem__(attributes, 0) is None  # Not yet dissected
+    assert attributes[0].attribute_id == attributes.entries[0][0]
+    assert list.__getitem__(attributes, 0) is attributes[0]
+
+
+def test_lazy_attribute_list_matches_eager():
+    lazy = intellivue.dissectLazily(intellivue.Nomenclature, SAMPLE_CONNECT_INDICATION)
+    eager = intellivue.Nomenclature(SAMPLE_CONNECT_INDICATION)
+
+    assert [str(a) for a in lazy[intellivue.AttributeList].value] == [str(a) for a in eager[intellivue.AttributeList].value]
+    assert lazy[intellivue.IpAddressInfo].mac_address == eager[intellivue.IpAddressInfo].mac_address
+
+
+def test_lazy_attribute_list_allow():
+    ci = intellivue.dissectLazily(intellivue.Nomenclature, SAMPLE_CONNECT_INDICATION, allow=[intellivue.NOM_ATTR_NET_ADDR_INFO])
+    attributes = ci[intellivue.AttributeList].value
+
+    assert [entry[0] for entry in attributes.entries] == [intellivue.NOM_ATTR_NET_ADDR_INFO]
+    assert attributes.get(intellivue.NOM_ATTR_NET_ADDR_INFO)[intellivue.IpAddressInfo].mac_address == "00:09:fb:09:77:bd"
+    assert str(ci) == SAMPLE_CONNECT_INDICATION  # Skipped attributes survive a rebuild
+
+
+def test_lazy_is_scoped():
+    with intellivue.lazyAttributes():
+        ci = intellivue.Nomenclature(SAMPLE_CONNECT_INDICATION)
+    assert isinstance(ci[intellivue.AttributeList].value, intellivue.AttributeValueList)
+
+    ci = intellivue.Nomenclature(SAMPLE_CONNECT_INDICATION)
+    assert not isinstance(ci[intellivue.AttributeList].value, intellivue.AttributeValueList)
@@ -0,0 +1,117 @@
+import pytest
+
+import intellivue
+
+
+def makeNuObsValue(physio_id, state, unit_code, value):
+    return intellivue.AVAType(attribute_id=intellivue.NOM_ATTR_NU_VAL_OBS) / intellivue.Raw(
+        load=intellivue.NUMERIC.pack(physio_id, state, unit_code, value),
+    )
+
+
+def makePollReply(ro_type, apdu, observation_polls):
+    context_poll = intellivue.SingleContextPoll(
+        value=observation_polls,
+        count=len(observation_polls),
+        length=sum(len(str(p)) for p in observation_polls),
+    )
+    poll_info_list = intellivue.PollInfoList(value=[context_poll], count=1, length=len(str(context_poll)))
+
+    reply = intellivue.SPpdu() / intellivue.ROapdus(ro_type=ro_type) / apdu
+    reply /= intellivue.ActionResult(action_type=intellivue.NOM_ACT_POLL_MDIB_DATA_EXT)
+    reply /= intellivue.PollMdibDataReplyExt(poll_number=1, sequence_no=1, rel_time_stamp=0, poll_info_list=poll_info_list)
+    return str(reply)
+
+
+SAMPLE_OBSERVATION_POLLS = [
+    intellivue.ObservationPoll(obj_handle=1, attributes=intellivue.AttributeList(value=[
+        intellivue.AVAType(attribute_id=intellivue.NOM_ATTR_TIME_STAMP_ABS) / intellivue.AbsoluteTime(),
+        makeNuObsValue(intellivue.NOM_PULS_OXIM_SAT_O2, 0, intellivue.NOM_DIM_PERCENT, 0xff0003d5),  # 98.1
+    ])),
+    intellivue.ObservationPoll(obj_handle=2, attributes=intellivue.AttributeList(value=[
+        makeNuObsValue(intellivue.NOM_ECG_CARD_BEAT_RATE, intellivue.MSMT_STATE_IN_ALARM, intellivue.NOM_DIM_BEAT_PER_MIN, 0x00000048),  # 72
+        makeNuObsValue(intellivue.NOM_RESP_RATE, intellivue.INVALID, intellivue.NOM_DIM_RESP_PER_MIN, 0x007fffff),  # NaN
+    ])),
+]
+
+
+SAMPLE_POLL_REPLY = makePollReply(intellivue.RORS_APDU, intellivue.RORSapdu(command_type=intellivue.CMD_CONFIRMED_ACTION), SAMPLE_OBSERVATION_POLLS)
+
+
+def test_decode_poll_reply():
+    numerics = intellivue.decodePollReplyExtNumerics(SAMPLE_POLL_REPLY)
+
+    assert numerics[0] == (intellivue.NOM_PULS_OXIM_SAT_O2, 0, intellivue.NOM_DIM_PERCENT, pytest.approx(98.1))
+    assert numerics[1] == (intellivue.NOM_ECG_CARD_BEAT_RATE, intellivue.MSMT_STATE_IN_ALARM, intellivue.NOM_DIM_BEAT_PER_MIN, 72)
+    assert numerics[2][:3] == (intellivue.NOM_RESP_RATE, intellivue.INVALID, intellivue.NOM_DIM_RESP_PER_MIN)
+    assert len(numerics) == 3
+
+
+def test_matches_scapy():
+    message = intellivue.SPpdu(SAMPLE_POLL_REPLY)
+
+    assert repr(intellivue.decodePollReplyExtNumerics(SAMPLE_POLL_REPLY)) == repr(intellivue.pollReplyNumerics(message))
+
+
+def test_linked_result_matches_scapy():
+    data = makePollReply(intellivue.ROLRS_APDU, intellivue.ROLRSapdu(command_type=intellivue.CMD_CONFIRMED_ACTION), SAMPLE_OBSERVATION_POLLS)
+    message = intellivue.SPpdu(data)
+
+    assert intellivue.ROLRSapdu in message
+    assert repr(intellivue.decodePollReplyExtNumerics(data)) == repr(intellivue.pollReplyNumerics(message))
+
+
+def test_not_a_poll_reply():
+    assert intellivue.decodePollReplyExtNumerics("\x0e\x00") is None  # AC_SPDU_SI
+
+    report = intellivue.MDSCreateEventReport()
+    report[intellivue.ROapdus].ro_type = intellivue.ROIV_APDU
+    assert intellivue.decodePollReplyExtNumerics(str(report)) is None
+
+
+def test_truncated():
+    with pytest.raises(ValueError):
+        intellivue.decodePollReplyExtNumerics(SAMPLE_POLL_REPLY[:-4])
+
+
+def test_classify_datagram():
+    from test_intellivue import SAMPLE_CONNECT_INDICATION
+
+    assert intellivue.classifyDatagram(SAMPLE_CONNECT_INDICATION, intellivue.PORT_CONNECTION_INDICATION) == intellivue.CONNECT_INDICATION
+    assert intellivue.classifyDatagram(SAMPLE_POLL_REPLY, intellivue.PORT_CONNECTION_INDICATION) == "RORS_APDU CMD_CONFIRMED_ACTION"
+    assert intellivue.classifyDatagram(str(intellivue.SessionHeader(type=intellivue.AC_SPDU_SI)), intellivue.PORT_CONNECTION_INDICATION) == "AC_SPDU_SI"
+    assert intellivue.classifyDatagram(intellivue.ReleaseRequest, intellivue.PORT_CONNECTION_INDICATION) == "FN_SPDU_SI"
+    assert intellivue.classifyDatagram("\xff\xff", intellivue.PORT_CONNECTION_INDICATION) == intellivue.UNKNOWN
+    assert intellivue.classifyDatagram("", intellivue.PORT_CONNECTION_INDICATION) == intellivue.UNKNOWN
+
+
+def test_classify_remote_operations():
+    linked = makePollReply(intellivue.ROLRS_APDU, intellivue.ROLRSapdu(command_type=intellivue.CMD_CONFIRMED_ACTION), SAMPLE_OBSERVATION_POLLS)
+    error = str(intellivue.SPpdu() / intellivue.ROapdus(ro_type=intellivue.ROER_APDU) / intellivue.ROERapdu())
+    report = intellivue.MDSCreateEventReport()
+    report[intellivue.ROapdus].ro_type = intellivue.ROIV_APDU
+    report[intellivue.ROIVapdu].command_type = intellivue.CMD_CONFIRMED_EVENT_REPORT
+
+    assert intellivue.classifyDatagram(linked, intellivue.PORT_PROTOCOL) == "ROLRS_APDU CMD_CONFIRMED_ACTION"
+    assert intellivue.classifyDatagram(error, intellivue.PORT_PROTOCOL) == "ROER_APDU"
+    assert intellivue.classifyDatagram(str(report), intellivue.PORT_PROTOCOL) == "ROIV_APDU CMD_CONFIRMED_EVENT_REPORT"
+    assert intellivue.classifyDatagram("\xe1\x00\x00\x02", intellivue.PORT_PROTOCOL) == intellivue.UNKNOWN_REMOTE_OPERATION
+
+
+def test_raw_values():
+    numerics = intellivue.decodePollReplyExtNumerics(SAMPLE_POLL_REPLY, raw=True)
+
+    assert [value for (_, _, _, value) in numerics] == [0xff0003d5, 0x00000048, 0x007fffff]
+
+
+def test_remote_operation_ids():
+    assert intellivue.remoteOperationIds(SAMPLE_POLL_REPLY) == (intellivue.RORS_APDU, 0, None, None)
+
+    data = makePollReply(intellivue.ROLRS_APDU, intellivue.ROLRSapdu(
+        linked_id=intellivue.RorlsId(state=intellivue.RORLS_NOT_FIRST_NOT_LAST, count=2),
+        invoke_id=0x1234,
+        command_type=intellivue.CMD_CONFIRMED_ACTION,
+    ), SAMPLE_OBSERVATION_POLLS)
+    assert intellivue.remoteOperationIds(data) == (intellivue.ROLRS_APDU, 0x1234, intellivue.RORLS_NOT_FIRST_NOT_LAST, 2)
+
+    assert intellivue.remoteOperationIds("\xff\xff") is None
@@ -8,3 +8,24 @@ def test_basic_connect_indication():
 def test_basic_mds_create_event_report():
     p = MDSCreateEventReport()
     p.build()
+
+
+def test_priority_list_requests():
+    from . import SPpdu, TextIdList
+
+    p = SPpdu(str(SetPriorityList([NOM_ECG_CARD_BEAT_RATE, NOM_RESP_RATE], invoke_id=7)))
+    assert p[ROIVapdu].command_type == CMD_CONFIRMED_SET
+    assert p[TextIdList].value == [0x24182, 0x2500a]
+
+    p = SPpdu(str(GetPriorityList(invoke_id=3)))
+    assert p[GetArgument].attribute_id_list.value == [NOM_ATTR_POLL_NU_PRIO_LIST]
+
+
+def test_priority_list_result():
+    from . import SPpdu, TextIdList
+
+    result = SPpdu() / ROapdus(ro_type=RORS_APDU) / RORSapdu(invoke_id=3, command_type=CMD_GET) / GetResult(
+        attribute_list=AttributeList(value=[AVAType(attribute_id=NOM_ATTR_POLL_NU_PRIO_LIST) / TextIdList(value=[textId(NOM_RESP_RATE)])]),
+    )
+    assert priorityListPhysioIds(SPpdu(str(result))) == [NOM_RESP_RATE]
+    assert priorityListPhysioIds(SPpdu(str(MDSCreateEventReport()))) is None
@@ -0,0 +1,31 @@
+import intellivue
+
+
+def test_poll_action_template_defaults():
+    template = intellivue.PollActionTemplate()
+
+    assert template.render() == str(intellivue.PollAction())
+
+
+def test_poll_action_template_patching():
+    template = intellivue.PollActionTemplate()
+
+    for invoke_id, poll_number in [(1, 1), (0xfffe, 2), (7, 0xffff)]:
+        rendered = template.render(invoke_id=invoke_id, poll_number=poll_number)
+        assert rendered == str(intellivue.PollAction(invoke_id=invoke_id, poll_number=poll_number))
+
+    rendered = template.render(partition=intellivue.NOM_PART_OBJ, code=intellivue.NOM_MOC_VMS_MDS, polled_attr_grp=intellivue.NOM_ATTR_NU_VAL_OBS)
+    assert rendered == str(intellivue.PollAction(invoke_id=7, poll_number=0xffff, code=intellivue.NOM_MOC_VMS_MDS, polled_attr_grp=intellivue.NOM_ATTR_NU_VAL_OBS))
+
+
+def test_field_offset():
+    offset, field = intellivue.fieldOffset(intellivue.PollMdibDataReqExt(), ["polled_obj_type", "code"])
+
+    assert offset == 4
+    assert field.name == "code"
+
+
+def test_association_request():
+    p = intellivue.SessionHeader(str(intellivue.AssociationRequest()))
+
+    assert p[intellivue.PollProfileExt].options == intellivue.POLL_EXT_PERIOD_NU_1SEC | intellivue.POLL_EXT_PERIOD_RTSA | intellivue.POLL_EXT_ENUM
@@ -0,0 +1,240 @@
+"""
+The lifecycle of our association with each monitor
+
+    discovered -> associating -> associated -> connected -> releasing
+    (ConnectIndication)  (AssociationRequest sent)  (AC_SPDU)  (MDSCreateEventReport)  (ReleaseRequest sent)
+
+Associating and associated time out, and go back to discovered, to try again after a backoff;
+so do refusals and aborts. Connected monitors that have gone quiet are kept alive,
+and monitors that haven't been heard from at all (not even a ConnectIndication) for long enough are evicted.
+
+What's actually sent, and what follows from connecting or evicting, is up to the handler (the IntellivueInterface):
+    handler.associate(host), handler.release(host), handler.keepAlive(host),
+    handler.monitorConnected(host), handler.monitorDisconnected(host), handler.monitorForgotten(host)
+"""
+
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+import collections
+import structlog
+
+log = structlog.get_logger()
+
+
+DISCOVERED = "discovered"
+ASSOCIATING = "associating"
+ASSOCIATED = "associated"
+CONNECTED = "connected"
+RELEASING = "releasing"
+STATES = (DISCOVERED, ASSOCIATING, ASSOCIATED, CONNECTED, RELEASING)
+
+DEFAULT_ASSOCIATE_TIMEOUT = 5  # Seconds from AssociationRequest to AC_SPDU
+DEFAULT_CONNECT_TIMEOUT = 10  # Seconds from AC_SPDU to MDSCreateEventReport
+DEFAULT_RETRY_DELAY = 2  # Seconds, doubling with each failed attempt...
+DEFAULT_MAX_RETRY_DELAY = 60  # ...up to this
+DEFAULT_KEEPALIVE_AFTER = 10  # Seconds of silence from a connected monitor before it's kept alive
+DEFAULT_STALE_AFTER = 60  # Seconds of silence before a monitor's evicted
+DEFAULT_CHECK_INTERVAL = 5  # Seconds between checks for the above two
+
+
+class Association(object):
+
+    def __init__(self, host, now):
+        self.host = host
+        self.state = DISCOVERED
+        self.last_seen = now
+        self.attempts = 0  # Consecutive failed attempts to connect
+        self.call = None  # The pending timeout (or retry)
+
+
+class MonitorLifecycle(object):
+
+    def __init__(self, clock=reactor, associate_timeout=DEFAULT_ASSOCIATE_TIMEOUT, connect_timeout=DEFAULT_CONNECT_TIMEOUT, retry_delay=DEFAULT_RETRY_DELAY, max_retry_delay=DEFAULT_MAX_RETRY_DELAY, keepalive_after=DEFAULT_KEEPALIVE_AFTER, stale_after=DEFAULT_STALE_AFTER, check_interval=DEFAULT_CHECK_INTERVAL, handler=None):
+        self.clock = clock
+        self.associate_timeout = associate_timeout
+        self.connect_timeout = connect_timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.keepalive_after = keepalive_after
+        self.stale_after = stale_after
+        self.check_interval = check_interval
+        self.handler = handler
+
+        self.associations = {}  # Mapping of host -> Association
+
+        self.timeouts = 0
+        self.retries = 0
+        self.keepalives = 0
+        self.evicted = 0
+        self.released = 0
+
+        self.loop = LoopingCall(self.check)
+        self.loop.clock = clock
+
+
+    def start(self):
+        if not self.loop.running:
+            self.loop.start(self.check_interval, now=False)
+
+
+    def state(self, host):
+        association = self.associations.get(host)
+        return association.state if association is not None else None
+
+
+    def _get(self, host):
+        association = self.associations.get(host)
+        if association is None:
+            association = self.associations[host] = Association(host, self.clock.seconds())
+        return association
+
+
+    def _enter(self, association, state, timeout=None, then=None):
+        if association.call is not None and association.call.active():
+            association.call.cancel()
+        association.call = None
+
+        previous, association.state = association.state, state
+        if timeout is not None:
+            association.call = self.clock.callLater(timeout, then, association)
+
+        if previous != state:
+            log.debug("Association changed state", host=association.host, previous=previous, state=state)
+        if previous == CONNECTED and state != CONNECTED:
+            self.handler.monitorDisconnected(association.host)
+        elif state == CONNECTED and previous != CONNECTED:
+            self.handler.monitorConnected(association.host)
+
+
+    def seen(self, host):
+        association = self.associations.get(host)
+        if association is not None:
+            association.last_seen = self.clock.seconds()
+
+
+    def discovered(self, host):
+        """
+        A ConnectIndication: associate, unless we are (or are waiting to retry)
+        """
+        association = self._get(host)
+        association.last_seen = self.clock.seconds()
+        if association.state == DISCOVERED and association.call is None:
+            self._associate(association)
+
+
+    def _associate(self, association):
+        self._enter(association, ASSOCIATING, self.associate_timeout, self._timedOut)
+        self.handler.associate(association.host)
+
+
+    def _retry(self, association):
+        association.call = None
+        self.retries += 1
+        self._associate(association)
+
+
+    def _backOff(self, association):
+        association.attempts += 1
+        delay = min(self.retry_delay * 2 ** (association.attempts - 1), self.max_retry_delay)
+        self._enter(association, DISCOVERED, delay, self._retry)
+        return delay
+
+
+    def _timedOut(self, association):
+        association.call = None
+        self.timeouts += 1
+        if association.state == ASSOCIATED:
+            self.handler.release(association.host)  # So the monitor isn't left half associated
+        delay = self._backOff(association)
+        log.info("Association timed out, retrying", host=association.host, attempts=association.attempts, delay=delay)
+
+
+    def associated(self, host):
+        """
+        An AC_SPDU: wait for the MDSCreateEventReport
+        """
+        association = self._get(host)
+        if association.state != ASSOCIATING:
+            log.warning("Unexpected association confirmation", host=host, state=association.state)
+        self._enter(association, ASSOCIATED, self.connect_timeout, self._timedOut)
+
+
+    def connected(self, host):
+        """
+        An MDSCreateEventReport: the monitor can be polled
+        """
+        association = self._get(host)
+        association.attempts = 0
+        self._enter(association, CONNECTED)
+
+
+    def dropped(self, host):
+        """
+        A refusal, finish, disconnect or abort
+        """
+        association = self.associations.get(host)
+        if association is None:
+            return
+        if association.state == RELEASING:
+            self._forget(association)
+        else:
+            delay = self._backOff(association)
+            log.info("Association dropped, retrying", host=host, attempts=association.attempts, delay=delay)
+
+
+    def release(self, host):
+        association = self.associations.get(host)
+        if association is None:
+            return
+        if association.state in (ASSOCIATED, CONNECTED):
+            self.handler.release(host)
+            self.released += 1
+            self._enter(association, RELEASING, self.associate_timeout, self._forget)
+        else:
+            self._forget(association)
+
+
+    def check(self):
+        """
+        Keep quiet monitors alive, and evict those we've stopped hearing from
+        """
+        now = self.clock.seconds()
+        for association in self.associations.values():
+            silence = now - association.last_seen
+            if silence >= self.stale_after:
+                log.info("Evicting stale monitor", host=association.host, state=association.state, silence=silence)
+                self.evicted += 1
+                if association.state in (ASSOCIATED, CONNECTED):
+                    self.handler.release(association.host)
+                self._forget(association)
+            elif silence >= self.keepalive_after and association.state == CONNECTED:
+                self.keepalives += 1
+                self.handler.keepAlive(association.host)
+
+
+    def _forget(self, association):
+        self._enter(association, DISCOVERED)
+        del self.associations[association.host]
+        self.handler.monitorForgotten(association.host)
+
+
+    def stop(self):
+        """
+        Release every association (on shutdown)
+        """
+        if self.loop.running:
+            self.loop.stop()
+        for host in self.associations.keys():
+            self.release(host)
+
+
+    def stats(self):
+        states = collections.Counter(association.state for association in self.associations.values())
+        return {
+            "states": dict((state, states[state]) for state in STATES),
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "keepalives": self.keepalives,
+            "evicted": self.evicted,
+            "released": self.released,
+        }
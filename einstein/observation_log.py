@@ -0,0 +1,228 @@
+"""
+An append-only, on-disk log of decoded observations
+
+Observations are fixed-size (24 byte) records, appended in batches to segment files
+which rotate once they reach a number of records.
+Segments are read back as NumPy memmaps, so queries scan mapped pages without deserialising anything;
+a small index of each segment's first and last times means only the segments in range are scanned,
+and records are in time order within a segment, so those are binary searched.
+
+Monitors (MAC addresses) are stored by their index in a sidecar file, monitors.txt, one per line.
+
+The log survives restarts: opening a directory picks up its existing segments and monitors,
+and truncates any partially written record at the end of the last segment.
+"""
+
+import os
+import re
+
+import numpy
+
+import intellivue as packets
+
+
+RECORD = numpy.dtype([
+    ("time", "<f8"),  # Seconds since the epoch
+    ("monitor", "<u2"),  # Index into monitors.txt
+    ("physio_id", "<u2"),
+    ("state", "<u2"),  # MeasurementState
+    ("unit_code", "<u2"),
+    ("value", "<f8"),
+])
+
+SEGMENT_NAME = "observations-%08d.log"
+SEGMENT_PATTERN = re.compile(r"^observations-(\d{8})\.log$")
+MONITORS_NAME = "monitors.txt"
+
+DEFAULT_SEGMENT_RECORDS = 1 << 20  # 24 MiB segments
+DEFAULT_BATCH_RECORDS = 1024
+DEFAULT_FLUSH_INTERVAL = 5  # Seconds
+
+IDENTIFIER_CODES = dict((label, code) for (code, label) in packets.ENUM_IDENTIFIERS.items())
+
+
+def identifierCode(label):
+    """
+    The code for an identifier label, as in packets.IDENTIFIER_LABELS (which falls back to the code in hex),
+    or for the code itself in decimal
+    """
+    if label in IDENTIFIER_CODES:
+        return IDENTIFIER_CODES[label]
+    if label.startswith("0x"):
+        return int(label, 16)
+    return int(label)
+
+
+class Segment(object):
+
+    def __init__(self, path, number):
+        self.path = path
+        self.number = number
+        self.first = None  # Time of the first record
+        self.last = None  # Time of the last record
+        self.records = 0
+
+
+    def load(self):
+        """
+        Read the time index, discarding any partially written record at the end
+        """
+        size = os.path.getsize(self.path)
+        if size % RECORD.itemsize:
+            with open(self.path, "r+b") as f:
+                f.truncate(size - size % RECORD.itemsize)
+
+        self.records = size // RECORD.itemsize
+        if self.records:
+            records = self.map()
+            self.first = float(records["time"][0])
+            self.last = float(records["time"][-1])
+
+
+    def map(self):
+        return numpy.memmap(self.path, dtype=RECORD, mode="r", shape=(self.records,))
+
+
+class ObservationLog(object):
+
+    def __init__(self, directory, segment_records=DEFAULT_SEGMENT_RECORDS, batch_records=DEFAULT_BATCH_RECORDS, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.directory = directory
+        self.segment_records = segment_records
+        self.batch_records = batch_records
+        self.flush_interval = flush_interval
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.monitors = []  # Index -> MAC
+        self.monitor_indices = {}  # MAC -> index
+        monitors_path = os.path.join(directory, MONITORS_NAME)
+        if os.path.exists(monitors_path):
+            with open(monitors_path) as f:
+                for line in f:
+                    self._addMonitor(line.strip())
+        self.monitors_file = open(monitors_path, "a")
+
+        self.segments = []
+        for name in sorted(os.listdir(directory)):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                segment = Segment(os.path.join(directory, name), int(match.group(1)))
+                segment.load()
+                self.segments.append(segment)
+        if not self.segments:
+            self.segments.append(self._newSegment(0))
+        self.file = open(self.segments[-1].path, "ab")
+
+        self.pending = []  # Records not yet written
+        self.last_flush = None
+        self.last_time = self.segments[-1].last
+
+
+    def _addMonitor(self, mac):
+        self.monitor_indices[mac] = len(self.monitors)
+        self.monitors.append(mac)
+
+
+    def monitorIndex(self, mac):
+        index = self.monitor_indices.get(mac)
+        if index is None:
+            self._addMonitor(mac)
+            self.monitors_file.write(mac + "\n")
+            self.monitors_file.flush()
+            index = self.monitor_indices[mac]
+        return index
+
+
+    def _newSegment(self, number):
+        path = os.path.join(self.directory, SEGMENT_NAME % number)
+        open(path, "ab").close()
+        return Segment(path, number)
+
+
+    def append(self, mac, time, numerics):
+        """
+        Log (physio_id, state, unit_code, value) numerics, as decoded from a poll reply
+        """
+        monitor = self.monitorIndex(mac)
+        if self.last_time is not None and time < self.last_time:
+            time = self.last_time  # Queries binary search on time, so keep it in order even if the clock steps backwards
+        self.last_time = time
+
+        for physio_id, state, unit_code, value in numerics:
+            self.pending.append((time, monitor, physio_id, state, unit_code, value))
+
+        if self.last_flush is None:
+            self.last_flush = time
+        if len(self.pending) >= self.batch_records or time - self.last_flush >= self.flush_interval:
+            self.flush()
+            self.last_flush = time
+
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        records = numpy.array(self.pending, dtype=RECORD)
+        self.pending = []
+        self.file.write(records.tobytes())
+        self.file.flush()
+
+        segment = self.segments[-1]
+        if segment.first is None:
+            segment.first = float(records["time"][0])
+        segment.last = float(records["time"][-1])
+        segment.records += len(records)
+
+        if segment.records >= self.segment_records:
+            self.file.close()
+            self.segments.append(self._newSegment(segment.number + 1))
+            self.file = open(self.segments[-1].path, "ab")
+
+
+    def query(self, mac, physio_ids=None, since=None, until=None):
+        """
+        Structured RECORD arrays of mac's records (optionally, only physio_ids' codes) with since <= time <= until,
+        one per segment in range
+        """
+        monitor = self.monitor_indices.get(mac)
+        if monitor is None:
+            return []
+        self.flush()
+
+        results = []
+        for segment in self.segments:
+            if not segment.records:
+                continue
+            if (since is not None and segment.last < since) or (until is not None and segment.first > until):
+                continue
+
+            records = segment.map()
+            times = records["time"]
+            first = 0 if since is None else numpy.searchsorted(times, since, side="left")
+            last = len(records) if until is None else numpy.searchsorted(times, until, side="right")
+            records = records[first:last]
+
+            selected = records["monitor"] == monitor
+            if physio_ids is not None:
+                selected &= numpy.in1d(records["physio_id"], list(physio_ids))
+            if selected.any():
+                results.append(numpy.array(records[selected]))  # Copied, so the mapping can be closed
+            del records, times
+
+        return results
+
+
+    def stats(self):
+        return {
+            "segments": len(self.segments),
+            "records": sum(segment.records for segment in self.segments),
+            "pending": len(self.pending),
+            "monitors": len(self.monitors),
+        }
+
+
+    def close(self):
+        self.flush()
+        self.file.close()
+        self.monitors_file.close()
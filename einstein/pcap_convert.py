@@ -0,0 +1,146 @@
+"""
+Convert captures into columnar NumPy (.npz) files of decoded observations
+
+    python pcap_convert.py --output-dir observations/ --processes 8 captures/*.pcap
+
+Each capture becomes one .npz (named after it), with a row per numeric observation:
+    time        float64, seconds since the epoch
+    source      uint16, index into sources
+    physio_id   uint16
+    state       uint16, MeasurementState
+    unit_code   uint16
+    value       float64
+and, per source:
+    sources     the monitor's IP address
+    macs        its MAC address, if the capture has its ConnectIndication (otherwise "")
+
+Captures are converted in parallel, one per process;
+poll replies are walked without Scapy, and their values decoded in one batch per capture.
+With --validate, every poll reply is also dissected with the intellivue Scapy packets,
+and any that disagree are counted (and logged).
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import sys
+
+import numpy
+
+import float_type
+import intellivue as packets
+from capture import readCapture
+
+
+def convertCapture(path, output_dir, validate=False):
+    """
+    Convert one capture, returning a summary of it
+    """
+    times = []
+    sources = []
+    physio_ids = []
+    states = []
+    unit_codes = []
+    encoded = []
+
+    source_indices = {}  # Mapping of host -> index
+    macs = {}  # Mapping of host -> MAC
+    datagrams = 0
+    replies = 0
+    undecodable = 0
+    mismatches = 0
+
+    for timestamp, data, (host, _) in readCapture(path):
+        datagrams += 1
+
+        if packets.classifyDatagram(data, packets.PORT_CONNECTION_INDICATION) == packets.CONNECT_INDICATION:
+            ci = packets.dissectLazily(packets.Nomenclature, data, allow=[packets.NOM_ATTR_NET_ADDR_INFO])
+            if packets.IpAddressInfo in ci:
+                macs[host] = ci[packets.IpAddressInfo].mac_address
+            continue
+
+        try:
+            numerics = packets.decodePollReplyExtNumerics(data, raw=True)
+        except ValueError:
+            undecodable += 1
+            continue
+        if numerics is None:
+            continue
+        replies += 1
+
+        if validate and not matchesScapy(data, numerics):
+            mismatches += 1
+            sys.stderr.write("%s: poll reply at %f from %s decodes differently with Scapy\n" % (path, timestamp, host))
+
+        source = source_indices.setdefault(host, len(source_indices))
+        for physio_id, state, unit_code, value in numerics:
+            times.append(timestamp)
+            sources.append(source)
+            physio_ids.append(physio_id)
+            states.append(state)
+            unit_codes.append(unit_code)
+            encoded.append(value)
+
+    hosts = sorted(source_indices, key=source_indices.get)
+    output = os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0] + ".npz")
+    numpy.savez_compressed(
+        output,
+        time=numpy.array(times, dtype=numpy.float64),
+        source=numpy.array(sources, dtype=numpy.uint16),
+        physio_id=numpy.array(physio_ids, dtype=numpy.uint16),
+        state=numpy.array(states, dtype=numpy.uint16),
+        unit_code=numpy.array(unit_codes, dtype=numpy.uint16),
+        value=float_type.decode_many(numpy.array(encoded, dtype=numpy.uint32)),
+        sources=numpy.array(hosts, dtype=str),
+        macs=numpy.array([macs.get(host, "") for host in hosts], dtype=str),
+    )
+
+    return {
+        "capture": path,
+        "output": output,
+        "datagrams": datagrams,
+        "poll_replies": replies,
+        "observations": len(times),
+        "undecodable": undecodable,
+        "mismatches": mismatches,
+    }
+
+
+def matchesScapy(data, numerics):
+    expected = packets.pollReplyNumerics(packets.SPpdu(data))
+    if len(expected) != len(numerics):
+        return False
+    for (physio_id, state, unit_code, value), (scapy_physio_id, scapy_state, scapy_unit_code, scapy_value) in zip(numerics, expected):
+        if (physio_id, state, unit_code) != (scapy_physio_id, scapy_state, scapy_unit_code):
+            return False
+        value = float_type.decode(value)
+        if value != scapy_value and not (math.isnan(value) and math.isnan(scapy_value)):
+            return False
+    return True
+
+
+def _convert(args):
+    return convertCapture(*args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert captures into .npz files of decoded observations")
+    parser.add_argument("captures", nargs="+")
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--validate", action="store_true", help="Check every poll reply against a full Scapy dissection")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    pool = multiprocessing.Pool(args.processes)
+    try:
+        jobs = [(path, args.output_dir, args.validate) for path in args.captures]
+        for summary in pool.imap_unordered(_convert, jobs):
+            sys.stdout.write(json.dumps(summary) + "\n")
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,132 @@
+"""
+The queries behind the web API's per-monitor routes
+
+Results are JSON-serialisable, so that they can be answered either by the web server itself,
+or (when sharded) by the worker that owns the monitor, on the web server's behalf.
+Arguments are given as a Twisted request's args: a mapping of name -> list of values.
+"""
+
+import math
+
+from twisted.internet import reactor
+import attr
+
+import aggregate
+import api
+import intellivue
+import observation_log
+
+
+class BadQuery(ValueError):
+    """
+    The arguments don't make sense (400)
+    """
+
+
+class NotFound(LookupError):
+    """
+    There's no such query, or nothing to answer it with (404)
+    """
+
+
+class Unavailable(Exception):
+    """
+    Whatever would answer the query can't just now, e.g. the monitor's worker isn't running (503)
+    """
+
+
+def nullNaN(values):
+    """
+    A NumPy array's values as a list, with NaNs (which aren't JSON) as None
+    """
+    return [None if math.isnan(value) else value for value in values.tolist()]
+
+
+def timeRange(args):
+    try:
+        since = float(args['since'][0]) if 'since' in args else None
+        until = float(args['until'][0]) if 'until' in args else None
+    except ValueError:
+        raise BadQuery("since and until must be numbers")
+    return since, until
+
+
+class Queries(object):
+
+    def __init__(self, history, aggregates, obslog=None, clock=reactor):
+        self.history = history
+        self.aggregates = aggregates
+        self.obslog = obslog  # An optional observation_log.ObservationLog
+        self.clock = clock
+
+        # Mapping of name -> query
+        self.queries = {
+            "observations": self.queryObservations,
+            "log": self.queryLog,
+            "aggregates": self.queryAggregates,
+        }
+
+
+    def run(self, name, monitor_id, args):
+        if name not in self.queries:
+            raise NotFound("No such query %r" % (name,))
+        return self.queries[name](monitor_id, args)
+
+
+    def queryObservations(self, monitor_id, args):
+        """
+        Recent observations, optionally restricted to physio_id(s) and to times (in seconds since the epoch) since/until
+        """
+        since, until = timeRange(args)
+        results = self.history.query(monitor_id, args.get('physio_id'), since, until)
+
+        return {
+            "monitor_id": monitor_id,
+            "observations": dict(
+                (physio_id, {"times": times.tolist(), "values": nullNaN(values)})
+                for (physio_id, (times, values)) in results.items()
+            ),
+        }
+
+
+    def queryLog(self, monitor_id, args):
+        """
+        Logged observations (if there's an observation log),
+        optionally restricted to physio_id(s) and to times (in seconds since the epoch) since/until
+        """
+        if self.obslog is None:
+            raise NotFound("There's no observation log")
+
+        since, until = timeRange(args)
+        physio_ids = args.get('physio_id')
+        if physio_ids is not None:
+            try:
+                physio_ids = [observation_log.identifierCode(physio_id) for physio_id in physio_ids]
+            except ValueError:
+                raise BadQuery("Unknown physio_id")
+
+        observations = {}
+        for records in self.obslog.query(monitor_id, physio_ids, since, until):
+            for time, _, physio_id, state, unit_code, value in records.tolist():
+                series = observations.setdefault(intellivue.IDENTIFIER_LABELS[physio_id], {"times": [], "states": [], "unit_codes": [], "values": []})
+                series["times"].append(time)
+                series["states"].append(intellivue.MEASUREMENT_STATES[state][0])
+                series["unit_codes"].append(intellivue.IDENTIFIER_LABELS[unit_code])
+                series["values"].append(None if math.isnan(value) else value)
+
+        return {"monitor_id": monitor_id, "observations": observations}
+
+
+    def queryAggregates(self, monitor_id, args):
+        """
+        Rolling count/mean/min/max over the last window (one of aggregate.WINDOWS) seconds, optionally restricted to physio_id(s)
+        """
+        try:
+            window = int(args.get('window', [60])[0])
+        except ValueError:
+            window = None
+        if window not in aggregate.WINDOWS:
+            raise BadQuery("window must be one of %r" % (aggregate.WINDOWS,))
+
+        aggregates = self.aggregates.query(monitor_id, window, self.clock.seconds(), args.get('physio_id'))
+        return attr.asdict(api.AggregatePayload(monitor_id=monitor_id, window=window, aggregates=aggregates))
@@ -0,0 +1,212 @@
+"""
+Replay a capture into IntellivueInterface, without monitors (or the network)
+
+    python replay.py dump.pcap --speed 10 --monitors 100 --subscribers 2
+
+Datagrams are fed to IntellivueInterface.datagramReceived with their original timing
+(scaled by --speed), or as fast as possible (--speed 0, the default),
+optionally fanned out to --monitors synthetic monitors, each with its own address and MAC.
+The interface's clock follows the capture's timestamps, so replays are repeatable.
+
+Nothing is sent: the interface writes to a transport that only counts,
+and webhooks are counted rather than delivered.
+
+Reports (as JSON) throughput, latency per stage (datagram class), and allocations.
+Captures can be those made by capture.CaptureWriter, or older ones of bare Scapy packets.
+"""
+
+import argparse
+import gc
+import json
+import resource
+import sys
+import time
+
+from scapy.utils import mac2str
+from twisted.internet import task
+import structlog
+
+import api
+import intellivue as packets
+import server
+import tracker
+from capture import readCapture
+
+class CountingTransport(object):
+
+    def __init__(self, port=packets.PORT_CONNECTION_INDICATION):
+        self.written = 0
+        self.port = port
+
+    def write(self, data, addr=None):
+        self.written += 1
+
+    def getHost(self):
+        return type("Host", (object,), {"host": "0.0.0.0", "port": self.port})()
+
+
+class CountingWebhooks(object):
+
+    def __init__(self):
+        self.delivered = 0
+        self.bytes = 0
+
+    def deliver(self, subscription, body, headers=None):
+        self.delivered += 1
+        self.bytes += len(body)
+
+    def stats(self):
+        return {"delivered": self.delivered, "bytes": self.bytes}
+
+    def close(self):
+        pass
+
+
+class StageTimer(object):
+    """
+    Wraps a handler, timing its calls
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.durations = []
+
+    def __call__(self, data, addr):
+        start = time.time()
+        self.handler(data, addr)
+        self.durations.append(time.time() - start)
+
+
+def dropBelowWarning(logger, method_name, event_dict):
+    if method_name in ("debug", "info"):
+        raise structlog.DropEvent
+    return event_dict
+
+
+def summarise(durations):
+    if not durations:
+        return None
+    durations = sorted(durations)
+    return {
+        "count": len(durations),
+        "mean_us": 1e6 * sum(durations) / len(durations),
+        "p50_us": 1e6 * durations[len(durations) // 2],
+        "p99_us": 1e6 * durations[min(len(durations) - 1, int(len(durations) * 0.99))],
+        "max_us": 1e6 * durations[-1],
+    }
+
+
+class Replay(object):
+
+    def __init__(self, monitors=1, subscribers=0):
+        self.clock = task.Clock()
+        self.webhooks = CountingWebhooks()
+        self.interface = server.IntellivueInterface(
+            webhooks=self.webhooks,
+            tracker=tracker.RequestTracker(clock=self.clock, unsolicited=True),  # The capture's replies aren't to our polls
+            clock=self.clock,
+        )
+        self.interface.transport = CountingTransport()
+
+        self.timers = {}
+        for kind, handler in self.interface.handlers.items():
+            self.timers[kind] = self.interface.handlers[kind] = StageTimer(handler)
+        self.interface.handleUnknownDatagram = self.timers[packets.UNKNOWN] = StageTimer(self.interface.handleUnknownDatagram)
+
+        self.monitors = monitors
+        self.subscribers = subscribers
+        self.datagrams = 0
+
+        for copy in range(monitors):
+            host, mac = self.syntheticHost(copy), self.syntheticMac(copy)
+            self.interface.host_to_mac[host] = mac
+            for n in range(subscribers):
+                self.interface.subscriptions.add(api.Subscription(monitor_id=mac, url="http://replay.invalid/%d" % n))
+
+
+    def syntheticHost(self, copy):
+        return "10.%d.%d.%d" % (copy >> 16 & 0xff, copy >> 8 & 0xff, copy & 0xff)
+
+
+    def syntheticMac(self, copy):
+        return "02:00:00:%02x:%02x:%02x" % (copy >> 16 & 0xff, copy >> 8 & 0xff, copy & 0xff)
+
+
+    def fanOut(self, data, src):
+        """
+        Yield (datagram, source address) for each synthetic monitor
+        """
+        mac = None
+        if packets.classifyDatagram(data, packets.PORT_CONNECTION_INDICATION) == packets.CONNECT_INDICATION:
+            ci = packets.dissectLazily(packets.Nomenclature, data, allow=[packets.NOM_ATTR_NET_ADDR_INFO])
+            if packets.IpAddressInfo in ci:
+                mac = mac2str(ci[packets.IpAddressInfo].mac_address)
+
+        for copy in range(self.monitors):
+            copied = data
+            if mac is not None:
+                copied = data.replace(mac, mac2str(self.syntheticMac(copy)))
+            yield copied, (self.syntheticHost(copy), src[1])
+
+
+    def run(self, capture, speed=0, loops=1):
+        objects = len(gc.get_objects())
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+
+        first = None
+        offset = 0
+        for loop in range(loops):
+            last = None
+            for timestamp, data, src in readCapture(capture):
+                if first is None:
+                    first = timestamp
+                    self.clock.advance(timestamp)
+                last = timestamp
+
+                replay_time = timestamp + offset
+                if speed:
+                    wait = (replay_time - first) / speed - (time.time() - start)
+                    if wait > 0:
+                        time.sleep(wait)
+                self.clock.advance(max(0, replay_time - self.clock.seconds()))
+
+                for copied, addr in self.fanOut(data, src):
+                    self.interface.datagramReceived(copied, addr)
+                    self.datagrams += 1
+            if last is not None:
+                offset += last - first + 1
+
+        elapsed = time.time() - start
+        gc.collect()
+        return {
+            "datagrams": self.datagrams,
+            "elapsed_s": elapsed,
+            "datagrams_per_s": self.datagrams / elapsed if elapsed else None,
+            "stages": dict((kind, summarise(timer.durations)) for (kind, timer) in self.timers.items() if timer.durations),
+            "objects_retained": len(gc.get_objects()) - objects,
+            "maxrss_growth_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - maxrss,
+            "sent": self.interface.transport.written,
+            "webhooks": self.webhooks.stats(),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a capture into IntellivueInterface")
+    parser.add_argument("capture")
+    parser.add_argument("--speed", type=float, default=0, help="Multiple of the original speed, or 0 for as fast as possible")
+    parser.add_argument("--monitors", type=int, default=1, help="Synthetic monitors to fan the capture out to")
+    parser.add_argument("--subscribers", type=int, default=0, help="Webhook subscriptions per synthetic monitor")
+    parser.add_argument("--loops", type=int, default=1, help="Times to replay the capture")
+    parser.add_argument("--verbose", action="store_true", help="Keep debug and info logging (which is timed along with everything else)")
+    args = parser.parse_args()
+
+    # Logs go to stderr, leaving stdout for the report
+    processors = structlog.get_config()["processors"]
+    if not args.verbose:
+        processors = [dropBelowWarning] + processors
+    structlog.configure(processors=processors, logger_factory=structlog.PrintLoggerFactory(sys.stderr))
+
+    report = Replay(monitors=args.monitors, subscribers=args.subscribers).run(args.capture, speed=args.speed, loops=args.loops)
+    json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write("\n")
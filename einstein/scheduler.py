@@ -0,0 +1,162 @@
+"""
+Per-monitor poll scheduling
+
+Rather than polling every monitor in the same tick, each monitor is polled on its own timer,
+with its phase spread across the poll interval (by the golden ratio, which stays even however many monitors join),
+so requests (and replies) arrive steadily instead of in bursts.
+
+A poll isn't sent while the monitor's previous one is still outstanding (for up to reply_timeout),
+and a monitor that stops replying is polled (exponentially) less often until it replies again.
+
+Monitors whose data nobody wants just now (see demand) are only polled every idle_interval, to keep them alive.
+"""
+
+from twisted.internet import reactor
+import structlog
+
+log = structlog.get_logger()
+
+
+DEFAULT_INTERVAL = 2  # Seconds
+DEFAULT_REPLY_TIMEOUT = 5  # Seconds before an outstanding poll is given up on
+DEFAULT_MAX_INTERVAL = 60  # Seconds; the longest backoff
+DEFAULT_IDLE_INTERVAL = 8  # Seconds; under lifecycle's keepalive_after, so these polls are the keep-alives
+
+GOLDEN_RATIO_CONJUGATE = 0.6180339887498949
+
+
+class PollTarget(object):
+
+    def __init__(self, host, interval, wanted=True):
+        self.host = host
+        self.interval = interval
+        self.wanted = wanted  # Whether its data's wanted, or it's only polled to keep it alive
+        self.call = None  # The next poll's DelayedCall
+        self.sent_at = None  # When the outstanding poll (if any) was sent
+        self.misses = 0  # Consecutive polls given up on
+        self.poll_number = 0
+
+
+    @property
+    def outstanding(self):
+        return self.sent_at is not None
+
+
+class PollScheduler(object):
+    """
+    Calls send(host, poll_number) for each monitor added, on its own schedule;
+    send returns whether it sent the poll (send is usually set by the IntellivueInterface the scheduler's given to)
+    """
+
+    def __init__(self, clock=reactor, interval=DEFAULT_INTERVAL, reply_timeout=DEFAULT_REPLY_TIMEOUT, max_interval=DEFAULT_MAX_INTERVAL, idle_interval=DEFAULT_IDLE_INTERVAL, send=None):
+        self.send = send
+        self.clock = clock
+        self.interval = interval
+        self.reply_timeout = reply_timeout
+        self.max_interval = max_interval
+        self.idle_interval = idle_interval
+
+        self.targets = {}  # Mapping of host -> PollTarget
+        self.added = 0  # Monitors ever added, for spreading phases
+
+        self.sent = 0
+        self.skipped = 0
+        self.missed = 0
+        self.unsent = 0  # Polls send declined to send (e.g. too many requests in flight)
+
+
+    def add(self, host, interval=None, wanted=True):
+        if host in self.targets:
+            return
+
+        target = self.targets[host] = PollTarget(host, interval or self.interval, wanted)
+        target.call = self.clock.callLater(self.phase() * self.base(target), self.poll, target)
+
+
+    def phase(self):
+        phase = (self.added * GOLDEN_RATIO_CONJUGATE) % 1
+        self.added += 1
+        return phase
+
+
+    def remove(self, host):
+        target = self.targets.pop(host, None)
+        if target is not None and target.call.active():
+            target.call.cancel()
+
+
+    def setWanted(self, host, wanted):
+        """
+        Poll host at its full rate if its data's wanted, otherwise every idle_interval;
+        a monitor that's newly wanted is polled within its (full) interval, rather than waiting out the idle one
+        """
+        target = self.targets.get(host)
+        if target is None or target.wanted == wanted:
+            return
+
+        target.wanted = wanted
+        log.debug("Monitor's poll rate changed", host=host, wanted=wanted, interval=self.base(target))
+        if wanted and not target.misses and target.call.active() and target.call.getTime() - self.clock.seconds() > target.interval:
+            target.call.reset(self.phase() * target.interval)
+
+
+    def replied(self, host):
+        target = self.targets.get(host)
+        if target is None:
+            return
+        if target.misses:
+            log.info("Monitor replying again", host=host, misses=target.misses)
+            if target.call.active():
+                target.call.reset(self.base(target))  # Rather than waiting out the backoff
+        target.sent_at = None
+        target.misses = 0
+
+
+    def poll(self, target):
+        now = self.clock.seconds()
+
+        if target.outstanding and not target.misses and now - target.sent_at < self.reply_timeout:
+            self.skipped += 1
+        else:
+            if target.outstanding:
+                target.misses += 1
+                self.missed += 1
+                log.warning("Poll unanswered, backing off", host=target.host, misses=target.misses)
+
+            poll_number = (target.poll_number + 1) & 0xffff
+            if self.send(target.host, poll_number):
+                target.poll_number = poll_number
+                target.sent_at = now
+                self.sent += 1
+            else:
+                self.unsent += 1
+
+        target.call = self.clock.callLater(self.delay(target), self.poll, target)
+
+
+    def base(self, target):
+        if target.wanted:
+            return target.interval
+        return max(self.idle_interval, target.interval)
+
+
+    def delay(self, target):
+        interval = self.base(target)
+        return min(interval * 2 ** target.misses, max(self.max_interval, interval))
+
+
+    def stop(self):
+        for host in self.targets.keys():
+            self.remove(host)
+
+
+    def stats(self):
+        return {
+            "monitors": len(self.targets),
+            "idle": sum(1 for target in self.targets.values() if not target.wanted),
+            "backing_off": sum(1 for target in self.targets.values() if target.misses),
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "missed": self.missed,
+            "unsent": self.unsent,
+        }
@@ -0,0 +1,121 @@
+"""
+Webhook body serialisation
+
+A Payload is serialised once per poll and shared by every subscription it's delivered to,
+along with any content-encoded variants of it, which are only made if some subscription asks for them.
+"""
+
+import json
+import operator
+import zlib
+
+import attr
+
+import api
+from util import json_serialize
+
+
+GZIP = "gzip"
+CONTENT_ENCODINGS = (None, GZIP)
+
+JSON_HEADERS = {b'Content-Type': [b'application/json']}
+GZIP_HEADERS = {b'Content-Type': [b'application/json'], b'Content-Encoding': [b'gzip']}
+
+_encoder = json.JSONEncoder(default=json_serialize)
+
+
+def _compileAsDict(cls):
+    """
+    An attr.asdict for instances of cls, without its generic recursion and per-field checks.
+    Nested attrs instances must be handled by the caller.
+    """
+    names = tuple(field.name for field in attr.fields(cls))
+    values = operator.attrgetter(*names)
+    return lambda instance: dict(zip(names, values(instance)))
+
+
+observationAsDict = _compileAsDict(api.Observation)
+_payloadAsDict = _compileAsDict(api.Payload)
+aggregateAsDict = _compileAsDict(api.Aggregate)
+_aggregatePayloadAsDict = _compileAsDict(api.AggregatePayload)
+
+
+def payloadAsDict(payload):
+    """
+    The equivalent of attr.asdict(payload), for JSON serialisation
+    """
+    d = _payloadAsDict(payload)
+    d["observations"] = [observationAsDict(observation) for observation in payload.observations]
+    return d
+
+
+def aggregatePayloadAsDict(payload):
+    """
+    The equivalent of attr.asdict(payload), for JSON serialisation
+    """
+    d = _aggregatePayloadAsDict(payload)
+    d["aggregates"] = [aggregateAsDict(aggregate) for aggregate in payload.aggregates]
+    return d
+
+
+def gzipCompress(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # 16 + selects the gzip container
+    return compressor.compress(data) + compressor.flush()
+
+
+class SerializedPayload(object):
+    """
+    A Payload's (or, given aggregatePayloadAsDict, an AggregatePayload's) JSON,
+    and its content-encoded variants, each made at most once
+    """
+
+    def __init__(self, payload, asDict=payloadAsDict):
+        self.payload = payload
+        self.asDict = asDict
+        self._encoded = {}
+
+
+    @classmethod
+    def fromJSON(cls, body):
+        """
+        One that's already been serialised (elsewhere, e.g. by a shards worker)
+        """
+        serialized = cls(None)
+        serialized._encoded[None] = body
+        return serialized
+
+
+    @property
+    def json(self):
+        body = self._encoded.get(None)
+        if body is None:
+            body = self._encoded[None] = _encoder.encode(self.asDict(self.payload))
+        return body
+
+
+    def encoded(self, content_encoding=None):
+        """
+        The body and headers to deliver with content_encoding (None for plain JSON)
+        """
+        if content_encoding is None:
+            return self.json, JSON_HEADERS
+
+        if content_encoding != GZIP:
+            raise ValueError("Unknown content encoding %r" % (content_encoding,))
+
+        body = self._encoded.get(GZIP)
+        if body is None:
+            body = self._encoded[GZIP] = gzipCompress(self.json)
+        return body, GZIP_HEADERS
+
+
+def batchEncoded(bodies, content_encoding=None):
+    """
+    The body and headers to deliver a batch with: a JSON array of already serialised payloads
+    """
+    body = "[" + ",".join(bodies) + "]"
+    if content_encoding is None:
+        return body, JSON_HEADERS
+    elif content_encoding == GZIP:
+        return gzipCompress(body), GZIP_HEADERS
+    raise ValueError("Unknown content encoding %r" % (content_encoding,))
@@ -1,18 +1,29 @@
 from twisted.internet.protocol import DatagramProtocol
 from twisted.internet import reactor
-from twisted.internet.task import LoopingCall
 from twisted.web import server
+import aggregate
 import api
+import capture as capture_
+import collections
 import datetime
-import json
+import decoding
+import demand as demand_
+import delivery
+import filters
+import history as history_
+import lifecycle as lifecycle_
+import observation_log
+import os
+import scheduler as scheduler_
 import socket
 import intellivue as packets
-import treq
+import serialize
+import streams as streams_
+import subscriptions as registry
+import tracker as tracker_
 import web
-from util import json_serialize
 import attr
 import structlog
-from scapy.utils import wrpcap
 
 log = structlog.get_logger()
 
@@ -31,44 +42,150 @@ class IntellivueInterface(DatagramProtocol):
     and instead an internal DIY "ARP-alike" mapping is maintained.
     """
 
-    def __init__(self, monitors=None, subscriptions=None, dumpfilename=None):
+    def __init__(self, monitors=None, subscriptions=None, dumpfilename=None, stats=None, webhooks=None, streams=None, history=None, aggregates=None, obslog=None, capture=None, scheduler=None, tracker=None, lifecycle=None, decoder=None, priority_lists=False, poll_intervals=None, clock=reactor):
         self.monitors = monitors
         if self.monitors is None:
             self.monitors = {}  # Mapping of MAC -> api.Monitor
 
         self.subscriptions = subscriptions
         if self.subscriptions is None:
-            self.subscriptions = {}  # Mapping of SubscriptionId -> Subscription
-
-        self.dumpfilename = dumpfilename
+            self.subscriptions = registry.SubscriptionRegistry()  # Mapping of SubscriptionId -> Subscription, indexed by monitor
+
+        self.filters = filters.ObservationFilters()
+        self.subscriptions.observe(self.filters)
+
+        self.clock = clock
+
+        self.stats = stats
+        if self.stats is None:
+            self.stats = {}  # Mapping of name -> JSON-serialisable statistics, shared with the web server
+
+        self.capture = capture
+        if self.capture is None and dumpfilename is not None:
+            self.capture = capture_.CaptureWriter(dumpfilename, clock=clock)
+        if self.capture is not None:
+            self.stats["capture"] = self.capture.stats
+
+        self.datagramCounts = collections.Counter()  # Mapping of packets.classifyDatagram class -> count
+        self.stats["datagrams"] = self.datagramCounts
+
+        self.webhooks = webhooks
+        if self.webhooks is None:
+            self.webhooks = delivery.WebhookDelivery()
+        self.stats["webhooks"] = self.webhooks.stats
+
+        self.batches = delivery.WebhookBatches(self.webhooks, clock=clock)
+        self.subscriptions.observe(self.batches)
+        self.stats["webhook_batches"] = self.batches.stats
+
+        self.streams = streams
+        if self.streams is None:
+            self.streams = streams_.StreamHub()  # Shared with the web server
+        self.stats["streams"] = self.streams.stats
+
+        self.history = history
+        if self.history is None:
+            self.history = history_.ObservationHistory()  # Shared with the web server
+        self.stats["history"] = self.history.stats
+
+        self.aggregates = aggregates
+        if self.aggregates is None:
+            self.aggregates = aggregate.Aggregates()  # Shared with the web server
+        self.stats["aggregates"] = self.aggregates.stats
+
+        self.obslog = obslog  # An optional observation_log.ObservationLog
+        if self.obslog is not None:
+            self.stats["observation_log"] = self.obslog.stats
+
+        self.scheduler = scheduler
+        if self.scheduler is None:
+            self.scheduler = scheduler_.PollScheduler(clock=clock)
+        self.scheduler.send = self.pollHost
+        self.poll_intervals = poll_intervals or {}  # Mapping of MAC -> seconds, for monitors not polled every scheduler.interval
+        self.stats["polls"] = self.scheduler.stats
+
+        self.tracker = tracker
+        if self.tracker is None:
+            self.tracker = tracker_.RequestTracker(clock=clock)
+        self.stats["requests"] = self.tracker.stats
+
+        self.lifecycle = lifecycle
+        if self.lifecycle is None:
+            self.lifecycle = lifecycle_.MonitorLifecycle(clock=clock)
+        self.lifecycle.handler = self
+        self.stats["associations"] = self.lifecycle.stats
+
+        self.decoder = decoder
+        if self.decoder is None:
+            self.decoder = decoding.InlineDecoder(clock=clock)
+        self.stats["decoding"] = self.decoder.stats
 
         self.host_to_mac = {}
-        self.associations = set()
-        self.connections = set()
+
+        # Only monitors whose data's wanted are polled at the full rate
+        self.demand = demand_.PollDemand(self.scheduler, self.subscriptions, self.streams, self.host_to_mac, retained=self.obslog is not None)
+        self.stats["demand"] = self.demand.stats
+
+        # Optionally, monitors only send the numerics their subscriptions want (see demand.PriorityLists)
+        self.priority_lists = None
+        poll_options = packets.DEFAULT_POLL_OPTIONS
+        if priority_lists:
+            self.priority_lists = demand_.PriorityLists(self.subscriptions, self.streams, self.host_to_mac, retained=self.obslog is not None, clock=clock, handler=self)
+            self.stats["priority_lists"] = self.priority_lists.stats
+            poll_options |= packets.POLL_EXT_NU_PRIO_LIST
+
+        # Mapping of packets.classifyDatagram class -> handler
+        self.handlers = {
+            packets.CONNECT_INDICATION: self.handleConnectionIndication,
+            packets.REMOTE_OPERATION_DATAGRAMS[(packets.ROIV_APDU, packets.CMD_CONFIRMED_EVENT_REPORT)]: self.handleEventReport,
+            packets.REMOTE_OPERATION_DATAGRAMS[(packets.RORS_APDU, packets.CMD_CONFIRMED_ACTION)]: self.handleActionResult,
+            packets.REMOTE_OPERATION_DATAGRAMS[(packets.ROLRS_APDU, packets.CMD_CONFIRMED_ACTION)]: self.handleActionResult,
+            packets.REMOTE_OPERATION_DATAGRAMS[(packets.RORS_APDU, packets.CMD_GET)]: self.handlePriorityListResult,
+            packets.REMOTE_OPERATION_DATAGRAMS[(packets.RORS_APDU, packets.CMD_CONFIRMED_SET)]: self.handlePriorityListResult,
+            packets.REMOTE_OPERATION_DATAGRAMS[(packets.ROER_APDU, None)]: self.handleRemoteOperationError,
+            packets.UNKNOWN_REMOTE_OPERATION: self.handleProtocolMessage,
+        }
+        for kind in packets.SESSION_DATAGRAMS.values():
+            self.handlers[kind] = self.handleAssociationMessage
+        for kind in packets.REMOTE_OPERATION_DATAGRAMS.values():
+            self.handlers.setdefault(kind, self.handleProtocolMessage)
+
+        self.host = "0.0.0.0"  # The local address and port we're listening on, once we are
+        self.port = packets.PORT_CONNECTION_INDICATION
+
+        # Requests are serialised once, then sent (or patched and sent) as bytes
+        self.associationRequest = packets.makeAssociationRequest(poll_options)
+        self.pollTemplate = packets.PollActionTemplate()
 
 
     def datagramReceived(self, data, addr):
         log.debug("Datagram received!", addr=addr)
 
-        if port == packets.PORT_CONNECTION_INDICATION:
-            self.handleConnectionIndication(data, addr)
-        else:
-            if data[0:2] == '\xe1\x00':  # PIPG-42
-                self.handleProtocolMessage(data, addr)
-            else:
-                self.handleAssociationMessage(data, addr)
+        if self.capture is not None:
+            self.capture.write(data, addr, (self.host, self.port))
 
+        self.lifecycle.seen(addr[0])
 
-    def logPacket(self, packet):
-        if self.dumpfilename is not None:
-            wrpcap(self.dumpfilename, packet, append=True)
+        kind = packets.classifyDatagram(data, self.port)
+        self.datagramCounts[kind] += 1
+        self.handlers.get(kind, self.handleUnknownDatagram)(data, addr)
 
 
-    def handleConnectionIndication(self, data, addr):
-        ci = packets.ConnectIndication()
-        ci.dissect(data)
+    def connectIndicationReceived(self, data, addr):
+        """
+        A ConnectIndication received elsewhere, and passed on (by a shards front end)
+        """
+        self.lifecycle.seen(addr[0])
+        self.datagramCounts[packets.CONNECT_INDICATION] += 1
+        self.handleConnectionIndication(data, addr)
+
 
-        self.logPacket(ci)
+    def handleUnknownDatagram(self, data, addr):
+        log.warning("Dropping unrecognised datagram", addr=addr, data=data[:16])
+
+
+    def handleConnectionIndication(self, data, addr):
+        ci = packets.dissectLazily(packets.Nomenclature, data, allow=[packets.NOM_ATTR_NET_ADDR_INFO])
 
         mac_address = ""
         if packets.IpAddressInfo in ci:
@@ -85,45 +202,48 @@ class IntellivueInterface(DatagramProtocol):
         if self.monitors is not None:
             self.monitors[mac_address] = api.Monitor(mac_address=mac_address, host=host, port=port, last_seen=datetime.datetime.now())
 
-        if host not in self.associations:
-            log.info("Initiating Association!", mac_address=mac_address, host=host)
-            self.sendAssociationRequest((host, packets.PORT_PROTOCOL))
+        self.lifecycle.discovered(host)
 
 
     def sendAssociationRequest(self, addr):
-        associationRequest = packets.SessionHeader(type=packets.CN_SPDU_SI)
-        associationRequest /= packets.AssocReqSessionData()
-        associationRequest /= packets.AssocReqPresentationHeaderHeader()
-        associationRequest /= packets.AssocReqPresentationHeaderData()
-        associationRequest /= packets.AssocReqUserData(
-            MDSEUserInfoStd=packets.MDSEUserInfoStd(
-                supported_aprofiles=packets.AttributeList(
-                    value=[
-                        packets.AVAType(
-                            attribute_id=packets.NOM_POLL_PROFILE_SUPPORT,
-                        ) /
-                        packets.PollProfileSupport(
-                            optional_packages=packets.AttributeList(
-                                value=[
-                                    packets.AVAType(
-                                        attribute_id=packets.NOM_ATTR_POLL_PROFILE_EXT,
-                                    ) /
-                                    packets.PollProfileExt(
-                                        options=packets.POLL_EXT_PERIOD_NU_1SEC|packets.POLL_EXT_PERIOD_RTSA|packets.POLL_EXT_ENUM,
-                                    ),
-                                ],
-                            ),
-                        ),
-                    ],
-                ),
-            ),
-        )
-        associationRequest /= packets.AssocReqPresentationTrailer()
+        self.transport.write(self.associationRequest, addr)
+
+
+    def associate(self, host):
+        log.info("Initiating Association!", mac_address=self.host_to_mac.get(host), host=host)
+        self.sendAssociationRequest((host, packets.PORT_PROTOCOL))
 
-        associationRequest.show()
-        associationRequest.show2()
 
-        self.transport.write(str(associationRequest), addr)
+    def release(self, host):
+        log.info("Releasing Association", host=host)
+        try:
+            self.transport.write(packets.ReleaseRequest, (host, packets.PORT_PROTOCOL))
+        except socket.error:
+            log.warning("Could not send ReleaseRequest", host=host, exc_info=True)
+
+
+    def keepAlive(self, host):
+        self.pollHost(host, 0)
+
+
+    def monitorConnected(self, host):
+        interval = self.poll_intervals.get(self.host_to_mac.get(host))
+        self.scheduler.add(host, interval=interval, wanted=self.demand.wanted(host))
+        if self.priority_lists is not None:
+            self.priority_lists.connected(host)
+
+
+    def monitorDisconnected(self, host):
+        self.scheduler.remove(host)
+        self.tracker.forget(host)
+        if self.priority_lists is not None:
+            self.priority_lists.forget(host)
+
+
+    def monitorForgotten(self, host):
+        mac = self.host_to_mac.pop(host, None)
+        if mac is not None and mac in self.monitors and self.monitors[mac].host == host:
+            del self.monitors[mac]
 
 
     def handleAssociationMessage(self, data, addr):
@@ -133,95 +253,140 @@ class IntellivueInterface(DatagramProtocol):
         associationMessage.dissect(data)
         associationMessage.show()
 
-        self.logPacket(associationMessage)
-
         t = associationMessage.type
         host, _ = addr
         if t == packets.AC_SPDU_SI:
             log.info("Received Association Confirmation!", host=host)
-            self.associations.add(host)
+            self.lifecycle.associated(host)
         elif t in [packets.RF_SPDU_SI, packets.FN_SPDU_SI, packets.DN_SPDU_SI, packets.AB_SPDU_SI]:
             log.info("Dropping Association", host=host)
-            self.associations.discard(host)
+            self.lifecycle.dropped(host)
 
         # TODO Properly validate response, rejection, etc.
 
 
-    def handleProtocolMessage(self, data, addr):
-        log.debug("Received Protocol message, handling")
-        message = packets.SPpdu()
-        message.dissect(data)
+    def handleEventReport(self, data, addr):
+        message = packets.dissectLazily(packets.SPpdu, data)
+
+        host, _ = addr
 
-        self.logPacket(message)
+        log.info("Received MDSCreateEventReport, sending MDSCreateEventResult", addr=addr)
 
+        # Ok! Now to reply!
+
+        mdsceResult = packets.SPpdu()
+        mdsceResult = mdsceResult / packets.ROapdus(ro_type=packets.RORS_APDU)
+        mdsceResult = mdsceResult / packets.RORSapdu(
+            command_type=packets.CMD_CONFIRMED_EVENT_REPORT,
+            invoke_id=message[packets.ROIVapdu].invoke_id,
+        )
+        mdsceResult = mdsceResult / packets.EventReportResult(
+            managed_object=message[packets.EventReportArgument].managed_object,
+            event_type=packets.NOM_NOTI_MDS_CREAT,
+        )
+
+        self.transport.write(str(mdsceResult), addr)
+
+        self.lifecycle.connected(host)
+
+
+    def handleActionResult(self, data, addr):
+        """
+        Results (RORSapdu) and linked results (ROLRSapdu) - in practice, replies to our polls
+        """
         host, _ = addr
+        self.scheduler.replied(host)
+        ids = packets.remoteOperationIds(data)
+        self.decoder.submit(host, data, lambda host, decoded: self.handleDecodedResult(host, decoded, ids))
+
+
+    def handleDecodedResult(self, host, decoded, ids=None):
+        """
+        An action result, from the decoder (see decoding.decodeActionResult);
+        if it couldn't be decoded, its ids (see packets.remoteOperationIds) still end its request
+        """
+        if decoded is None:
+            log.warning("Dropping undecodable action result", host=host)
+            if ids is not None and ids[0] != packets.ROLRS_APDU:
+                self.tracker.failed(host, ids[1])
+            return
 
-        if packets.ROIVapdu in message:
-            roivapdu = message[packets.ROIVapdu]
+        ro_type, invoke_id, linked_state, linked_count, numerics = decoded
+        if numerics is None:
+            log.warning("Unknown action result!", host=host, invoke_id=invoke_id)
+            numerics = []  # It still ends its request
 
-            if roivapdu.command_type == packets.CMD_CONFIRMED_EVENT_REPORT:
-                log.info("Received MDSCreateEventReport, sending MDSCreateEventResult", addr=addr)
+        if ro_type == packets.ROLRS_APDU:
+            self.tracker.linked(host, invoke_id, linked_state, linked_count, numerics)
+            return
 
-                # Ok! Now to reply!
+        numerics = self.tracker.result(host, invoke_id, numerics)
+        if numerics is not None:
+            self.handleNumerics(host, numerics)
 
-                mdsceResult = packets.SPpdu()
-                mdsceResult = mdsceResult / packets.ROapdus(ro_type=packets.RORS_APDU)
-                mdsceResult = mdsceResult / packets.RORSapdu(
-                    command_type=packets.CMD_CONFIRMED_EVENT_REPORT,
-                    invoke_id=message[packets.ROIVapdu].invoke_id,
-                )
-                mdsceResult = mdsceResult / packets.EventReportResult(
-                    managed_object=message[packets.EventReportArgument].managed_object,
-                    event_type=packets.NOM_NOTI_MDS_CREAT,
-                )
 
-                self.transport.write(str(mdsceResult), addr)
-
-                self.connections.add(host)
-            else:
-                log.warning("Unknown command_type in roivapdu!", addr=addr, roivapdu=roivapdu)
-                roivapdu.show()
-        elif packets.ROLRSapdu in message:
-            # TODO Implement support for rolling up Remote Operation Linked Results
-            log.debug("ROLRSapdu!")
-            # message.show()
-            self.handleResult(host, message)
-        elif packets.ROERapdu in message:
-            # Error
-            message[packets.ROERapdu].show()
-        elif packets.RORSapdu in message:
-            log.debug("Results!")
-            # message.show()
-            self.handleResult(host, message)
-        else:
-            log.warning("Unknown message!")
-            message.show()
+    def handleRemoteOperationError(self, data, addr):
+        message = packets.dissectLazily(packets.SPpdu, data)
 
+        log.warning("Received remote operation error", addr=addr, error_value=message[packets.ROERapdu].error_value)
 
-    def pollConnectedHostsForData(self):
-        for host in self.connections:
-            self.pollForData((host, packets.PORT_PROTOCOL))
+        host, _ = addr
+        self.tracker.error(host, message[packets.ROERapdu].invoke_id)
+        if self.priority_lists is not None:
+            self.priority_lists.failed(host, message[packets.ROERapdu].invoke_id)
 
 
-    def pollForData(self, addr):
-        pollAction = packets.SPpdu()  # PIPG-55
-        pollAction /= packets.ROapdus(ro_type=packets.ROIV_APDU)
-        pollAction /= packets.ROIVapdu(command_type=packets.CMD_CONFIRMED_ACTION)
-        pollAction /= packets.ActionArgument(
-            managed_object=packets.ManagedObjectId(m_obj_class=packets.NOM_MOC_VMS_MDS),
-            action_type=packets.NOM_ACT_POLL_MDIB_DATA_EXT,
-        )
-        pollAction /= packets.PollMdibDataReqExt(
-            polled_obj_type=packets.TYPE(
-                partition=packets.NOM_PART_OBJ,
-                code=packets.NOM_MOC_VMO_METRIC_NU,  # Numerics, i.e. numbers about attached patient
-            ),
-            polled_attr_grp=packets.NOM_ATTR_GRP_METRIC_VAL_OBS,  # Observed values of the "object" (patient)
-        )
+    def handlePriorityListResult(self, data, addr):
+        """
+        A GetResult or SetResult, which we only ask for priority lists with
+        """
+        message = packets.dissectLazily(packets.SPpdu, data, allow=[packets.NOM_ATTR_POLL_NU_PRIO_LIST])
+        invoke_id = message[packets.RORSapdu].invoke_id
+
+        host, _ = addr
+        if self.tracker.result(host, invoke_id, []) is None or self.priority_lists is None:
+            return
+        self.priority_lists.received(host, invoke_id, packets.priorityListPhysioIds(message))
+
+
+    def handleProtocolMessage(self, data, addr):
+        """
+        Any protocol message there isn't a more specific handler for
+        """
+        message = packets.dissectLazily(packets.SPpdu, data)
+
+        log.warning("Unknown message!", addr=addr)
+        message.show()
+
+
+    def pollHost(self, host, poll_number):
+        """
+        Returns whether the poll was sent
+        """
+        invoke_id = self.tracker.send(host)
+        if invoke_id is None:
+            log.debug("Too many requests in flight, not polling", host=host)
+            return False
+        self.pollForData((host, packets.PORT_PROTOCOL), invoke_id=invoke_id, poll_number=poll_number)
+        return True
+
 
-        # pollAction.show2()
+    def getPriorityList(self, host):
+        invoke_id = self.tracker.send(host)
+        if invoke_id is not None:
+            self.transport.write(str(packets.GetPriorityList(invoke_id=invoke_id)), (host, packets.PORT_PROTOCOL))
+        return invoke_id
 
-        self.transport.write(str(pollAction), addr)
+
+    def setPriorityList(self, host, physio_ids):
+        invoke_id = self.tracker.send(host)
+        if invoke_id is not None:
+            self.transport.write(str(packets.SetPriorityList(physio_ids, invoke_id=invoke_id)), (host, packets.PORT_PROTOCOL))
+        return invoke_id
+
+
+    def pollForData(self, addr, invoke_id=0, poll_number=0):
+        self.transport.write(self.pollTemplate.render(invoke_id=invoke_id, poll_number=poll_number), addr)  # PIPG-55
 
 
     def displayResult(self, message):
@@ -240,36 +405,36 @@ class IntellivueInterface(DatagramProtocol):
                             if obsValue.measurementIsValid():
                                 obsValue.show()
 
-    def handleResult(self, host, message):
+    def handleNumerics(self, host, numerics):
         """
-        We have results! Send appropriate webhooks
+        Turn (physio_id, state, unit_code, value) tuples into a Payload and send appropriate webhooks
         """
 
         observations = []
-        for single_context_poll in message[packets.PollInfoList].value:
-            for observation_poll in single_context_poll.value:
-                for attribute_list in observation_poll.attributes:
-                    for attribute in attribute_list.value:
-                        if attribute.attribute_id == packets.NOM_ATTR_NU_VAL_OBS:
-                            obsValue = attribute[packets.NuObsValue]
-                            if obsValue.measurementIsValid():
-                                states = []
-                                for state in packets.ENUM_MEASUREMENT_STATE.keys():
-                                    if obsValue.state & state:
-                                        states.append(packets.ENUM_MEASUREMENT_STATE[state])
-                                observation = api.Observation(
-                                    physio_id=packets.ENUM_IDENTIFIERS[obsValue.physio_id],
-                                    state=states,
-                                    unit_code=packets.ENUM_IDENTIFIERS[obsValue.unit_code],
-                                    value=obsValue.value,
-                                )
-                                observations.append(observation)
+        for physio_id, state, unit_code, value in numerics:
+            states, valid = packets.MEASUREMENT_STATES[state]
+            if valid:
+                observation = api.Observation(
+                    physio_id=packets.IDENTIFIER_LABELS[physio_id],
+                    state=states,
+                    unit_code=packets.IDENTIFIER_LABELS[unit_code],
+                    value=value,
+                )
+                observations.append(observation)
 
         if len(observations) == 0:
             log.debug("No valid measurements to send")
             return
 
-        mac = self.host_to_mac[host]
+        mac = self.host_to_mac.get(host)
+        if mac is None:
+            log.warning("Dropping numerics from unknown monitor", host=host)
+            return
+        now = self.clock.seconds()
+
+        self.history.record(mac, now, observations)
+        if self.obslog is not None:
+            self.obslog.append(mac, now, numerics)
 
         payload = api.Payload(
             monitor_id=mac,
@@ -277,29 +442,175 @@ class IntellivueInterface(DatagramProtocol):
             observations=observations
         )
 
-        for subscription in self.subscriptions.values():
-            if subscription.monitor_id == mac:
-                treq.post(subscription.url, data=json.dumps(attr.asdict(payload), default=json_serialize), headers={b'Content-Type': [b'application/json']})
+        # Serialised once per distinct selection of observations, however many subscriptions it goes to
+        serialized = {None: serialize.SerializedPayload(payload)}  # Mapping of selected observation indices (None for all) -> SerializedPayload
+
+        self.streams.publish(mac, serialized[None])
+
+        physio_ids = set(observation.physio_id for observation in observations)
+        for subscription in self.subscriptions.forMonitor(mac, physio_ids):
+            if subscription.aggregate is not None:
+                continue
+            selected = self.filters.select(subscription, mac, observations, now)
+            if selected is not None and len(selected) == 0:
+                continue
+            if selected not in serialized:
+                serialized[selected] = serialize.SerializedPayload(attr.evolve(
+                    payload,
+                    observations=[observations[i] for i in selected],
+                ))
+            self.sendToSubscription(subscription, serialized[selected])
+
+        self.aggregates.record(mac, now, observations)
+        for window in self.aggregates.due(mac, now):
+            self.handleAggregates(mac, window, now)
+
+
+    def handleAggregates(self, mac, window, now):
+        """
+        Send a window's AggregatePayload to the subscriptions that want it
+        """
+        serialized = {}  # Mapping of physio_ids (None for all) -> SerializedPayload
+        for subscription in self.subscriptions.forMonitor(mac):
+            if subscription.aggregate != window:
+                continue
+
+            physio_ids = None if subscription.physio_ids is None else frozenset(subscription.physio_ids)
+            if physio_ids not in serialized:
+                aggregates = self.aggregates.query(mac, window, now, physio_ids)
+                payload = api.AggregatePayload(monitor_id=mac, window=window, aggregates=aggregates)
+                serialized[physio_ids] = serialize.SerializedPayload(payload, asDict=serialize.aggregatePayloadAsDict)
+            if serialized[physio_ids].payload.aggregates:
+                self.sendToSubscription(subscription, serialized[physio_ids])
+
+
+    def sendToSubscription(self, subscription, serialized):
+        if subscription.batch_size is not None or subscription.batch_delay is not None:
+            self.batches.add(subscription, serialized.json)
+        else:
+            body, headers = serialized.encoded(subscription.content_encoding)
+            self.webhooks.deliver(subscription, body, headers=headers)
 
 
     def startProtocol(self):
-        self.loop = LoopingCall(self.pollConnectedHostsForData)
-        self.loop.start(2)
+        local = self.transport.getHost()
+        self.host, self.port = local.host, local.port
+
+        self.lifecycle.start()
 
 
     def stopProtocol(self):
-        if self.loop is not None:
-            self.loop.stop()
+        self.lifecycle.stop()
+        self.scheduler.stop()
+        self.tracker.stop()
+        if self.priority_lists is not None:
+            self.priority_lists.stop()
+        self.decoder.close()
+        self.batches.flushAll()
+        self.webhooks.close()
+        if self.obslog is not None:
+            self.obslog.close()
+        if self.capture is not None:
+            self.capture.close()
+
+
+def shardPath(path, shard):
+    """
+    path, made distinct for shard (if any)
+    """
+    if shard is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return "%s-shard%d%s" % (root, shard, ext)
+
+
+def pollIntervalsFromEnvironment():
+    """
+    POLL_INTERVALS, e.g. "00:09:fb:09:77:bd=1,00:09:fb:09:77:be=5", as a mapping of MAC -> seconds
+    """
+    intervals = {}
+    for entry in os.getenv("POLL_INTERVALS", "").split(","):
+        if entry.strip():
+            mac, interval = entry.split("=")
+            intervals[mac.strip().lower()] = float(interval)
+    return intervals
+
+
+def historyFromEnvironment():
+    return history_.ObservationHistory(capacity=int(os.getenv("HISTORY_CAPACITY", history_.DEFAULT_CAPACITY)))
+
+
+def observationLogFromEnvironment(shard=None):
+    if not os.getenv("OBSLOG_DIR"):
+        return None
+    return observation_log.ObservationLog(shardPath(os.getenv("OBSLOG_DIR"), shard))
+
+
+def interfaceFromEnvironment(shard=None, **kwargs):
+    """
+    An IntellivueInterface configured by environment variables, given whatever it shares (monitors, subscriptions, stats, ...)
+    A shard gets its own capture file
+    """
+    webhooks = delivery.WebhookDelivery(
+        max_queue=int(os.getenv("WEBHOOK_QUEUE_LENGTH", 16)),
+        overflow=os.getenv("WEBHOOK_OVERFLOW", delivery.DROP_OLDEST),
+        max_per_destination=int(os.getenv("WEBHOOK_CONNECTIONS_PER_HOST", 4)),
+        timeout=float(os.getenv("WEBHOOK_TIMEOUT", 10)),
+    )
+    capture = None
+    if os.getenv("DUMPFILENAME"):
+        capture = capture_.CaptureWriter(
+            shardPath(os.getenv("DUMPFILENAME"), shard),
+            max_bytes=int(os.getenv("DUMP_MAX_BYTES")) if os.getenv("DUMP_MAX_BYTES") else None,
+            max_seconds=float(os.getenv("DUMP_MAX_SECONDS")) if os.getenv("DUMP_MAX_SECONDS") else None,
+            threaded=bool(os.getenv("DUMP_THREADED")),
+        )
+    scheduler = scheduler_.PollScheduler(
+        interval=float(os.getenv("POLL_INTERVAL", scheduler_.DEFAULT_INTERVAL)),
+        reply_timeout=float(os.getenv("POLL_REPLY_TIMEOUT", scheduler_.DEFAULT_REPLY_TIMEOUT)),
+        max_interval=float(os.getenv("POLL_MAX_INTERVAL", scheduler_.DEFAULT_MAX_INTERVAL)),
+        idle_interval=float(os.getenv("POLL_IDLE_INTERVAL", scheduler_.DEFAULT_IDLE_INTERVAL)),
+    )
+    tracker = tracker_.RequestTracker(
+        max_in_flight=int(os.getenv("POLL_MAX_IN_FLIGHT", tracker_.DEFAULT_MAX_IN_FLIGHT)),
+        timeout=float(os.getenv("POLL_TIMEOUT", tracker_.DEFAULT_TIMEOUT)),
+    )
+    lifecycle = lifecycle_.MonitorLifecycle(
+        keepalive_after=float(os.getenv("MONITOR_KEEPALIVE_AFTER", lifecycle_.DEFAULT_KEEPALIVE_AFTER)),
+        stale_after=float(os.getenv("MONITOR_STALE_AFTER", lifecycle_.DEFAULT_STALE_AFTER)),
+    )
+    decoder = decoding.makeDecoder(
+        os.getenv("DECODER", decoding.INLINE),
+        workers=int(os.getenv("DECODER_WORKERS")) if os.getenv("DECODER_WORKERS") else None,
+        max_queued=int(os.getenv("DECODER_MAX_QUEUED", decoding.DEFAULT_MAX_QUEUED)),
+    )
+    return IntellivueInterface(
+        capture=capture, scheduler=scheduler, tracker=tracker, lifecycle=lifecycle, decoder=decoder, webhooks=webhooks,
+        # Restricted to what subscriptions want, so history and aggregates then only have those; see demand.PriorityLists
+        priority_lists=bool(os.getenv("POLL_PRIORITY_LIST")),
+        poll_intervals=pollIntervalsFromEnvironment(),
+        **kwargs
+    )
 
 
 if __name__ == '__main__':
-    monitors = {}
-    subscriptions = {}
-    w = web.EinsteinWebServer(monitors=monitors, subscriptions=subscriptions).app.resource()
-    import os
-    reactor.listenTCP(int(os.getenv("PORT", 8080)), server.Site(w))
-    i = IntellivueInterface(monitors=monitors, subscriptions=subscriptions, dumpfilename=os.getenv("DUMPFILENAME"))
-    reactor.listenUDP(packets.PORT_CONNECTION_INDICATION, i)
-
-    log.info("Starting...")
-    reactor.run()
+    workers = int(os.getenv("WORKERS", 0))
+    if workers:
+        # Monitors are sharded across worker processes, behind a front end; see shards
+        import shards
+        shards.runFrontEnd(workers)
+    else:
+        monitors = {}
+        subscriptions = registry.SubscriptionRegistry()
+        stats = {}
+        streams = streams_.StreamHub()
+        history = historyFromEnvironment()
+        aggregates = aggregate.Aggregates()
+        obslog = observationLogFromEnvironment()
+        w = web.EinsteinWebServer(monitors=monitors, subscriptions=subscriptions, stats=stats, streams=streams, history=history, aggregates=aggregates, obslog=obslog).app.resource()
+        reactor.listenTCP(int(os.getenv("PORT", 8080)), server.Site(w))
+        i = interfaceFromEnvironment(monitors=monitors, subscriptions=subscriptions, stats=stats, streams=streams, history=history, aggregates=aggregates, obslog=obslog)
+        reactor.listenUDP(packets.PORT_CONNECTION_INDICATION, i)
+
+        log.info("Starting...")
+        reactor.run()
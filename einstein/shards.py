@@ -0,0 +1,578 @@
+"""
+Sharded ingest: monitors spread across worker processes, behind a single front end
+
+    WORKERS=4 python server.py
+
+The front end owns the ConnectIndication port and the web server.
+Each worker owns a shard of the monitors, by a hash of their MAC address:
+it associates with them, polls them and decodes their replies (on a UDP port of its own),
+and delivers their webhooks.
+
+The front end and its workers talk AMP over a Unix socket (SHARD_SOCKET):
+    front end -> worker: ConnectIndications, subscriptions, the monitors streams follow, and requests for stats and queries
+    worker -> front end: monitors seen and forgotten, and Payloads (for streams)
+so the front end's monitor list, subscriptions, stats and streams cover every shard,
+and per-monitor queries (see queries) are answered by the monitor's worker.
+Workers that exit are restarted, and sent their subscriptions again.
+"""
+
+import datetime
+import json
+import os
+import sys
+import zlib
+
+from twisted.internet import defer, error, reactor
+from twisted.internet.endpoints import UNIXClientEndpoint, connectProtocol
+from twisted.internet.protocol import DatagramProtocol, Factory, ProcessProtocol
+from twisted.internet.task import LoopingCall
+from twisted.protocols import amp
+from twisted.web import server as web_server
+import attr
+import collections
+import structlog
+
+import aggregate
+import api
+import intellivue as packets
+import queries as queries_
+import serialize
+import server
+import streams as streams_
+import subscriptions as registry
+import web
+from util import json_serialize
+
+log = structlog.get_logger()
+
+
+DEFAULT_SOCKET = "einstein-shards.sock"
+DEFAULT_STATS_INTERVAL = 5  # Seconds between fetching each worker's stats
+RESTART_DELAY = 1  # Seconds
+STOP_TIMEOUT = 5  # Seconds to wait for workers to release their associations and exit, before killing them
+
+
+class LongString(amp.Argument):
+    """
+    A string of any length, split across as many AMP values (each at most 65535 bytes) as it takes
+    """
+
+    CHUNK = 0xffff
+
+    def toBox(self, name, strings, objects, proto):
+        value = objects[name]
+        chunks = [value[i:i + self.CHUNK] for i in xrange(0, len(value), self.CHUNK)]
+        strings[name] = str(len(chunks))
+        for n, chunk in enumerate(chunks):
+            strings["%s.%d" % (name, n)] = chunk
+
+
+    def fromBox(self, name, strings, objects, proto):
+        count = int(strings[name])
+        objects[name] = "".join(strings["%s.%d" % (name, n)] for n in xrange(count))
+
+
+# Worker -> front end
+
+class Register(amp.Command):
+    arguments = [("shard", amp.Integer())]
+
+
+class MonitorSeen(amp.Command):
+    arguments = [("mac_address", amp.Unicode()), ("host", amp.Unicode()), ("port", amp.Integer())]
+    requiresAnswer = False
+
+
+class MonitorForgotten(amp.Command):
+    arguments = [("mac_address", amp.Unicode())]
+    requiresAnswer = False
+
+
+class Publish(amp.Command):
+    arguments = [("monitor_id", amp.Unicode()), ("body", LongString())]  # A Payload's JSON
+    requiresAnswer = False
+
+
+# Front end -> worker
+
+class ConnectIndication(amp.Command):
+    arguments = [("data", amp.String()), ("host", amp.Unicode()), ("port", amp.Integer())]
+    requiresAnswer = False
+
+
+class AddSubscription(amp.Command):
+    arguments = [("subscription", LongString())]  # The Subscription's JSON
+
+
+class RemoveSubscription(amp.Command):
+    arguments = [("subscription_id", amp.Unicode())]
+
+
+class SetFollowed(amp.Command):
+    arguments = [("monitor_ids", LongString())]  # JSON list of the shard's monitor_ids (and ALL_MONITORS) that streams follow
+
+
+class Stats(amp.Command):
+    response = [("stats", LongString())]  # JSON
+
+
+class Query(amp.Command):
+    arguments = [("name", amp.Unicode()), ("monitor_id", amp.Unicode()), ("args", LongString())]  # args as JSON
+    response = [("result", LongString())]  # JSON
+    errors = {queries_.BadQuery: "BAD_QUERY", queries_.NotFound: "NOT_FOUND"}
+
+
+class WorkerProtocol(amp.AMP):
+    """
+    A worker's end of its channel to the front end
+    """
+
+    def __init__(self, shard, interface=None, queries=None):
+        amp.AMP.__init__(self)
+        self.shard = shard
+        self.interface = interface
+        self.queries = queries
+        self.connected = False
+        self.lost = None  # Called if the front end goes away
+
+
+    def connectionMade(self):
+        amp.AMP.connectionMade(self)
+        self.connected = True
+        d = self.callRemote(Register, shard=self.shard)
+        d.addErrback(lambda f: log.error("Could not register with front end", shard=self.shard, error=f.getErrorMessage()))
+
+
+    def connectionLost(self, reason):
+        amp.AMP.connectionLost(self, reason)
+        self.connected = False
+        log.warning("Lost front end", shard=self.shard)
+        if self.lost is not None:
+            self.lost()
+
+
+    def notify(self, command, **kwargs):
+        if self.connected:
+            self.callRemote(command, **kwargs)
+
+
+    @ConnectIndication.responder
+    def connectIndication(self, data, host, port):
+        self.interface.connectIndicationReceived(data, (str(host), port))
+        return {}
+
+
+    @AddSubscription.responder
+    def addSubscription(self, subscription):
+        self.interface.subscriptions.add(api.Subscription(**json.loads(subscription)))
+        return {}
+
+
+    @RemoveSubscription.responder
+    def removeSubscription(self, subscription_id):
+        self.interface.subscriptions.pop(subscription_id, None)
+        return {}
+
+
+    @SetFollowed.responder
+    def setFollowed(self, monitor_ids):
+        self.interface.streams.setFollowed(json.loads(monitor_ids))
+        return {}
+
+
+    @Stats.responder
+    def stats(self):
+        stats = dict((name, value() if callable(value) else value) for (name, value) in self.interface.stats.items())
+        return {"stats": json.dumps(stats, default=json_serialize)}
+
+
+    @Query.responder
+    def query(self, name, monitor_id, args):
+        result = self.queries.run(name, monitor_id, json.loads(args))
+        return {"result": json.dumps(result, default=json_serialize)}
+
+
+class RelayedMonitors(dict):
+    """
+    A worker's monitors (a mapping of MAC -> api.Monitor), relaying changes to the front end's
+    """
+
+    def __init__(self, channel):
+        dict.__init__(self)
+        self.channel = channel
+
+
+    def __setitem__(self, mac, monitor):
+        dict.__setitem__(self, mac, monitor)
+        self.channel.notify(MonitorSeen, mac_address=mac, host=monitor.host, port=monitor.port)
+
+
+    def __delitem__(self, mac):
+        dict.__delitem__(self, mac)
+        self.channel.notify(MonitorForgotten, mac_address=mac)
+
+
+class StreamRelay(object):
+    """
+    Stands in for a worker's streams.StreamHub, relaying Payloads to the front end's
+    (and knowing which monitors the front end's streams follow, but not who by)
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.followed_ids = set()
+        self.observers = []
+        self.relayed = 0
+
+
+    def observe(self, observer):
+        self.observers.append(observer)
+
+
+    def setFollowed(self, monitor_ids):
+        if set(monitor_ids) == self.followed_ids:
+            return
+        self.followed_ids = set(monitor_ids)
+        for observer in self.observers:
+            observer.followersChanged()
+
+
+    def following(self, monitor_id):
+        return self.followed_ids & set([monitor_id, registry.ALL_MONITORS])
+
+
+    def publish(self, monitor_id, serialized):
+        if not self.following(monitor_id):
+            return
+        self.channel.notify(Publish, monitor_id=monitor_id, body=serialized.json)
+        self.relayed += 1
+
+
+    def stats(self):
+        return {"relayed": self.relayed}
+
+
+class FrontEndProtocol(amp.AMP):
+    """
+    The front end's end of a channel to a worker
+    """
+
+    def __init__(self, shards):
+        amp.AMP.__init__(self)
+        self.shards = shards
+        self.shard = None
+
+
+    def connectionLost(self, reason):
+        amp.AMP.connectionLost(self, reason)
+        if self.shard is not None:
+            self.shards.unregister(self.shard, self)
+
+
+    @Register.responder
+    def register(self, shard):
+        self.shard = shard
+        self.shards.register(shard, self)
+        return {}
+
+
+    @MonitorSeen.responder
+    def monitorSeen(self, mac_address, host, port):
+        self.shards.monitors[mac_address] = api.Monitor(mac_address=mac_address, host=host, port=port, last_seen=datetime.datetime.now())
+        return {}
+
+
+    @MonitorForgotten.responder
+    def monitorForgotten(self, mac_address):
+        self.shards.monitors.pop(mac_address, None)
+        return {}
+
+
+    @Publish.responder
+    def publish(self, monitor_id, body):
+        self.shards.streams.publish(monitor_id, serialize.SerializedPayload.fromJSON(body))
+        return {}
+
+
+class WorkerProcess(ProcessProtocol):
+
+    def __init__(self, shards, shard):
+        self.shards = shards
+        self.shard = shard
+        self.ended = defer.Deferred()
+
+
+    def processEnded(self, reason):
+        log.info("Worker exited", shard=self.shard, reason=reason.getErrorMessage())
+        self.ended.callback(None)
+        self.shards.processEnded(self.shard)
+
+
+class Shards(object):
+    """
+    The front end's view of its workers;
+    it observes the (front end's) subscriptions and streams, to route them to the workers that need them
+    """
+
+    def __init__(self, count, monitors, subscriptions, streams, clock=reactor, stats_interval=DEFAULT_STATS_INTERVAL):
+        self.count = count
+        self.monitors = monitors
+        self.subscriptions = subscriptions
+        self.streams = streams
+        self.clock = clock
+        self.stats_interval = stats_interval
+
+        self.workers = {}  # Mapping of shard -> FrontEndProtocol
+        self.worker_stats = {}  # Mapping of shard -> its latest stats
+        self.processes = {}  # Mapping of shard -> WorkerProcess
+        self.socket_path = None
+        self.stopping = False
+
+        self.forwarded = 0
+        self.unroutable = 0
+        self.restarts = 0
+
+        self.subscriptions.observe(self)
+        self.streams.observe(self)
+        self.loop = LoopingCall(self.refreshStats)
+        self.loop.clock = clock
+
+
+    def shard(self, mac):
+        return (zlib.crc32(str(mac).lower()) & 0xffffffff) % self.count
+
+
+    def shardsFor(self, subscription):
+        if subscription.monitor_id == registry.ALL_MONITORS:
+            return range(self.count)
+        return [self.shard(subscription.monitor_id)]
+
+
+    def register(self, shard, worker):
+        log.info("Worker registered", shard=shard)
+        self.workers[shard] = worker
+        for subscription in self.subscriptions.values():
+            if shard in self.shardsFor(subscription):
+                self.send(worker, AddSubscription, subscription=json.dumps(attr.asdict(subscription)))
+        self.sendFollowed(shard)
+
+
+    def unregister(self, shard, worker):
+        if self.workers.get(shard) is not worker:
+            return
+        log.warning("Worker lost", shard=shard)
+        del self.workers[shard]
+        self.worker_stats.pop(shard, None)
+        for mac in self.monitors.keys():
+            if self.shard(mac) == shard:
+                del self.monitors[mac]
+
+
+    def send(self, worker, command, **kwargs):
+        d = worker.callRemote(command, **kwargs)
+        d.addErrback(lambda f: log.warning("Could not send to worker", command=command.__name__, shard=worker.shard, error=f.getErrorMessage()))
+        return d
+
+
+    def subscriptionAdded(self, subscription):
+        # Workers that aren't registered yet are sent it when they are
+        for shard in self.shardsFor(subscription):
+            if shard in self.workers:
+                self.send(self.workers[shard], AddSubscription, subscription=json.dumps(attr.asdict(subscription)))
+
+
+    def subscriptionRemoved(self, subscription):
+        for shard in self.shardsFor(subscription):
+            if shard in self.workers:
+                self.send(self.workers[shard], RemoveSubscription, subscription_id=subscription.subscription_id)
+
+
+    def followersChanged(self):
+        for shard in self.workers:
+            self.sendFollowed(shard)
+
+
+    def sendFollowed(self, shard):
+        monitor_ids = [
+            monitor_id for monitor_id in self.streams.followed()
+            if monitor_id == registry.ALL_MONITORS or self.shard(monitor_id) == shard
+        ]
+        self.send(self.workers[shard], SetFollowed, monitor_ids=json.dumps(sorted(monitor_ids)))
+
+
+    def connectIndication(self, data, addr):
+        ci = packets.dissectLazily(packets.Nomenclature, data, allow=[packets.NOM_ATTR_NET_ADDR_INFO])
+        if packets.IpAddressInfo not in ci:
+            log.warning("Could not extract MAC address from ConnectionIndication packet", addr=addr)
+            self.unroutable += 1
+            return
+
+        shard = self.shard(ci[packets.IpAddressInfo].mac_address)
+        worker = self.workers.get(shard)
+        if worker is None:
+            self.unroutable += 1
+            return
+
+        host, port = addr
+        worker.callRemote(ConnectIndication, data=data, host=host, port=port)
+        self.forwarded += 1
+
+
+    def query(self, name, monitor_id, args):
+        """
+        A Deferred firing with the JSON of the monitor's worker's answer to one of queries.Queries
+        """
+        shard = self.shard(monitor_id)
+        worker = self.workers.get(shard)
+        if worker is None:
+            return defer.fail(queries_.Unavailable("Shard %d has no worker" % shard))
+
+        d = worker.callRemote(Query, name=name, monitor_id=monitor_id, args=json.dumps(args))
+        d.addCallback(lambda response: response["result"])
+        return d
+
+
+    def refreshStats(self):
+        for shard, worker in self.workers.items():
+            d = self.send(worker, Stats)
+            d.addCallback(self._gotStats, shard)
+
+
+    def _gotStats(self, response, shard):
+        if response is not None:
+            self.worker_stats[shard] = json.loads(response["stats"])
+
+
+    def stats(self):
+        return {
+            "workers": len(self.workers),
+            "forwarded": self.forwarded,
+            "unroutable": self.unroutable,
+            "restarts": self.restarts,
+            "shards": dict((str(shard), self.worker_stats.get(shard)) for shard in range(self.count)),
+        }
+
+
+    def start(self, socket_path):
+        self.socket_path = socket_path
+        self.loop.start(self.stats_interval, now=False)
+        for shard in range(self.count):
+            self.spawn(shard)
+
+
+    def spawn(self, shard):
+        script = os.path.splitext(os.path.abspath(__file__))[0] + ".py"
+        process = self.processes[shard] = WorkerProcess(self, shard)
+        reactor.spawnProcess(
+            process,
+            sys.executable,
+            [sys.executable, script, "worker", self.socket_path, str(shard)],
+            env=os.environ.copy(),
+            path=os.path.dirname(script),
+            childFDs={0: "w", 1: 1, 2: 2},  # Workers log to our stdout and stderr
+        )
+
+
+    def processEnded(self, shard):
+        del self.processes[shard]
+        if not self.stopping:
+            self.restarts += 1
+            self.clock.callLater(RESTART_DELAY, self.spawn, shard)
+
+
+    def stop(self):
+        """
+        Stop the workers (which release their associations), returning a Deferred that fires once they have
+        """
+        self.stopping = True
+        if self.loop.running:
+            self.loop.stop()
+
+        processes = self.processes.values()
+        for process in processes:
+            self.signal(process, "TERM")
+        kill = self.clock.callLater(STOP_TIMEOUT, lambda: [self.signal(process, "KILL") for process in processes])
+
+        d = defer.DeferredList([process.ended for process in processes])
+        d.addCallback(lambda _: kill.active() and kill.cancel())
+        return d
+
+
+    def signal(self, process, signal):
+        try:
+            process.transport.signalProcess(signal)
+        except error.ProcessExitedAlready:
+            pass
+
+
+class ConnectIndicationForwarder(DatagramProtocol):
+    """
+    The front end's ConnectIndication port: forwards each to the worker that owns the monitor
+    """
+
+    def __init__(self, shards):
+        self.shards = shards
+        self.datagramCounts = collections.Counter()  # Mapping of packets.classifyDatagram class -> count
+
+
+    def datagramReceived(self, data, addr):
+        kind = packets.classifyDatagram(data, packets.PORT_CONNECTION_INDICATION)
+        self.datagramCounts[kind] += 1
+        if kind == packets.CONNECT_INDICATION:
+            self.shards.connectIndication(data, addr)
+
+
+def runFrontEnd(workers):
+    monitors = {}
+    subscriptions = registry.SubscriptionRegistry()
+    stats = {}
+    streams = streams_.StreamHub()
+    stats["streams"] = streams.stats
+
+    shards = Shards(workers, monitors, subscriptions, streams)
+    stats["shards"] = shards.stats
+    forwarder = ConnectIndicationForwarder(shards)
+    stats["datagrams"] = forwarder.datagramCounts
+
+    socket_path = os.path.abspath(os.getenv("SHARD_SOCKET", DEFAULT_SOCKET))
+    reactor.listenUNIX(socket_path, Factory.forProtocol(lambda: FrontEndProtocol(shards)), wantPID=True)
+    shards.start(socket_path)
+
+    w = web.EinsteinWebServer(monitors=monitors, subscriptions=subscriptions, stats=stats, streams=streams, shards=shards).app.resource()
+    reactor.listenTCP(int(os.getenv("PORT", 8080)), web_server.Site(w))
+    reactor.listenUDP(packets.PORT_CONNECTION_INDICATION, forwarder)
+    reactor.addSystemEventTrigger("before", "shutdown", shards.stop)
+
+    log.info("Starting front end...", workers=workers)
+    reactor.run()
+
+
+def runWorker(socket_path, shard):
+    channel = WorkerProtocol(shard)
+    channel.lost = lambda: reactor.running and reactor.stop()
+
+    history = server.historyFromEnvironment()
+    aggregates = aggregate.Aggregates()
+    obslog = server.observationLogFromEnvironment(shard)
+    channel.interface = server.interfaceFromEnvironment(
+        shard=shard,
+        monitors=RelayedMonitors(channel),
+        streams=StreamRelay(channel),
+        history=history,
+        aggregates=aggregates,
+        obslog=obslog,
+    )
+    channel.queries = queries_.Queries(history, aggregates, obslog)
+
+    reactor.listenUDP(0, channel.interface)  # Monitors reply to whichever port we associate from
+    d = connectProtocol(UNIXClientEndpoint(reactor, socket_path), channel)
+    d.addErrback(lambda f: (log.error("Could not connect to front end", shard=shard, error=f.getErrorMessage()), reactor.stop()))
+
+    log.info("Starting worker...", shard=shard)
+    reactor.run()
+
+
+if __name__ == "__main__":
+    _, role, socket_path, shard = sys.argv
+    assert role == "worker"
+    runWorker(socket_path, int(shard))
@@ -0,0 +1,172 @@
+"""
+Live observation streams, as Server-Sent Events
+
+Each Payload is framed once, however many clients it goes to.
+Clients register as (streaming) producers with their connection,
+so when a client stops reading, frames queue for it (up to a limit) rather than in the transport;
+a client that falls further behind than that is disconnected.
+"""
+
+from collections import deque
+
+from twisted.internet import defer
+from zope.interface import implementer
+from twisted.internet.interfaces import IPushProducer
+import structlog
+
+from subscriptions import ALL_MONITORS
+
+log = structlog.get_logger()
+
+
+def frame(event, data):
+    """
+    A Server-Sent Event; data must not contain newlines (which serialised JSON doesn't)
+    """
+    return "event: %s\ndata: %s\n\n" % (event, data)
+
+
+@implementer(IPushProducer)
+class StreamClient(object):
+
+    def __init__(self, request, monitor_ids=(ALL_MONITORS,), max_pending=64):
+        self.request = request
+        self.monitor_ids = tuple(monitor_ids)
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.paused = False
+        self.closed = False
+        self.hub = None
+        self.done = defer.Deferred(lambda _: self.close())  # Cancelled (by Klein) when the client goes away
+
+
+    def start(self, hub):
+        self.hub = hub
+        self.request.setHeader('Content-Type', 'text/event-stream')
+        self.request.setHeader('Cache-Control', 'no-cache')
+        self.request.registerProducer(self, True)
+        self.request.write(": connected\n\n")  # Sends the headers now, rather than with the first Payload
+
+
+    def send(self, data):
+        if self.closed:
+            return
+        if not self.paused:
+            self.request.write(data)
+            return
+
+        self.pending.append(data)
+        if len(self.pending) > self.max_pending:
+            log.warning("Disconnecting slow stream client", monitor_ids=self.monitor_ids, pending=len(self.pending))
+            self.hub.slow_disconnections += 1
+            self.close()
+            self.request.transport.abortConnection()
+
+
+    def pauseProducing(self):
+        self.paused = True
+
+
+    def resumeProducing(self):
+        self.paused = False
+        while self.pending and not self.paused and not self.closed:
+            self.request.write(self.pending.popleft())
+
+
+    def stopProducing(self):
+        self.close()
+
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.pending.clear()
+        if self.hub is not None:
+            self.hub.remove(self)
+
+
+class StreamHub(object):
+    """
+    The stream clients, indexed by the monitor_ids (or ALL_MONITORS) they're following;
+    shared by the web server (which adds them) and IntellivueInterface (which publishes to them)
+    """
+
+    def __init__(self):
+        self.clients = {}  # Mapping of monitor_id -> set of StreamClient
+        self.observers = []
+        self.published = 0
+        self.slow_disconnections = 0
+
+
+    def observe(self, observer):
+        """
+        Call observer.followersChanged() whenever a monitor_id gains its first client or loses its last, from now on
+        """
+        self.observers.append(observer)
+
+
+    def followed(self):
+        """
+        The monitor_ids (and ALL_MONITORS, if any client wants them all) that are followed
+        """
+        return set(self.clients)
+
+
+    def add(self, client):
+        changed = False
+        for monitor_id in client.monitor_ids:
+            changed |= monitor_id not in self.clients
+            self.clients.setdefault(monitor_id, set()).add(client)
+        client.start(self)
+        if changed:
+            self.followersChanged()
+
+
+    def remove(self, client):
+        changed = False
+        for monitor_id in client.monitor_ids:
+            clients = self.clients.get(monitor_id)
+            if clients is not None:
+                clients.discard(client)
+                if not clients:
+                    del self.clients[monitor_id]
+                    changed = True
+        if changed:
+            self.followersChanged()
+
+
+    def followersChanged(self):
+        for observer in self.observers:
+            observer.followersChanged()
+
+
+    def following(self, monitor_id):
+        return self.clients.get(monitor_id, set()) | self.clients.get(ALL_MONITORS, set())
+
+
+    def publish(self, monitor_id, serialized):
+        """
+        Send a serialize.SerializedPayload to every client following monitor_id
+        """
+        clients = self.following(monitor_id)
+        if not clients:
+            return
+
+        data = frame("payload", serialized.json)
+        for client in clients:
+            client.send(data)
+        self.published += 1
+
+
+    def stats(self):
+        clients = set()
+        for following in self.clients.values():
+            clients.update(following)
+        return {
+            "clients": len(clients),
+            "paused": sum(1 for client in clients if client.paused),
+            "pending": sum(len(client.pending) for client in clients),
+            "published": self.published,
+            "slow_disconnections": self.slow_disconnections,
+        }
@@ -0,0 +1,111 @@
+"""
+The subscription registry, shared by the web server and IntellivueInterface
+"""
+
+import collections
+
+
+ALL_MONITORS = "*"  # The monitor_id of a subscription to every monitor
+
+
+class SubscriptionRegistry(collections.MutableMapping):
+    """
+    A mapping of SubscriptionId -> Subscription,
+    indexed so that finding the subscriptions for a monitor's observations
+    costs in proportion to the subscriptions that match, not to all of them.
+
+    Subscriptions are indexed by monitor_id (with ALL_MONITORS subscriptions matching every monitor),
+    then by physio_id for subscriptions restricted to particular physio_ids.
+
+    Observers (see observe) are told of every subscription added or removed,
+    so they can keep (and clean up) per-subscription state.
+    """
+
+    def __init__(self, subscriptions=()):
+        self.subscriptions = {}  # Mapping of SubscriptionId -> Subscription
+        self.unrestricted = collections.defaultdict(dict)  # Mapping of monitor_id -> {SubscriptionId -> Subscription}
+        self.by_physio_id = collections.defaultdict(lambda: collections.defaultdict(dict))  # Mapping of monitor_id -> physio_id -> {SubscriptionId -> Subscription}
+        self.observers = []
+        for subscription in subscriptions:
+            self.add(subscription)
+
+
+    def add(self, subscription):
+        self[subscription.subscription_id] = subscription
+
+
+    def observe(self, observer):
+        """
+        Tell observer.subscriptionAdded and observer.subscriptionRemoved about changes from now on
+        """
+        self.observers.append(observer)
+
+
+    def __getitem__(self, subscription_id):
+        return self.subscriptions[subscription_id]
+
+
+    def __setitem__(self, subscription_id, subscription):
+        if subscription_id in self.subscriptions:
+            del self[subscription_id]
+
+        self.subscriptions[subscription_id] = subscription
+        if subscription.physio_ids is None:
+            self.unrestricted[subscription.monitor_id][subscription_id] = subscription
+        else:
+            for physio_id in subscription.physio_ids:
+                self.by_physio_id[subscription.monitor_id][physio_id][subscription_id] = subscription
+
+        for observer in self.observers:
+            observer.subscriptionAdded(subscription)
+
+
+    def __delitem__(self, subscription_id):
+        subscription = self.subscriptions.pop(subscription_id)
+
+        monitor_id = subscription.monitor_id
+        if subscription.physio_ids is None:
+            _discard(self.unrestricted, monitor_id, subscription_id)
+        else:
+            by_physio_id = self.by_physio_id[monitor_id]
+            for physio_id in subscription.physio_ids:
+                _discard(by_physio_id, physio_id, subscription_id)
+            if not by_physio_id:
+                del self.by_physio_id[monitor_id]
+
+        for observer in self.observers:
+            observer.subscriptionRemoved(subscription)
+
+
+    def __iter__(self):
+        return iter(self.subscriptions)
+
+
+    def __len__(self):
+        return len(self.subscriptions)
+
+
+    def forMonitor(self, monitor_id, physio_ids=None):
+        """
+        The subscriptions to monitor_id (including ALL_MONITORS subscriptions)
+        which want any of physio_ids, or every subscription to monitor_id if physio_ids is None
+        """
+        matching = {}
+        for indexed_id in (monitor_id, ALL_MONITORS):
+            matching.update(self.unrestricted.get(indexed_id, {}))
+
+            by_physio_id = self.by_physio_id.get(indexed_id)
+            if not by_physio_id:
+                continue
+            for physio_id in (by_physio_id.keys() if physio_ids is None else physio_ids):
+                matching.update(by_physio_id.get(physio_id, {}))
+
+        return matching.values()
+
+
+def _discard(index, key, subscription_id):
+    subscriptions = index.get(key)
+    if subscriptions is not None:
+        subscriptions.pop(subscription_id, None)
+        if not subscriptions:
+            del index[key]
@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+import aggregate
+import api
+
+MAC = "00:09:fb:09:77:bd"
+
+
+def test_rolling_window_matches_brute_force():
+    rng = random.Random(0)
+    window = aggregate.RollingWindow(12)
+    points = []
+    for t in range(200):
+        value = rng.uniform(50, 150)
+        window.add(t, value)
+        points.append((t, value))
+
+        expected = [v for (time, v) in points if time > t - 12]
+        count, mean, minimum, maximum = window.summary()
+        assert count == len(expected)
+        assert mean == pytest.approx(sum(expected) / len(expected))
+        assert (minimum, maximum) == (min(expected), max(expected))
+
+
+def test_non_finite_values_ignored():
+    window = aggregate.RollingWindow(12)
+    window.add(0, float("nan"))
+    assert window.summary() is None
+
+    window.add(1, 72)
+    window.add(2, float("inf"))
+    assert window.summary() == (1, 72, 72, 72)
+
+    window.expire(13)
+    assert window.summary() is None
+
+
+def test_query():
+    aggregates = aggregate.Aggregates()
+    for t in range(100):
+        aggregates.record(MAC, t, [
+            api.Observation(physio_id="NOM_ECG_CARD_BEAT_RATE", unit_code="NOM_DIM_BEAT_PER_MIN", value=t),
+            api.Observation(physio_id="NOM_PULS_OXIM_SAT_O2", unit_code="NOM_DIM_PERCENT", value=98),
+        ])
+
+    a, = aggregates.query(MAC, 12, 99, ["NOM_ECG_CARD_BEAT_RATE"])
+    assert (a.count, a.mean, a.min, a.max) == (12, 93.5, 88, 99)
+    assert a.unit_code == "NOM_DIM_BEAT_PER_MIN"
+    assert len(aggregates.query(MAC, 60, 99)) == 2
+    assert aggregates.query(MAC, 60, 1000) == []
+
+
+def test_due():
+    aggregates = aggregate.Aggregates()
+    assert aggregates.due(MAC, 0) == []
+    assert aggregates.due(MAC, 11) == []
+    assert aggregates.due(MAC, 12) == [12]
+    assert aggregates.due(MAC, 60) == [12, 60]
@@ -0,0 +1,73 @@
+import os
+
+from scapy.layers.inet import IP, UDP
+from scapy.utils import rdpcap
+from twisted.internet import task
+
+import capture
+import intellivue
+
+MONITOR = ("10.0.0.1", intellivue.PORT_PROTOCOL)
+LOCAL = ("10.0.0.2", intellivue.PORT_CONNECTION_INDICATION)
+
+
+def test_records_read_back(tmpdir):
+    clock = task.Clock()
+    clock.advance(1541421001.25)
+    filename = str(tmpdir.join("dump.pcap"))
+    writer = capture.CaptureWriter(filename, clock=clock)
+
+    writer.write("\xe1\x00\x00\x02hello", MONITOR, LOCAL)
+    assert not os.path.exists(filename)  # Still buffered
+    clock.advance(capture.DEFAULT_FLUSH_INTERVAL)
+    writer.write("goodbye", MONITOR, LOCAL)
+    writer.close()
+
+    first, second = rdpcap(filename)
+    assert first[IP].src == MONITOR[0]
+    assert first[IP].dst == LOCAL[0]
+    assert first[UDP].sport == MONITOR[1]
+    assert first[UDP].dport == LOCAL[1]
+    assert str(first[UDP].payload) == "\xe1\x00\x00\x02hello"
+    assert first.time == 1541421001.25
+    assert str(second[UDP].payload) == "goodbye"
+
+    # The IP checksum we synthesised is the one Scapy would have
+    ip = first[IP].copy()
+    del ip.chksum
+    assert IP(str(ip)).chksum == first[IP].chksum
+
+
+def test_rotates_by_size(tmpdir):
+    clock = task.Clock()
+    filename = str(tmpdir.join("dump.pcap"))
+    writer = capture.CaptureWriter(filename, max_bytes=200, buffer_bytes=1, clock=clock)
+    for n in range(10):
+        writer.write("x" * 50, MONITOR, LOCAL)
+    writer.close()
+
+    paths = sorted(str(p) for p in tmpdir.listdir())
+    assert len(paths) > 2
+    assert sum(len(rdpcap(path)) for path in paths) == 10
+
+
+def test_does_not_overwrite(tmpdir):
+    filename = tmpdir.join("dump.pcap")
+    filename.write("existing")
+
+    writer = capture.CaptureWriter(str(filename), clock=task.Clock())
+    writer.write("x", MONITOR, LOCAL)
+    writer.close()
+
+    assert filename.read() == "existing"
+    assert len(rdpcap(str(tmpdir.join("dump.1.pcap")))) == 1
+
+
+def test_threaded(tmpdir):
+    filename = str(tmpdir.join("dump.pcap"))
+    writer = capture.CaptureWriter(filename, threaded=True, buffer_bytes=1, clock=task.Clock())
+    for n in range(5):
+        writer.write("x", MONITOR, LOCAL)
+    writer.close()
+
+    assert len(rdpcap(filename)) == 5
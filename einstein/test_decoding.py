@@ -0,0 +1,133 @@
+import threading
+import time
+
+from twisted.internet import defer, task
+
+import decoding
+import intellivue
+from intellivue.test_fast_path import SAMPLE_POLL_REPLY
+
+HOST = "10.0.0.1"
+
+
+class ImmediateReactor(task.Clock):
+    """
+    Runs callFromThread's calls straight away (one at a time), for decoders used without a running reactor
+    """
+
+    def __init__(self):
+        task.Clock.__init__(self)
+        self.lock = threading.Lock()
+
+    def callFromThread(self, f, *args, **kwargs):
+        with self.lock:
+            f(*args, **kwargs)
+
+
+def test_decode_action_result():
+    ro_type, invoke_id, linked_state, linked_count, numerics = decoding.decodeActionResult(SAMPLE_POLL_REPLY)
+    assert (ro_type, invoke_id, linked_state, linked_count) == (intellivue.RORS_APDU, 0, None, None)
+    assert repr(numerics) == repr(intellivue.decodePollReplyExtNumerics(SAMPLE_POLL_REPLY))
+
+    assert decoding.decodeActionResult("\xe1\x00") is None
+
+
+class ControlledDecoding(object):
+    """
+    Decodes nothing itself: each Deferred it hands the PoolDecoder is fired by the test
+    """
+
+    def __init__(self):
+        self.decoding = []
+
+    def __call__(self, data):
+        d = defer.Deferred()
+        self.decoding.append((d, data))
+        return d
+
+
+def makeControlledDecoder(workers=4, max_queued=decoding.DEFAULT_MAX_QUEUED):
+    controlled = ControlledDecoding()
+    return decoding.PoolDecoder(controlled, workers, max_queued=max_queued, clock=ImmediateReactor()), controlled
+
+
+def test_results_kept_in_order_per_monitor():
+    decoder, controlled = makeControlledDecoder()
+    handled = []
+    for host, data in [(HOST, "a"), ("10.0.0.2", "b"), (HOST, "c")]:
+        decoder.submit(host, data, lambda host, decoded: handled.append((host, decoded)))
+    (a, _), (b, _), (c, _) = controlled.decoding
+
+    c.callback("C")
+    b.callback("B")
+    assert handled == [("10.0.0.2", "B")]
+    assert (decoder.stats()["queued"], decoder.stats()["reordering"]) == (1, 1)
+
+    a.errback(decoding.DecodeError("Broken"))
+    assert handled == [("10.0.0.2", "B"), (HOST, None), (HOST, "C")]
+    assert (decoder.stats()["queued"], decoder.stats()["reordering"], decoder.stats()["failed"]) == (0, 0, 1)
+    assert decoder.queues == {}
+
+
+def test_timed_out_decode_not_held_back():
+    decoder, controlled = makeControlledDecoder()
+    handled = []
+    for data in ("a", "b"):
+        decoder.submit(HOST, data, lambda host, decoded: handled.append(decoded))
+    (a, _), (b, _) = controlled.decoding
+
+    b.callback("B")
+    decoder.clock.advance(decoding.DEFAULT_TIMEOUT)
+    assert handled == [None, "B"]
+    assert decoder.stats()["failed"] == 1
+
+    a.callback("A")  # Too late
+    assert handled == [None, "B"]
+
+
+def test_saturated_pool():
+    decoder, controlled = makeControlledDecoder(workers=1, max_queued=2)
+    handled = []
+    for data in ("a", "b", "c"):
+        decoder.submit(HOST, data, lambda host, decoded: handled.append(decoded))
+    assert handled == [None]  # c, dropped
+    assert [data for _, data in controlled.decoding] == ["a"]
+    assert (decoder.stats()["queued"], decoder.stats()["dropped"]) == (2, 1)
+
+    decoder.clock.advance(decoding.DEFAULT_TIMEOUT - 1)
+    controlled.decoding[0][0].callback("A")
+    assert [data for _, data in controlled.decoding] == ["a", "b"]
+
+    decoder.clock.advance(decoding.DEFAULT_TIMEOUT - 1)  # b's timeout started when it was handed over, not when submitted
+    assert handled == [None, "A"]
+    decoder.clock.advance(1)
+    assert handled == [None, "A", None]
+    assert (decoder.stats()["queued"], decoder.stats()["failed"]) == (0, 1)
+
+
+def checkPool(decoder):
+    handled = []
+    with decoder.clock.lock:  # As though submitted from the reactor thread
+        for n in range(20):
+            decoder.submit(HOST, SAMPLE_POLL_REPLY, lambda host, decoded, n=n: handled.append(n))
+    # The pool's handed more as it finishes each, so wait for the last before closing it
+    deadline = time.time() + 10
+    while len(handled) < 20 and time.time() < deadline:
+        time.sleep(0.01)
+    return handled
+
+
+def test_thread_decoder():
+    decoder = decoding.ThreadDecoder(threads=4, clock=ImmediateReactor())
+    handled = checkPool(decoder)
+    decoder.close()
+    assert handled == range(20)
+    assert decoder.stats()["decoded"] == 20
+
+
+def test_process_decoder():
+    decoder = decoding.ProcessDecoder(processes=2, clock=ImmediateReactor())
+    handled = checkPool(decoder)
+    decoder.close()
+    assert handled == range(20)
+    assert (decoder.stats()["decoded"], decoder.stats()["failed"]) == (20, 0)
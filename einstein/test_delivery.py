@@ -0,0 +1,199 @@
+import json
+import zlib
+
+from twisted.internet import defer, task
+from twisted.python.failure import Failure
+from twisted.web.client import ResponseDone
+import pytest
+
+import api
+import delivery
+import subscriptions
+
+
+class FakeResponse(object):
+
+    def __init__(self, code=200):
+        self.code = code
+        self.length = 2
+
+    def deliverBody(self, protocol):
+        protocol.dataReceived("OK")
+        protocol.connectionLost(Failure(ResponseDone()))
+
+
+class FakeClient(object):
+    """
+    Records posts, leaving their Deferreds to be fired by the test
+    """
+
+    def __init__(self):
+        self.posts = []
+
+    def post(self, url, data=None, headers=None, timeout=None, reactor=None):
+        d = defer.Deferred()
+        self.posts.append((url, data, d))
+        return d
+
+
+def makeDelivery(**kwargs):
+    clock = task.Clock()
+    client = FakeClient()
+    return delivery.WebhookDelivery(clock=clock, client=client, **kwargs), client, clock
+
+
+SUBSCRIPTION = api.Subscription(monitor_id="00:09:fb:09:77:bd", url="http://hooks.example/a")
+
+
+def test_delivers_in_order():
+    webhooks, client, clock = makeDelivery()
+    webhooks.deliver(SUBSCRIPTION, "1")
+    webhooks.deliver(SUBSCRIPTION, "2")
+
+    assert [data for (_, data, _) in client.posts] == ["1"]  # One in flight per subscription
+
+    clock.advance(0.5)
+    client.posts[0][2].callback(FakeResponse())
+    assert [data for (_, data, _) in client.posts] == ["1", "2"]
+
+    client.posts[1][2].callback(FakeResponse())
+    stats = webhooks.stats()
+    assert stats["delivered"] == 2
+    assert stats["queued"] == 0
+    assert stats["latency_max"] == 0.5
+    assert webhooks.queues == {}
+
+
+@pytest.mark.parametrize("overflow, expected", [
+    (delivery.DROP_OLDEST, ["0", "2", "3"]),
+    (delivery.DROP_NEWEST, ["0", "1", "2"]),
+    (delivery.COALESCE, ["0", "1", "3"]),
+])
+def test_overflow(overflow, expected):
+    webhooks, client, clock = makeDelivery(max_queue=2, overflow=overflow)
+    for n in range(4):
+        webhooks.deliver(SUBSCRIPTION, str(n))
+
+    assert webhooks.stats()["queue_depths"] == {SUBSCRIPTION.subscription_id: 2}
+    assert webhooks.stats()["dropped"] == 1
+
+    for n in range(3):
+        client.posts[n][2].callback(FakeResponse())
+    assert [data for (_, data, _) in client.posts] == expected
+
+
+def test_per_destination_limit():
+    webhooks, client, clock = makeDelivery(max_per_destination=2)
+    subscriptions = [api.Subscription(monitor_id="00:09:fb:09:77:bd", url="http://hooks.example/%d" % n) for n in range(3)]
+    for subscription in subscriptions:
+        webhooks.deliver(subscription, "1")
+
+    assert len(client.posts) == 2
+
+    client.posts[0][2].callback(FakeResponse())
+    assert len(client.posts) == 3
+
+
+def test_failures_are_counted_and_queue_continues():
+    webhooks, client, clock = makeDelivery()
+    webhooks.deliver(SUBSCRIPTION, "1")
+    webhooks.deliver(SUBSCRIPTION, "2")
+    webhooks.deliver(SUBSCRIPTION, "3")
+
+    client.posts[0][2].errback(defer.CancelledError())
+    client.posts[1][2].callback(FakeResponse(code=500))
+    client.posts[2][2].callback(FakeResponse())
+
+    stats = webhooks.stats()
+    assert (stats["delivered"], stats["failed"]) == (1, 2)
+
+
+class StalledResponse(FakeResponse):
+
+    def deliverBody(self, protocol):
+        pass  # Sends its headers, then nothing
+
+
+def test_stalled_body_times_out():
+    webhooks, client, clock = makeDelivery(timeout=10)
+    webhooks.deliver(SUBSCRIPTION, "1")
+    webhooks.deliver(SUBSCRIPTION, "2")
+
+    client.posts[0][2].callback(StalledResponse())
+    assert len(client.posts) == 1
+
+    clock.advance(10)
+    assert webhooks.stats()["failed"] == 1
+    assert [data for (_, data, _) in client.posts] == ["1", "2"]
+
+
+def test_unknown_overflow_policy():
+    with pytest.raises(ValueError):
+        delivery.WebhookDelivery(client=FakeClient(), overflow="explode")
+
+
+def test_empty_queue():
+    with pytest.raises(ValueError):
+        delivery.WebhookDelivery(client=FakeClient(), max_queue=0)
+
+
+class RecordingWebhooks(object):
+
+    def __init__(self):
+        self.deliveries = []
+
+    def deliver(self, subscription, body, headers=None):
+        self.deliveries.append((subscription, body, headers))
+
+    def stats(self):
+        return {}
+
+
+def test_batch_flushes_at_size():
+    webhooks = RecordingWebhooks()
+    clock = task.Clock()
+    batches = delivery.WebhookBatches(webhooks, clock=clock)
+    subscription = api.Subscription(monitor_id="*", url="http://hooks.example/a", batch_size=2, batch_delay=5)
+
+    batches.add(subscription, '{"n": 1}')
+    assert webhooks.deliveries == []
+    batches.add(subscription, '{"n": 2}')
+
+    assert [json.loads(body) for (_, body, _) in webhooks.deliveries] == [[{"n": 1}, {"n": 2}]]
+    assert clock.getDelayedCalls() == []
+
+
+def test_batch_flushes_after_delay():
+    webhooks = RecordingWebhooks()
+    clock = task.Clock()
+    batches = delivery.WebhookBatches(webhooks, clock=clock)
+    subscription = api.Subscription(monitor_id="*", url="http://hooks.example/a", batch_size=10, batch_delay=5, content_encoding="gzip")
+
+    batches.add(subscription, '{"n": 1}')
+    clock.advance(4)
+    batches.add(subscription, '{"n": 2}')
+    assert webhooks.deliveries == []
+
+    clock.advance(1)
+    (_, body, headers), = webhooks.deliveries
+    assert json.loads(zlib.decompress(body, 16 + zlib.MAX_WBITS)) == [{"n": 1}, {"n": 2}]
+    assert headers[b'Content-Encoding'] == [b'gzip']
+    assert batches.stats() == {"batches": 0, "payloads": 0}
+
+
+def test_batch_dropped_with_subscription():
+    webhooks = RecordingWebhooks()
+    clock = task.Clock()
+    batches = delivery.WebhookBatches(webhooks, clock=clock)
+    registry = subscriptions.SubscriptionRegistry()
+    registry.observe(batches)
+    subscription = api.Subscription(monitor_id="*", url="http://hooks.example/a", batch_size=10, batch_delay=5)
+    registry.add(subscription)
+
+    batches.add(subscription, '{"n": 1}')
+    del registry[subscription.subscription_id]
+    clock.advance(5)
+
+    assert webhooks.deliveries == []
+    assert clock.getDelayedCalls() == []
+    assert batches.stats() == {"batches": 0, "payloads": 0}
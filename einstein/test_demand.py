@@ -0,0 +1,106 @@
+from twisted.internet import task
+
+import api
+import demand
+import intellivue
+import scheduler
+import streams
+import subscriptions
+from test_streams import follow
+
+HOST = "10.0.0.1"
+MAC = "00:09:fb:09:77:bd"
+
+
+def makeDemand(**kwargs):
+    s = scheduler.PollScheduler(clock=task.Clock(), send=lambda host, poll_number: True)
+    d = demand.PollDemand(s, subscriptions.SubscriptionRegistry(), streams.StreamHub(), {HOST: MAC}, **kwargs)
+    s.add(HOST, wanted=d.wanted(HOST))
+    return d
+
+
+def test_follows_subscriptions():
+    d = makeDemand()
+    assert not d.scheduler.targets[HOST].wanted
+
+    for monitor_id in (MAC, subscriptions.ALL_MONITORS):
+        subscription = api.Subscription(monitor_id=monitor_id, url="http://hooks.example/")
+        d.subscriptions.add(subscription)
+        assert d.scheduler.targets[HOST].wanted
+        del d.subscriptions[subscription.subscription_id]
+        assert not d.scheduler.targets[HOST].wanted
+
+
+def test_follows_streams():
+    d = makeDemand()
+    client, _ = follow(d.streams, [MAC])
+    assert d.scheduler.targets[HOST].wanted
+    assert d.stats()["wanted"] == 1
+
+    client.close()
+    assert not d.scheduler.targets[HOST].wanted
+    assert d.stats()["idle"] == 1
+
+
+def test_retained_and_unknown_wanted():
+    assert makeDemand(retained=True).scheduler.targets[HOST].wanted
+    assert makeDemand().wanted("10.0.0.2")
+
+
+class RecordingHandler(object):
+
+    def __init__(self):
+        self.requests = []
+
+    def getPriorityList(self, host):
+        self.requests.append((host, None))
+        return len(self.requests)
+
+    def setPriorityList(self, host, physio_ids):
+        self.requests.append((host, physio_ids))
+        return len(self.requests)
+
+
+def makePriorityLists():
+    clock = task.Clock()
+    handler = RecordingHandler()
+    p = demand.PriorityLists(subscriptions.SubscriptionRegistry(), streams.StreamHub(), {HOST: MAC}, clock=clock, handler=handler)
+    p.connected(HOST)
+    return p, clock, handler
+
+
+def test_priority_list_union_of_subscriptions():
+    p, clock, handler = makePriorityLists()
+    assert handler.requests == [(HOST, None)]
+    p.received(HOST, 1, [intellivue.NOM_ECG_CARD_BEAT_RATE, intellivue.NOM_RESP_RATE, intellivue.NOM_PULS_OXIM_SAT_O2])
+    assert len(handler.requests) == 1
+
+    p.subscriptions.add(api.Subscription(monitor_id=MAC, url="http://hooks.example/", physio_ids=["NOM_RESP_RATE"]))
+    p.subscriptions.add(api.Subscription(monitor_id=subscriptions.ALL_MONITORS, url="http://hooks.example/", physio_ids=["NOM_ECG_CARD_BEAT_RATE"]))
+    assert handler.requests[1:] == [(HOST, [intellivue.NOM_RESP_RATE])]  # The second waits for the first to be answered
+
+    p.received(HOST, 2, None)
+    assert handler.requests[2:] == [(HOST, [intellivue.NOM_ECG_CARD_BEAT_RATE, intellivue.NOM_RESP_RATE])]
+    p.received(HOST, 3, None)
+    assert p.stats()["restricted"] == 1
+
+    # A stream wants them all, so the monitor's own list is restored
+    follow(p.streams, [MAC])
+    assert handler.requests[3:] == [(HOST, [intellivue.NOM_ECG_CARD_BEAT_RATE, intellivue.NOM_PULS_OXIM_SAT_O2, intellivue.NOM_RESP_RATE])]
+    p.received(HOST, 4, None)
+    assert p.stats()["restricted"] == 0
+
+
+def test_priority_list_left_alone_if_unsupported():
+    p, clock, handler = makePriorityLists()
+    p.failed(HOST, 1)
+    p.subscriptions.add(api.Subscription(monitor_id=MAC, url="http://hooks.example/", physio_ids=["NOM_RESP_RATE"]))
+    assert handler.requests == [(HOST, None)]
+    assert p.stats()["unsupported"] == 1
+
+
+def test_priority_list_retried_then_given_up():
+    p, clock, handler = makePriorityLists()
+    clock.pump([demand.DEFAULT_PRIORITY_LIST_TIMEOUT] * 5)
+    assert handler.requests == [(HOST, None)] * demand.PRIORITY_LIST_ATTEMPTS
+    assert p.stats()["unsupported"] == 1
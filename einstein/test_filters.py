@@ -0,0 +1,52 @@
+import api
+import filters
+
+MAC = "00:09:fb:09:77:bd"
+
+
+def observations(heart_rate, spo2):
+    return [
+        api.Observation(physio_id="NOM_ECG_CARD_BEAT_RATE", state=(), unit_code="NOM_DIM_BEAT_PER_MIN", value=heart_rate),
+        api.Observation(physio_id="NOM_PULS_OXIM_SAT_O2", state=(), unit_code="NOM_DIM_PERCENT", value=spo2),
+    ]
+
+
+def test_unfiltered():
+    subscription = api.Subscription(monitor_id=MAC, url="http://hooks.example/a")
+    assert filters.ObservationFilters().select(subscription, MAC, observations(72, 98), 0) is None
+
+
+def test_physio_ids():
+    subscription = api.Subscription(monitor_id=MAC, url="http://hooks.example/a", physio_ids=["NOM_PULS_OXIM_SAT_O2"])
+    assert filters.ObservationFilters().select(subscription, MAC, observations(72, 98), 0) == (1,)
+
+
+def test_changed_only():
+    f = filters.ObservationFilters()
+    subscription = api.Subscription(monitor_id=MAC, url="http://hooks.example/a", changed_only=True, max_interval=10)
+
+    assert f.select(subscription, MAC, observations(72, 98), 0) is None
+    assert f.select(subscription, MAC, observations(72, 98), 2) == ()
+    assert f.select(subscription, MAC, observations(73, 98), 4) == (0,)
+    assert f.select(subscription, MAC, observations(73, float("nan")), 6) == (1,)
+    assert f.select(subscription, MAC, observations(73, float("nan")), 8) == ()
+    assert f.select(subscription, MAC, observations(73, float("nan")), 14) == (0,)  # Not sent since 4
+
+
+def test_deadbands():
+    f = filters.ObservationFilters()
+    subscription = api.Subscription(monitor_id=MAC, url="http://hooks.example/a", deadbands={"NOM_ECG_CARD_BEAT_RATE": 2})
+
+    assert f.select(subscription, MAC, observations(72, 98), 0) is None
+    assert f.select(subscription, MAC, observations(74, 98), 2) == (1,)  # SpO2 has no deadband, so is always sent
+    assert f.select(subscription, MAC, observations(75, 98), 4) is None  # Everything
+    assert f.select(subscription, MAC, observations(73, 98), 6) == (1,)  # Still within 2 of 75
+
+
+def test_forgets_removed_subscriptions():
+    f = filters.ObservationFilters()
+    subscription = api.Subscription(monitor_id=MAC, url="http://hooks.example/a", changed_only=True)
+    f.select(subscription, MAC, observations(72, 98), 0)
+
+    f.subscriptionRemoved(subscription)
+    assert f.last_sent == {}
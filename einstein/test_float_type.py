@@ -1,5 +1,6 @@
 import float_type
 import math
+import numpy
 import pytest
 
 def test_basic():
@@ -52,6 +53,67 @@ def test_negative():
 
 
 # There is no decode-encode identity because encodings aren't normalised
-@pytest.mark.skip(reason="No decode implementation and no Hypothesis hookup yet")
+@pytest.mark.parametrize("num", [0, 1, -1, 32, 3200, 1.5, 0.3, 98.1, -40.25, 8388605, 1234567e10, 1.5e-20])
 def test_encode_decode_identity(num):
     assert float_type.decode(float_type.encode(num)) == num
+
+
+def test_encode_normalises():
+    assert float_type.encode(32) == 0x00000020
+    assert float_type.encode(3200) == 0x02000020
+    assert float_type.encode(1.5) == 0xff00000f
+    assert float_type.encode(-1) == 0x00ffffff
+
+
+def test_encode_rounds_to_mantissa_precision():
+    assert float_type.decode(float_type.encode(16777215)) == 16777220
+    assert float_type.decode(float_type.encode(1.0 / 3)) == 0.3333333
+
+
+def test_encode_special_values():
+    assert float_type.encode(float("NaN")) == float_type.NAN
+    assert float_type.encode(float("Inf")) == float_type.POSITIVE_INFINITY
+    assert float_type.encode(float("-Inf")) == float_type.NEGATIVE_INFINITY
+    assert float_type.encode(1e300) == float_type.POSITIVE_INFINITY
+    assert float_type.encode(-1e300) == float_type.NEGATIVE_INFINITY
+    assert float_type.encode(1e-300) == 0
+
+
+RANDOM_ENCODED = numpy.random.RandomState(0).randint(0, 2 ** 32, size=10000, dtype=numpy.uint64).astype(numpy.uint32)
+
+
+def test_decode_many_matches_decode():
+    exponents = (RANDOM_ENCODED >> 24).astype(numpy.uint8).view(numpy.int8)
+    encoded = RANDOM_ENCODED[exponents <= 22]  # Beyond this, decode is exact integer arithmetic and decode_many isn't
+
+    expected = numpy.array([float(float_type.decode(int(e))) for e in encoded])
+    numpy.testing.assert_array_equal(float_type.decode_many(encoded), expected)
+
+
+def test_decode_many_buffer():
+    values = float_type.decode_many("\xfd\x00\x7d\x00\xff\x00\x01\x40\x00\xff\xff\xff")
+
+    numpy.testing.assert_array_equal(values, [32, 32, -1])
+
+
+def test_decode_many_masks():
+    encoded = numpy.array([0x007fffff, 0x00800000, 0x007ffffe, 0x00800002, 0x00000001], dtype=numpy.uint32)
+    values, masks = float_type.decode_many(encoded, masks=True)
+
+    assert numpy.isnan(values[:2]).all()
+    assert list(values[2:]) == [float("Inf"), float("-Inf"), 1]
+    assert list(masks["nan"]) == [True, False, False, False, False]
+    assert list(masks["nres"]) == [False, True, False, False, False]
+    assert list(masks["inf"]) == [False, False, True, False, False]
+    assert list(masks["-inf"]) == [False, False, False, True, False]
+
+
+def test_encode_many_matches_encode():
+    values = numpy.concatenate([
+        float_type.decode_many(RANDOM_ENCODED),
+        numpy.random.RandomState(0).randn(10000) * 1000,
+        [0, 1e300, -1e300, 1e-300, 16777215, 0.1],
+    ])
+
+    expected = numpy.array([float_type.encode(v) for v in values], dtype=numpy.uint32)
+    numpy.testing.assert_array_equal(float_type.encode_many(values), expected)
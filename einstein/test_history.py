@@ -0,0 +1,49 @@
+import api
+import history
+
+
+def test_ring_buffer_wraps():
+    buffer = history.RingBuffer(capacity=100)
+    for t in range(250):
+        buffer.append(t, t * 10.0)
+
+    times, values = buffer.ordered()
+    assert len(buffer) == 100
+    assert list(times) == range(150, 250)
+    assert list(values) == [t * 10.0 for t in range(150, 250)]
+
+
+def test_range():
+    buffer = history.RingBuffer(capacity=100)
+    for t in range(250):
+        buffer.append(t, t * 10.0)
+
+    times, values = buffer.range(since=195.5, until=205)
+    assert list(times) == range(196, 206)
+    assert list(values) == [t * 10.0 for t in range(196, 206)]
+
+    assert len(buffer.range(until=100)[0]) == 0
+    assert len(buffer.range(since=240)[0]) == 10
+
+
+def test_times_kept_in_order():
+    buffer = history.RingBuffer()
+    buffer.append(10, 1)
+    buffer.append(9, 2)  # e.g. the clock was stepped back
+
+    assert list(buffer.ordered()[0]) == [10, 10]
+
+
+def test_query():
+    h = history.ObservationHistory()
+    for t in range(10):
+        h.record("00:09:fb:09:77:bd", t, [
+            api.Observation(physio_id="NOM_ECG_CARD_BEAT_RATE", value=70 + t),
+            api.Observation(physio_id="NOM_PULS_OXIM_SAT_O2", value=98),
+        ])
+
+    results = h.query("00:09:fb:09:77:bd", ["NOM_ECG_CARD_BEAT_RATE"], since=8)
+    assert results.keys() == ["NOM_ECG_CARD_BEAT_RATE"]
+    assert list(results["NOM_ECG_CARD_BEAT_RATE"][1]) == [78, 79]
+    assert h.query("00:09:fb:09:77:be") == {}
+    assert h.stats()["points"] == 20
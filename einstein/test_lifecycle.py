@@ -0,0 +1,102 @@
+from twisted.internet import task
+
+import lifecycle
+
+HOST = "10.0.0.1"
+
+
+class RecordingHandler(object):
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda host: self.calls.append((self.clock.seconds(), name, host))
+
+    def named(self, name):
+        return [t for (t, n, _) in self.calls if n == name]
+
+
+def makeLifecycle(**kwargs):
+    clock = task.Clock()
+    handler = RecordingHandler(clock)
+    return lifecycle.MonitorLifecycle(clock=clock, handler=handler, **kwargs), clock, handler
+
+
+def test_connects():
+    l, clock, handler = makeLifecycle()
+    l.discovered(HOST)
+    assert l.state(HOST) == lifecycle.ASSOCIATING
+    l.associated(HOST)
+    assert l.state(HOST) == lifecycle.ASSOCIATED
+    l.connected(HOST)
+    assert l.state(HOST) == lifecycle.CONNECTED
+
+    clock.advance(100)  # No timeouts left pending
+    assert [name for (_, name, _) in handler.calls] == ["associate", "monitorConnected"]
+
+
+def test_retries_with_backoff():
+    l, clock, handler = makeLifecycle(associate_timeout=5, retry_delay=2, max_retry_delay=8)
+    l.discovered(HOST)
+    for _ in range(40):
+        clock.advance(1)
+        l.discovered(HOST)  # ConnectIndications keep coming, but don't hurry retries
+
+    # Timeouts at 5, 12, 21, 34; each retry 2, 4, 8, 8 seconds after
+    assert handler.named("associate") == [0, 7, 16, 29]
+    assert l.stats()["timeouts"] == 4
+
+    l.associated(HOST)
+    l.connected(HOST)
+    l.dropped(HOST)
+    assert l.state(HOST) == lifecycle.DISCOVERED
+    clock.advance(2)
+    assert l.state(HOST) == lifecycle.ASSOCIATING
+
+
+def test_connect_timeout_releases():
+    l, clock, handler = makeLifecycle(connect_timeout=10)
+    l.discovered(HOST)
+    l.associated(HOST)
+    clock.advance(10)
+
+    assert handler.named("release") == [10]
+    assert l.state(HOST) == lifecycle.DISCOVERED
+
+
+def test_keepalive_then_eviction():
+    l, clock, handler = makeLifecycle(keepalive_after=10, stale_after=30, check_interval=5)
+    l.start()
+    l.discovered(HOST)
+    l.associated(HOST)
+    l.connected(HOST)
+
+    clock.pump([5] * 4)
+    l.seen(HOST)
+    clock.pump([5] * 8)
+
+    assert handler.named("keepAlive") == [10, 15, 20, 30, 35, 40, 45]
+    assert [name for (_, name, _) in handler.calls][-3:] == ["release", "monitorDisconnected", "monitorForgotten"]
+    assert l.state(HOST) is None
+    assert l.stats()["evicted"] == 1
+
+
+def test_stop_releases():
+    l, clock, handler = makeLifecycle()
+    l.start()
+    l.discovered(HOST)
+    l.discovered("10.0.0.2")
+    l.associated(HOST)
+    l.connected(HOST)
+
+    l.stop()
+    assert sorted((name, host) for (_, name, host) in handler.calls if name in ("release", "monitorForgotten")) == [
+        ("monitorForgotten", "10.0.0.2"),
+        ("release", HOST),
+    ]
+    assert l.state(HOST) == lifecycle.RELEASING
+
+    l.dropped(HOST)  # The release response
+    assert l.associations == {}
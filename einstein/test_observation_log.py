@@ -0,0 +1,51 @@
+import intellivue
+import observation_log
+
+MAC = "00:09:fb:09:77:bd"
+OTHER_MAC = "00:09:fb:09:77:be"
+
+
+def numerics(heart_rate):
+    return [
+        (intellivue.NOM_ECG_CARD_BEAT_RATE, 0, intellivue.NOM_DIM_BEAT_PER_MIN, heart_rate),
+        (intellivue.NOM_PULS_OXIM_SAT_O2, 0, intellivue.NOM_DIM_PERCENT, 98.0),
+    ]
+
+
+def test_append_and_query(tmpdir):
+    log = observation_log.ObservationLog(str(tmpdir), segment_records=10, batch_records=4)
+    for t in range(20):
+        log.append(MAC, t, numerics(60 + t))
+        log.append(OTHER_MAC, t, numerics(100))
+
+    assert log.stats()["segments"] > 2
+
+    records = log.query(MAC, [intellivue.NOM_ECG_CARD_BEAT_RATE], since=5, until=14)
+    values = [value for r in records for value in r["value"]]
+    assert values == range(65, 75)
+    assert all(m == log.monitorIndex(MAC) for r in records for m in r["monitor"])
+
+
+def test_survives_restart(tmpdir):
+    log = observation_log.ObservationLog(str(tmpdir), segment_records=10, batch_records=4)
+    for t in range(7):
+        log.append(MAC, t, numerics(60 + t))
+    log.close()
+
+    # A torn write at the end of the last segment
+    with open(log.segments[-1].path, "ab") as f:
+        f.write("\x00" * 5)
+
+    log = observation_log.ObservationLog(str(tmpdir), segment_records=10, batch_records=4)
+    log.append(OTHER_MAC, 7, numerics(100))
+    log.append(MAC, 8, numerics(68))
+
+    assert log.monitors == [MAC, OTHER_MAC]
+    records = log.query(MAC, [intellivue.NOM_ECG_CARD_BEAT_RATE])
+    assert [value for r in records for value in r["value"]] == [60, 61, 62, 63, 64, 65, 66, 68]
+
+
+def test_identifier_code():
+    assert observation_log.identifierCode("NOM_ECG_CARD_BEAT_RATE") == intellivue.NOM_ECG_CARD_BEAT_RATE
+    assert observation_log.identifierCode("12345") == 12345
+    assert observation_log.identifierCode(intellivue.IDENTIFIER_LABELS[1234]) == 1234
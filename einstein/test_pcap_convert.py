@@ -0,0 +1,23 @@
+import numpy
+import pytest
+
+import intellivue
+import pcap_convert
+from test_replay import MONITOR, makeCapture
+
+
+def test_convert(tmpdir):
+    summary = pcap_convert.convertCapture(makeCapture(tmpdir), str(tmpdir), validate=True)
+
+    assert summary["poll_replies"] == 5
+    assert summary["observations"] == 15
+    assert summary["mismatches"] == 0
+
+    columns = numpy.load(summary["output"])
+    assert list(columns["sources"]) == [MONITOR[0]]
+    assert list(columns["macs"]) == ["00:09:fb:09:77:bd"]
+    assert list(columns["physio_id"][:3]) == [intellivue.NOM_PULS_OXIM_SAT_O2, intellivue.NOM_ECG_CARD_BEAT_RATE, intellivue.NOM_RESP_RATE]
+    assert columns["value"][0] == pytest.approx(98.1)
+    assert columns["value"][1] == 72
+    assert numpy.isnan(columns["value"][2])
+    assert columns["time"][0] == 1541421001
@@ -0,0 +1,42 @@
+from twisted.internet import task
+
+import capture
+import intellivue
+import replay
+from intellivue.test_fast_path import SAMPLE_POLL_REPLY
+from test_intellivue import SAMPLE_CONNECT_INDICATION
+
+MONITOR = ("10.0.0.1", intellivue.PORT_PROTOCOL)
+LOCAL = ("10.0.0.2", intellivue.PORT_CONNECTION_INDICATION)
+
+
+def makeCapture(tmpdir):
+    clock = task.Clock()
+    clock.advance(1541421000)
+    filename = str(tmpdir.join("dump.pcap"))
+    writer = capture.CaptureWriter(filename, clock=clock)
+    writer.write(SAMPLE_CONNECT_INDICATION, (MONITOR[0], intellivue.PORT_CONNECTION_INDICATION), LOCAL)
+    for _ in range(5):
+        clock.advance(1)
+        writer.write(SAMPLE_POLL_REPLY, MONITOR, LOCAL)
+    writer.close()
+    return filename
+
+
+def test_read_capture(tmpdir):
+    (timestamp, data, src), = list(replay.readCapture(makeCapture(tmpdir)))[:1]
+    assert timestamp == 1541421000
+    assert data == SAMPLE_CONNECT_INDICATION
+    assert src == (MONITOR[0], intellivue.PORT_CONNECTION_INDICATION)
+
+
+def test_fan_out(tmpdir):
+    r = replay.Replay(monitors=3, subscribers=2)
+    report = r.run(makeCapture(tmpdir), loops=2)
+
+    assert report["datagrams"] == 36
+    assert report["stages"][intellivue.CONNECT_INDICATION]["count"] == 6
+    assert report["stages"]["RORS_APDU CMD_CONFIRMED_ACTION"]["count"] == 30
+    assert report["webhooks"]["delivered"] == 60
+    assert sorted(r.interface.monitors) == ["02:00:00:00:00:00", "02:00:00:00:00:01", "02:00:00:00:00:02"]
+    assert r.clock.seconds() == 1541421000 + 5 + 1 + 5  # Both loops, a second apart, in capture time
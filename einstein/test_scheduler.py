@@ -0,0 +1,120 @@
+from twisted.internet import task
+
+import scheduler
+
+
+class Recorder(object):
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.polls = []
+        self.sending = True
+
+    def __call__(self, host, poll_number):
+        if not self.sending:
+            return False
+        self.polls.append((self.clock.seconds(), host, poll_number))
+        return True
+
+
+def makeScheduler(**kwargs):
+    clock = task.Clock()
+    polls = Recorder(clock)
+    return scheduler.PollScheduler(clock=clock, send=polls, **kwargs), clock, polls
+
+
+def test_phases_spread():
+    s, clock, polls = makeScheduler(interval=2)
+    for n in range(4):
+        s.add("10.0.0.%d" % n)
+
+    for _ in range(20):
+        clock.advance(0.1)
+        for host in s.targets:
+            s.replied(host)
+
+    first = sorted(t for (t, host, _) in polls.polls if t < 2)
+    assert len(first) == 4
+    assert min(b - a for (a, b) in zip(first, first[1:])) >= 0.4
+
+
+def test_per_monitor_interval():
+    s, clock, polls = makeScheduler(interval=2)
+    s.add("10.0.0.1")
+    s.add("10.0.0.2", interval=5)
+
+    for _ in range(100):
+        clock.advance(0.1)
+        for host in s.targets:
+            s.replied(host)
+
+    counts = dict((host, sum(1 for (_, h, _) in polls.polls if h == host)) for host in s.targets)
+    assert counts == {"10.0.0.1": 5, "10.0.0.2": 2}
+    assert [n for (_, h, n) in polls.polls if h == "10.0.0.1"] == [1, 2, 3, 4, 5]
+
+
+def test_skips_while_outstanding_then_backs_off():
+    s, clock, polls = makeScheduler(interval=2, reply_timeout=5, max_interval=16)
+    s.add("10.0.0.1")
+
+    clock.advance(0)
+    clock.pump([2] * 20)
+
+    # Sent at 0, skipped at 2 and 4, given up on at 6, then every 4, 8, 16, 16... seconds
+    assert [t for (t, _, _) in polls.polls] == [0, 6, 10, 18, 34]
+    assert s.stats()["skipped"] == 2
+    assert s.stats()["missed"] == 4
+    assert s.stats()["backing_off"] == 1
+
+    clock.advance(10)
+    s.replied("10.0.0.1")
+    assert s.stats()["backing_off"] == 0
+    clock.advance(2)
+    assert [t for (t, _, _) in polls.polls][-2:] == [50, 52]
+
+
+def test_remove_and_stop():
+    s, clock, polls = makeScheduler(interval=2)
+    s.add("10.0.0.1")
+    s.add("10.0.0.2")
+    s.remove("10.0.0.1")
+    clock.advance(2)
+    assert [h for (_, h, _) in polls.polls] == ["10.0.0.2"]
+
+    s.stop()
+    assert not clock.getDelayedCalls()
+    assert s.stats()["monitors"] == 0
+
+
+def test_idle_until_wanted():
+    s, clock, polls = makeScheduler(interval=2, idle_interval=8)
+    s.add("10.0.0.1", wanted=False)
+    assert s.stats()["idle"] == 1
+
+    clock.advance(0)
+    for _ in range(20):
+        clock.advance(0.5)
+        s.replied("10.0.0.1")
+    assert [t for (t, _, _) in polls.polls] == [0, 8]
+
+    # Polled within the full interval, not at the next idle poll (16)
+    s.setWanted("10.0.0.1", True)
+    clock.advance(2)
+    s.replied("10.0.0.1")
+    assert len(polls.polls) == 3
+    assert s.stats()["idle"] == 0
+
+
+def test_unsent_polls_not_missed():
+    s, clock, polls = makeScheduler(interval=2, reply_timeout=5)
+    s.add("10.0.0.1")
+
+    polls.sending = False  # e.g. too many requests in flight
+    clock.advance(0)
+    clock.pump([2] * 10)
+    assert s.stats()["unsent"] == 11
+    assert (s.stats()["sent"], s.stats()["missed"], s.stats()["backing_off"]) == (0, 0, 0)
+
+    polls.sending = True
+    clock.advance(2)
+    assert [(t, n) for (t, _, n) in polls.polls] == [(22, 1)]
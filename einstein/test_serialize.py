@@ -0,0 +1,40 @@
+import datetime
+import json
+import zlib
+
+import attr
+
+import api
+import serialize
+from util import json_serialize
+
+
+PAYLOAD = api.Payload(
+    monitor_id="00:09:fb:09:77:bd",
+    datetime=datetime.datetime(2018, 11, 5, 12, 30, 1, 250000),
+    observations=[
+        api.Observation(physio_id="NOM_PULS_OXIM_SAT_O2", state=(), unit_code="NOM_DIM_PERCENT", value=98.1),
+        api.Observation(physio_id="NOM_ECG_CARD_BEAT_RATE", state=("MSMT_STATE_IN_ALARM",), unit_code="NOM_DIM_BEAT_PER_MIN", value=72),
+    ],
+)
+
+
+def test_matches_attr_asdict():
+    assert serialize.SerializedPayload(PAYLOAD).json == json.dumps(attr.asdict(PAYLOAD), default=json_serialize)
+
+
+def test_serialized_once():
+    serialized = serialize.SerializedPayload(PAYLOAD)
+    body, headers = serialized.encoded()
+
+    assert serialized.encoded()[0] is body
+    assert headers == {b'Content-Type': [b'application/json']}
+
+
+def test_gzip():
+    serialized = serialize.SerializedPayload(PAYLOAD)
+    body, headers = serialized.encoded(serialize.GZIP)
+
+    assert serialized.encoded(serialize.GZIP)[0] is body
+    assert zlib.decompress(body, 16 + zlib.MAX_WBITS) == serialized.json
+    assert headers[b'Content-Encoding'] == [b'gzip']
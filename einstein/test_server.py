@@ -1,4 +1,226 @@
+import json
+
+from twisted.internet import task
+from twisted.test import proto_helpers
+
+import api
+import decoding
+import intellivue
+import lifecycle
 import server
+from intellivue.test_fast_path import SAMPLE_OBSERVATION_POLLS, makePollReply
+from test_delivery import RecordingWebhooks
+from test_intellivue import SAMPLE_CONNECT_INDICATION
+
+MONITOR = ("10.0.0.1", intellivue.PORT_PROTOCOL)
+
+
+def makeInterface():
+    interface = server.IntellivueInterface(clock=task.Clock())
+    interface.transport = proto_helpers.FakeDatagramTransport()
+    return interface
+
 
 def test_server():
     pass
+
+
+def test_connect_indication_starts_association():
+    interface = makeInterface()
+    interface.datagramReceived(SAMPLE_CONNECT_INDICATION, MONITOR)
+
+    assert interface.host_to_mac[MONITOR[0]] == "00:09:fb:09:77:bd"
+    assert interface.monitors["00:09:fb:09:77:bd"].host == MONITOR[0]
+    assert interface.transport.written == [(interface.associationRequest, (MONITOR[0], intellivue.PORT_PROTOCOL))]
+    assert interface.datagramCounts == {intellivue.CONNECT_INDICATION: 1}
+
+
+def test_association_messages():
+    interface = makeInterface()
+    interface.datagramReceived(str(intellivue.SessionHeader(type=intellivue.AC_SPDU_SI)), MONITOR)
+    assert interface.lifecycle.state(MONITOR[0]) == lifecycle.ASSOCIATED
+
+    interface.datagramReceived(str(intellivue.SessionHeader(type=intellivue.AB_SPDU_SI)), MONITOR)
+    assert interface.lifecycle.state(MONITOR[0]) == lifecycle.DISCOVERED
+
+    assert interface.datagramCounts == {"AC_SPDU_SI": 1, "AB_SPDU_SI": 1}
+
+
+def test_unknown_datagram():
+    interface = makeInterface()
+    interface.datagramReceived("\xff\xff", MONITOR)
+
+    assert interface.datagramCounts == {intellivue.UNKNOWN: 1}
+
+
+def test_dumpfilename_captures_datagrams(tmpdir):
+    filename = str(tmpdir.join("dump.pcap"))
+    interface = server.IntellivueInterface(dumpfilename=filename, clock=task.Clock())
+    interface.transport = proto_helpers.FakeDatagramTransport()
+    interface.datagramReceived("\xff\xff", MONITOR)
+
+    assert interface.stats["capture"]()["buffered"] > 0
+    interface.capture.close()
+    assert interface.stats["capture"]()["written"] > 0
+
+
+def test_numerics_serialised_once_per_poll():
+    webhooks = RecordingWebhooks()
+    interface = server.IntellivueInterface(webhooks=webhooks)
+    interface.host_to_mac[MONITOR[0]] = "00:09:fb:09:77:bd"
+    for url in ["http://hooks.example/a", "http://hooks.example/b"]:
+        subscription = api.Subscription(monitor_id="00:09:fb:09:77:bd", url=url)
+        interface.subscriptions[subscription.subscription_id] = subscription
+
+    interface.handleNumerics(MONITOR[0], [(intellivue.NOM_ECG_CARD_BEAT_RATE, 0, intellivue.NOM_DIM_BEAT_PER_MIN, 72)])
+
+    first, second = webhooks.deliveries
+    assert first[1] is second[1]
+    assert json.loads(first[1])["observations"][0]["value"] == 72
+
+
+def test_numerics_filtered_by_physio_id():
+    webhooks = RecordingWebhooks()
+    interface = server.IntellivueInterface(webhooks=webhooks)
+    interface.host_to_mac[MONITOR[0]] = "00:09:fb:09:77:bd"
+    interface.subscriptions.add(api.Subscription(monitor_id="00:09:fb:09:77:bd", url="http://hooks.example/hr", physio_ids=["NOM_ECG_CARD_BEAT_RATE"]))
+    interface.subscriptions.add(api.Subscription(monitor_id="*", url="http://hooks.example/spo2", physio_ids=["NOM_PULS_OXIM_SAT_O2"]))
+
+    interface.handleNumerics(MONITOR[0], [(intellivue.NOM_ECG_CARD_BEAT_RATE, 0, intellivue.NOM_DIM_BEAT_PER_MIN, 72)])
+
+    (subscription, body, _), = webhooks.deliveries
+    assert subscription.url == "http://hooks.example/hr"
+    assert [o["physio_id"] for o in json.loads(body)["observations"]] == ["NOM_ECG_CARD_BEAT_RATE"]
+
+
+def test_aggregate_subscription():
+    webhooks = RecordingWebhooks()
+    clock = task.Clock()
+    interface = server.IntellivueInterface(webhooks=webhooks, clock=clock)
+    interface.host_to_mac[MONITOR[0]] = "00:09:fb:09:77:bd"
+    interface.subscriptions.add(api.Subscription(monitor_id="00:09:fb:09:77:bd", url="http://hooks.example/trend", aggregate=12))
+
+    for heart_rate in range(60, 74):
+        interface.handleNumerics(MONITOR[0], [(intellivue.NOM_ECG_CARD_BEAT_RATE, 0, intellivue.NOM_DIM_BEAT_PER_MIN, heart_rate)])
+        clock.advance(1)
+
+    (_, body, _), = webhooks.deliveries
+    aggregate, = json.loads(body)["aggregates"]
+    assert (aggregate["window"], aggregate["count"], aggregate["min"], aggregate["max"]) == (12, 12, 61, 72)
+
+
+def test_poll_replies_matched_and_reassembled():
+    webhooks = RecordingWebhooks()
+    interface = server.IntellivueInterface(webhooks=webhooks, clock=task.Clock())
+    interface.transport = proto_helpers.FakeDatagramTransport()
+    interface.host_to_mac[MONITOR[0]] = "00:09:fb:09:77:bd"
+    interface.subscriptions.add(api.Subscription(monitor_id="00:09:fb:09:77:bd", url="http://hooks.example/"))
+
+    interface.pollHost(MONITOR[0], 1)
+    (poll, _), = interface.transport.written
+    invoke_id = intellivue.SPpdu(poll)[intellivue.ROIVapdu].invoke_id
+
+    def linked(state, count):
+        return makePollReply(intellivue.ROLRS_APDU, intellivue.ROLRSapdu(
+            linked_id=intellivue.RorlsId(state=state, count=count),
+            invoke_id=invoke_id,
+            command_type=intellivue.CMD_CONFIRMED_ACTION,
+        ), SAMPLE_OBSERVATION_POLLS)
+
+    interface.datagramReceived(linked(intellivue.RORLS_FIRST, 1), MONITOR)
+    interface.datagramReceived(linked(intellivue.RORLS_LAST, 2), MONITOR)
+    assert webhooks.deliveries == []
+
+    final = makePollReply(intellivue.RORS_APDU, intellivue.RORSapdu(invoke_id=invoke_id, command_type=intellivue.CMD_CONFIRMED_ACTION), [])
+    interface.datagramReceived(final, MONITOR)
+    interface.datagramReceived(final, MONITOR)  # A duplicate
+
+    (_, body, _), = webhooks.deliveries
+    assert len(json.loads(body)["observations"]) == 4  # Two valid observations from each linked result
+    assert interface.tracker.stats()["unmatched"] == 1
+
+
+def test_stale_monitor_evicted():
+    clock = task.Clock()
+    interface = server.IntellivueInterface(clock=clock)
+    interface.transport = proto_helpers.FakeDatagramTransport()
+    interface.lifecycle.start()
+
+    interface.datagramReceived(SAMPLE_CONNECT_INDICATION, MONITOR)
+    interface.datagramReceived(str(intellivue.SessionHeader(type=intellivue.AC_SPDU_SI)), MONITOR)
+    interface.lifecycle.connected(MONITOR[0])
+    assert MONITOR[0] in interface.scheduler.targets
+
+    clock.pump([1] * lifecycle.DEFAULT_STALE_AFTER + [lifecycle.DEFAULT_CHECK_INTERVAL])
+
+    assert interface.lifecycle.state(MONITOR[0]) is None
+    assert MONITOR[0] not in interface.scheduler.targets
+    assert interface.host_to_mac == {}
+    assert interface.monitors == {}
+    assert interface.transport.written[-1] == (intellivue.ReleaseRequest, (MONITOR[0], intellivue.PORT_PROTOCOL))
+
+
+def test_unwatched_monitors_polled_idly():
+    interface = makeInterface()
+    interface.datagramReceived(SAMPLE_CONNECT_INDICATION, MONITOR)
+    interface.lifecycle.connected(MONITOR[0])
+    assert not interface.scheduler.targets[MONITOR[0]].wanted
+
+    mac = interface.host_to_mac[MONITOR[0]]
+    interface.subscriptions.add(api.Subscription(monitor_id=mac, url="http://hooks.example/"))
+    assert interface.scheduler.targets[MONITOR[0]].wanted
+    assert interface.stats["demand"]()["wanted"] == 1
+
+
+def test_priority_list_follows_subscriptions():
+    interface = server.IntellivueInterface(priority_lists=True, clock=task.Clock())
+    interface.transport = proto_helpers.FakeDatagramTransport()
+    interface.datagramReceived(SAMPLE_CONNECT_INDICATION, MONITOR)
+    assert intellivue.AssociationRequest(poll_options=intellivue.POLL_EXT_PERIOD_NU_1SEC | intellivue.POLL_EXT_PERIOD_RTSA | intellivue.POLL_EXT_ENUM | intellivue.POLL_EXT_NU_PRIO_LIST).build() == interface.transport.written[0][0]
+    interface.lifecycle.connected(MONITOR[0])
+
+    get = intellivue.SPpdu(interface.transport.written[-1][0])
+    assert intellivue.GetArgument in get
+    result = intellivue.SPpdu() / intellivue.ROapdus(ro_type=intellivue.RORS_APDU) / intellivue.RORSapdu(invoke_id=get[intellivue.ROIVapdu].invoke_id, command_type=intellivue.CMD_GET) / intellivue.GetResult(
+        attribute_list=intellivue.AttributeList(value=[
+            intellivue.AVAType(attribute_id=intellivue.NOM_ATTR_POLL_NU_PRIO_LIST) / intellivue.TextIdList(value=[intellivue.textId(intellivue.NOM_RESP_RATE), intellivue.textId(intellivue.NOM_ECG_CARD_BEAT_RATE)]),
+        ]),
+    )
+    interface.datagramReceived(str(result), MONITOR)
+
+    mac = interface.host_to_mac[MONITOR[0]]
+    interface.subscriptions.add(api.Subscription(monitor_id=mac, url="http://hooks.example/", physio_ids=["NOM_RESP_RATE"]))
+    assert intellivue.SPpdu(interface.transport.written[-1][0])[intellivue.TextIdList].value == [intellivue.textId(intellivue.NOM_RESP_RATE)]
+    assert interface.stats["priority_lists"]()["sets"] == 1
+
+
+class FailingDecoder(decoding.InlineDecoder):
+
+    def submit(self, host, data, callback):
+        callback(host, None)
+
+
+def test_undecodable_result_ends_its_request():
+    interface = server.IntellivueInterface(decoder=FailingDecoder(), clock=task.Clock())
+    interface.transport = proto_helpers.FakeDatagramTransport()
+
+    interface.pollHost(MONITOR[0], 1)
+    (poll, _), = interface.transport.written
+    invoke_id = intellivue.SPpdu(poll)[intellivue.ROIVapdu].invoke_id
+
+    final = makePollReply(intellivue.RORS_APDU, intellivue.RORSapdu(invoke_id=invoke_id, command_type=intellivue.CMD_CONFIRMED_ACTION), [])
+    interface.datagramReceived(final, MONITOR)
+    assert interface.tracker.stats()["in_flight"] == 0
+    assert interface.tracker.stats()["undecodable"] == 1
+
+
+def test_per_monitor_poll_interval(monkeypatch):
+    monkeypatch.setenv("POLL_INTERVALS", "00:09:FB:09:77:BD=0.5, 00:09:fb:09:77:be=5")
+    assert server.pollIntervalsFromEnvironment() == {"00:09:fb:09:77:bd": 0.5, "00:09:fb:09:77:be": 5}
+
+    interface = server.IntellivueInterface(poll_intervals=server.pollIntervalsFromEnvironment(), clock=task.Clock())
+    interface.transport = proto_helpers.FakeDatagramTransport()
+    interface.datagramReceived(SAMPLE_CONNECT_INDICATION, MONITOR)
+    interface.lifecycle.connected(MONITOR[0])
+    assert interface.host_to_mac[MONITOR[0]] == "00:09:fb:09:77:bd"
+    assert interface.scheduler.targets[MONITOR[0]].interval == 0.5
@@ -0,0 +1,169 @@
+import json
+
+import pytest
+from twisted.internet import task
+from twisted.protocols import amp
+from twisted.test import iosim, proto_helpers
+
+import api
+import intellivue
+import queries
+import server
+import shards
+import streams
+import subscriptions
+from test_intellivue import SAMPLE_CONNECT_INDICATION
+
+MAC = "00:09:fb:09:77:bd"
+MONITOR = ("10.0.0.1", intellivue.PORT_CONNECTION_INDICATION)
+
+
+class RecordingHub(streams.StreamHub):
+
+    def __init__(self):
+        streams.StreamHub.__init__(self)
+        self.published = []
+
+    def publish(self, monitor_id, serialized):
+        self.published.append((monitor_id, serialized.json))
+
+
+def makeShards(count=1):
+    """
+    A front end, and a connected worker for its first shard
+    """
+    front = shards.Shards(count, {}, subscriptions.SubscriptionRegistry(), RecordingHub(), clock=task.Clock())
+
+    worker = shards.WorkerProtocol(0)
+    interface = server.IntellivueInterface(monitors=shards.RelayedMonitors(worker), streams=shards.StreamRelay(worker), clock=task.Clock())
+    interface.transport = proto_helpers.FakeDatagramTransport()
+    worker.interface = interface
+    worker.queries = queries.Queries(interface.history, interface.aggregates, clock=interface.clock)
+
+    _, _, pump = iosim.connectedServerAndClient(lambda: shards.FrontEndProtocol(front), lambda: worker)
+    return front, interface, pump
+
+
+def test_long_string():
+    body = "x" * 200000
+    box = shards.Publish.makeArguments({"monitor_id": u"m", "body": body}, None)
+    box, = amp.parseString(box.serialize())
+    assert shards.Publish.parseArguments(box, None)["body"] == body
+
+
+def test_shard_stable():
+    front = shards.Shards(4, {}, subscriptions.SubscriptionRegistry(), RecordingHub())
+    assert front.shard(MAC) == front.shard(MAC.upper())
+    assert set(front.shard("02:00:00:00:00:%02x" % n) for n in range(64)) == set(range(4))
+
+
+def test_connect_indication_forwarded():
+    front, interface, pump = makeShards()
+    assert front.workers.keys() == [0]
+
+    shards.ConnectIndicationForwarder(front).datagramReceived(SAMPLE_CONNECT_INDICATION, MONITOR)
+    pump.flush()
+
+    assert interface.host_to_mac == {MONITOR[0]: MAC}
+    assert interface.transport.written == [(interface.associationRequest, (MONITOR[0], intellivue.PORT_PROTOCOL))]
+    assert front.monitors[MAC].host == MONITOR[0]
+
+    interface.monitorForgotten(MONITOR[0])
+    pump.flush()
+    assert front.monitors == {}
+
+
+def test_subscriptions_routed():
+    front, interface, pump = makeShards(count=2)
+    mine = next(mac for mac in ("02:00:00:00:00:%02x" % n for n in range(16)) if front.shard(mac) == 0)
+    theirs = next(mac for mac in ("02:00:00:00:00:%02x" % n for n in range(16)) if front.shard(mac) == 1)
+
+    for monitor_id in (mine, theirs, subscriptions.ALL_MONITORS):
+        front.subscriptions.add(api.Subscription(monitor_id=monitor_id, url="http://hooks.example/", physio_ids=["NOM_ECG_CARD_BEAT_RATE"]))
+    pump.flush()
+
+    assert sorted(s.monitor_id for s in interface.subscriptions.values()) == sorted([mine, subscriptions.ALL_MONITORS])
+    assert sorted(interface.subscriptions) == sorted(sid for (sid, s) in front.subscriptions.items() if s.monitor_id != theirs)
+
+    sid = next(sid for (sid, s) in front.subscriptions.items() if s.monitor_id == mine)
+    del front.subscriptions[sid]
+    pump.flush()
+    assert sid not in interface.subscriptions
+
+
+def test_subscriptions_sent_on_register():
+    front = shards.Shards(1, {}, subscriptions.SubscriptionRegistry(), RecordingHub())
+    front.subscriptions.add(api.Subscription(monitor_id=MAC, url="http://hooks.example/"))
+
+    worker = shards.WorkerProtocol(0, interface=server.IntellivueInterface(clock=task.Clock()))
+    _, _, pump = iosim.connectedServerAndClient(lambda: shards.FrontEndProtocol(front), lambda: worker)
+    pump.flush()
+
+    assert worker.interface.subscriptions.keys() == front.subscriptions.keys()
+
+
+def test_followed_monitors_relayed():
+    front, interface, pump = makeShards(count=2)
+    mine = next(mac for mac in ("02:00:00:00:00:%02x" % n for n in range(16)) if front.shard(mac) == 0)
+    theirs = next(mac for mac in ("02:00:00:00:00:%02x" % n for n in range(16)) if front.shard(mac) == 1)
+    interface.host_to_mac.update({"10.0.0.1": mine, "10.0.0.2": theirs})
+
+    for monitor_id in (mine, theirs):
+        front.streams.clients[monitor_id] = set([object()])
+    front.followersChanged()
+    pump.flush()
+
+    assert interface.streams.followed_ids == set([mine])
+    assert interface.demand.wanted("10.0.0.1")
+    assert not interface.demand.wanted("10.0.0.2")
+
+    del front.streams.clients[mine]
+    front.followersChanged()
+    pump.flush()
+    assert not interface.demand.wanted("10.0.0.1")
+
+
+def test_unfollowed_payloads_not_relayed():
+    front, interface, pump = makeShards()
+    interface.host_to_mac[MONITOR[0]] = MAC
+    interface.handleNumerics(MONITOR[0], [(intellivue.NOM_ECG_CARD_BEAT_RATE, 0, intellivue.NOM_DIM_BEAT_PER_MIN, 72)])
+    pump.flush()
+
+    assert front.streams.published == []
+    assert interface.streams.relayed == 0
+
+
+def test_payloads_published_and_queried():
+    front, interface, pump = makeShards()
+    front.streams.clients[MAC] = set([object()])
+    front.followersChanged()
+    pump.flush()
+    interface.host_to_mac[MONITOR[0]] = MAC
+    interface.handleNumerics(MONITOR[0], [(intellivue.NOM_ECG_CARD_BEAT_RATE, 0, intellivue.NOM_DIM_BEAT_PER_MIN, 72)])
+    pump.flush()
+
+    (monitor_id, body), = front.streams.published
+    assert monitor_id == MAC
+    assert json.loads(body)["observations"][0]["value"] == 72
+
+    results = []
+    front.query("observations", MAC, {"physio_id": ["NOM_ECG_CARD_BEAT_RATE"]}).addCallback(results.append)
+    front.query("aggregates", MAC, {"window": ["7"]}).addErrback(results.append)
+    pump.flush()
+
+    observations, failure = results
+    assert json.loads(observations)["observations"]["NOM_ECG_CARD_BEAT_RATE"]["values"] == [72]
+    assert failure.check(queries.BadQuery) is queries.BadQuery
+
+
+def test_stats_and_unavailable_shard():
+    front, interface, pump = makeShards(count=2)
+    front.refreshStats()
+    pump.flush()
+    assert "datagrams" in front.stats()["shards"]["0"]
+    assert front.stats()["shards"]["1"] is None
+
+    theirs = next(mac for mac in ("02:00:00:00:00:%02x" % n for n in range(16)) if front.shard(mac) == 1)
+    failures = []
+    front.query("observations", theirs, {}).addErrback(failures.append)
+    assert failures[0].check(queries.Unavailable)
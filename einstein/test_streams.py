@@ -0,0 +1,119 @@
+import api
+import serialize
+import streams
+
+MAC = "00:09:fb:09:77:bd"
+OTHER_MAC = "00:09:fb:09:77:be"
+
+
+class FakeTransport(object):
+
+    def __init__(self):
+        self.aborted = False
+
+    def abortConnection(self):
+        self.aborted = True
+
+
+class FakeRequest(object):
+
+    def __init__(self):
+        self.headers = {}
+        self.written = []
+        self.producer = None
+        self.transport = FakeTransport()
+
+    def setHeader(self, name, value):
+        self.headers[name] = value
+
+    def registerProducer(self, producer, streaming):
+        self.producer = producer
+
+    def write(self, data):
+        self.written.append(data)
+
+
+def payload(monitor_id):
+    return serialize.SerializedPayload(api.Payload(monitor_id=monitor_id, observations=[]))
+
+
+def follow(hub, monitor_ids, **kwargs):
+    request = FakeRequest()
+    client = streams.StreamClient(request, monitor_ids, **kwargs)
+    hub.add(client)
+    del request.written[:]
+    return client, request
+
+
+def test_multiplexed():
+    hub = streams.StreamHub()
+    _, one = follow(hub, [MAC])
+    _, both = follow(hub, [MAC, OTHER_MAC])
+    _, everything = follow(hub, [streams.ALL_MONITORS])
+
+    hub.publish(MAC, payload(MAC))
+    hub.publish(OTHER_MAC, payload(OTHER_MAC))
+
+    assert len(one.written) == 1
+    assert len(both.written) == 2
+    assert len(everything.written) == 2
+    assert one.written[0].startswith("event: payload\ndata: {")
+    assert one.headers['Content-Type'] == 'text/event-stream'
+
+
+def test_backpressure():
+    hub = streams.StreamHub()
+    client, request = follow(hub, [MAC])
+
+    client.pauseProducing()
+    hub.publish(MAC, payload(MAC))
+    assert request.written == []
+    assert hub.stats()["pending"] == 1
+
+    client.resumeProducing()
+    assert len(request.written) == 1
+
+
+def test_slow_consumer_disconnected():
+    hub = streams.StreamHub()
+    client, request = follow(hub, [MAC], max_pending=2)
+
+    client.pauseProducing()
+    for _ in range(3):
+        hub.publish(MAC, payload(MAC))
+
+    assert request.transport.aborted
+    assert hub.following(MAC) == set()
+    assert hub.stats()["slow_disconnections"] == 1
+
+
+def test_cancelled_when_client_goes_away():
+    hub = streams.StreamHub()
+    client, _ = follow(hub, [MAC])
+
+    client.done.addErrback(lambda _: None)
+    client.done.cancel()
+    assert hub.following(MAC) == set()
+
+
+def test_observed():
+    class Observer(object):
+        changes = 0
+
+        def followersChanged(self):
+            self.changes += 1
+
+    hub = streams.StreamHub()
+    observer = Observer()
+    hub.observe(observer)
+
+    one, _ = follow(hub, [MAC])
+    two, _ = follow(hub, [MAC])
+    assert observer.changes == 1
+    assert hub.followed() == set([MAC])
+
+    one.close()
+    assert observer.changes == 1
+    two.close()
+    assert observer.changes == 2
+    assert hub.followed() == set()
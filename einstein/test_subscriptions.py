@@ -0,0 +1,50 @@
+import api
+import subscriptions
+
+MAC = "00:09:fb:09:77:bd"
+OTHER_MAC = "00:09:fb:09:77:be"
+
+
+def makeRegistry():
+    registry = subscriptions.SubscriptionRegistry()
+    registry.add(api.Subscription(monitor_id=MAC, url="http://hooks.example/all", subscription_id="all"))
+    registry.add(api.Subscription(monitor_id=MAC, url="http://hooks.example/hr", subscription_id="hr", physio_ids=["NOM_ECG_CARD_BEAT_RATE"]))
+    registry.add(api.Subscription(monitor_id=OTHER_MAC, url="http://hooks.example/other", subscription_id="other"))
+    registry.add(api.Subscription(monitor_id=subscriptions.ALL_MONITORS, url="http://hooks.example/estate", subscription_id="estate"))
+    return registry
+
+
+def ids(matching):
+    return sorted(subscription.subscription_id for subscription in matching)
+
+
+def test_for_monitor():
+    registry = makeRegistry()
+
+    assert ids(registry.forMonitor(MAC)) == ["all", "estate", "hr"]
+    assert ids(registry.forMonitor(MAC, ["NOM_ECG_CARD_BEAT_RATE"])) == ["all", "estate", "hr"]
+    assert ids(registry.forMonitor(MAC, ["NOM_RESP_RATE"])) == ["all", "estate"]
+    assert ids(registry.forMonitor(OTHER_MAC)) == ["estate", "other"]
+    assert ids(registry.forMonitor("00:00:00:00:00:00")) == ["estate"]
+
+
+def test_mapping():
+    registry = makeRegistry()
+
+    assert len(registry) == 4
+    assert registry["hr"].physio_ids == ["NOM_ECG_CARD_BEAT_RATE"]
+
+    del registry["hr"]
+    del registry["estate"]
+    assert "hr" not in registry
+    assert ids(registry.forMonitor(MAC, ["NOM_ECG_CARD_BEAT_RATE"])) == ["all"]
+    assert not registry.by_physio_id
+    assert subscriptions.ALL_MONITORS not in registry.unrestricted
+
+
+def test_replace():
+    registry = makeRegistry()
+    registry["hr"] = api.Subscription(monitor_id=OTHER_MAC, url="http://hooks.example/hr", subscription_id="hr")
+
+    assert ids(registry.forMonitor(MAC)) == ["all", "estate"]
+    assert ids(registry.forMonitor(OTHER_MAC)) == ["estate", "hr", "other"]
@@ -0,0 +1,70 @@
+from twisted.internet import task
+
+import intellivue
+import tracker
+
+HOST = "10.0.0.1"
+
+
+def test_invoke_ids_unique_and_capped():
+    t = tracker.RequestTracker(clock=task.Clock(), max_in_flight=3)
+    assert [t.send(HOST) for _ in range(4)] == [1, 2, 3, None]
+    assert t.send("10.0.0.2") == 1
+    assert t.stats()["throttled"] == 1
+
+    assert t.result(HOST, 2, []) == []
+    assert t.send(HOST) == 4
+
+
+def test_invoke_ids_wrap():
+    t = tracker.RequestTracker(clock=task.Clock())
+    t.next_invoke_id[HOST] = tracker.MAX_INVOKE_ID
+    assert t.send(HOST) == tracker.MAX_INVOKE_ID
+    assert t.send(HOST) == 1
+
+
+def test_unmatched_and_late_results_dropped():
+    clock = task.Clock()
+    t = tracker.RequestTracker(clock=clock, timeout=5)
+    invoke_id = t.send(HOST)
+
+    assert t.result(HOST, invoke_id + 1, [1]) is None
+    clock.advance(5)
+    assert t.result(HOST, invoke_id, [1]) is None
+
+    stats = t.stats()
+    assert (stats["timed_out"], stats["unmatched"], stats["in_flight"], stats["loss"]) == (1, 2, 0, 1.0)
+
+
+def test_linked_results_reassembled_once():
+    clock = task.Clock()
+    t = tracker.RequestTracker(clock=clock)
+    invoke_id = t.send(HOST)
+    clock.advance(0.25)
+
+    t.linked(HOST, invoke_id, intellivue.RORLS_FIRST, 1, ["a"])
+    t.linked(HOST, invoke_id, intellivue.RORLS_LAST, 3, ["c"])
+    t.linked(HOST, invoke_id, intellivue.RORLS_NOT_FIRST_NOT_LAST, 2, ["b"])
+    t.linked(HOST, invoke_id, intellivue.RORLS_NOT_FIRST_NOT_LAST, 2, ["b"])
+
+    assert t.result(HOST, invoke_id, ["d"]) == ["a", "b", "c", "d"]
+    assert t.result(HOST, invoke_id, ["d"]) is None
+
+    stats = t.stats()
+    assert (stats["linked_results"], stats["duplicates"], stats["incomplete"], stats["rtt_mean"]) == (3, 1, 0, 0.25)
+
+
+def test_missing_linked_result_counted():
+    t = tracker.RequestTracker(clock=task.Clock())
+    invoke_id = t.send(HOST)
+    t.linked(HOST, invoke_id, intellivue.RORLS_FIRST, 1, ["a"])
+    t.linked(HOST, invoke_id, intellivue.RORLS_LAST, 3, ["c"])
+
+    assert t.result(HOST, invoke_id, []) == ["a", "c"]
+    assert t.stats()["incomplete"] == 1
+
+
+def test_unsolicited():
+    t = tracker.RequestTracker(clock=task.Clock(), unsolicited=True)
+    assert t.result(HOST, 0, ["a"]) == ["a"]
+    assert t.stats()["unmatched"] == 0
@@ -1,4 +1,80 @@
+import json
+from StringIO import StringIO
+
+from twisted.web.test.requesthelper import DummyRequest
+
+import api
+import intellivue
+import observation_log
 import web
 
+MAC = "00:09:fb:09:77:bd"
+
+
+def subscribe(server, body):
+    request = DummyRequest(["api", "monitor", MAC, "subscribe"])
+    request.method = "POST"
+    request.content = StringIO(json.dumps(body))
+    return request, server.subscribe(request, MAC)
+
+
 def test_web():
     pass
+
+
+def test_subscribe_physio_ids():
+    server = web.EinsteinWebServer()
+    request, response = subscribe(server, {"url": "http://hooks.example/", "physio_ids": ["NOM_ECG_CARD_BEAT_RATE"]})
+    assert json.loads(response)["physio_ids"] == ["NOM_ECG_CARD_BEAT_RATE"]
+    assert len(server.subscriptions) == 1
+
+
+def test_subscribe_invalid_physio_ids():
+    server = web.EinsteinWebServer()
+    for physio_ids in ("NOM_ECG_CARD_BEAT_RATE", 5, [5]):
+        request, response = subscribe(server, {"url": "http://hooks.example/", "physio_ids": physio_ids})
+        assert request.responseCode == 400
+    assert len(server.subscriptions) == 0
+
+
+def test_subscribe_invalid_numbers():
+    server = web.EinsteinWebServer()
+    for field, value in [("batch_size", True), ("batch_size", 1.5), ("batch_delay", True), ("max_interval", True), ("deadbands", {"NOM_ECG_CARD_BEAT_RATE": True})]:
+        request, response = subscribe(server, {"url": "http://hooks.example/", field: value})
+        assert request.responseCode == 400, field
+    assert len(server.subscriptions) == 0
+
+    request, response = subscribe(server, {"url": "http://hooks.example/", "batch_size": 5, "batch_delay": 0.5, "max_interval": 30, "deadbands": {"NOM_ECG_CARD_BEAT_RATE": 2}})
+    assert json.loads(response)["batch_size"] == 5
+
+
+def test_subscribe_changed_only():
+    server = web.EinsteinWebServer()
+    for changed_only in ("false", 0, None):
+        request, response = subscribe(server, {"url": "http://hooks.example/", "changed_only": changed_only})
+        assert request.responseCode == 400
+    assert len(server.subscriptions) == 0
+
+    request, response = subscribe(server, {"url": "http://hooks.example/", "changed_only": True})
+    assert json.loads(response)["changed_only"] is True
+    request, response = subscribe(server, {"url": "http://hooks.example/"})
+    assert json.loads(response)["changed_only"] is False
+
+
+def test_observations_nan_as_null():
+    server = web.EinsteinWebServer()
+    server.history.record(MAC, 1, [api.Observation(physio_id="NOM_ECG_CARD_BEAT_RATE", value=72)])
+    server.history.record(MAC, 2, [api.Observation(physio_id="NOM_ECG_CARD_BEAT_RATE", value=float("nan"))])
+
+    response = server.observations(DummyRequest(["api", "monitor", MAC, "observations"]), MAC)
+    assert "NaN" not in response
+    assert json.loads(response)["observations"]["NOM_ECG_CARD_BEAT_RATE"]["values"] == [72, None]
+
+
+def test_log_nan_as_null(tmpdir):
+    server = web.EinsteinWebServer(obslog=observation_log.ObservationLog(str(tmpdir)))
+    server.obslog.append(MAC, 1, [(intellivue.NOM_ECG_CARD_BEAT_RATE, 0, intellivue.NOM_DIM_BEAT_PER_MIN, float("nan"))])
+
+    response = server.log(DummyRequest(["api", "monitor", MAC, "log"]), MAC)
+    assert "NaN" not in response
+    assert json.loads(response)["observations"]["NOM_ECG_CARD_BEAT_RATE"]["values"] == [None]
@@ -0,0 +1,214 @@
+"""
+Tracking of our requests to each monitor, by invoke_id
+
+Each request gets an invoke_id of its own (per monitor), and is remembered until its result arrives,
+an error does, or it times out; results that match no request (late, duplicated, or never asked for) are dropped.
+A monitor can only have so many requests in flight at once.
+
+Linked results (ROLRSapdus, each a part of one result, numbered by their RorlsId)
+are collected until the (RORSapdu) result that ends them, and passed on together, once.
+"""
+
+from twisted.internet import reactor
+import structlog
+
+import intellivue as packets
+
+log = structlog.get_logger()
+
+
+DEFAULT_MAX_IN_FLIGHT = 4
+DEFAULT_TIMEOUT = 10  # Seconds
+
+MAX_INVOKE_ID = 0xffff
+
+
+class Request(object):
+
+    def __init__(self, invoke_id, sent_at, call):
+        self.invoke_id = invoke_id
+        self.sent_at = sent_at
+        self.call = call  # The timeout's DelayedCall
+        self.parts = {}  # Mapping of RorlsId count -> numerics
+        self.last = False  # Whether the RORLS_LAST part has arrived
+
+
+    def complete(self):
+        """
+        Whether every linked result (if there were any) has arrived
+        """
+        if not self.parts:
+            return True
+        return self.last and max(self.parts) - min(self.parts) + 1 == len(self.parts)
+
+
+    def numerics(self, final):
+        numerics = []
+        for count in sorted(self.parts):
+            numerics.extend(self.parts[count])
+        numerics.extend(final)
+        return numerics
+
+
+class RequestTracker(object):
+    """
+    If unsolicited, results to requests that weren't sent through the tracker (e.g. when replaying a capture)
+    are accepted as though they had been.
+    """
+
+    def __init__(self, clock=reactor, max_in_flight=DEFAULT_MAX_IN_FLIGHT, timeout=DEFAULT_TIMEOUT, unsolicited=False):
+        self.clock = clock
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.unsolicited = unsolicited
+
+        self.pending = {}  # Mapping of host -> {invoke_id -> Request}
+        self.next_invoke_id = {}  # Mapping of host -> invoke_id
+
+        self.sent = 0
+        self.completed = 0
+        self.linked_results = 0
+        self.incomplete = 0
+        self.timed_out = 0
+        self.errors = 0
+        self.undecodable = 0
+        self.unmatched = 0
+        self.duplicates = 0
+        self.throttled = 0
+        self.rtt_total = 0.0
+        self.rtt_max = 0.0
+
+
+    def send(self, host):
+        """
+        Allocate an invoke_id for a request to host, or return None if it already has max_in_flight
+        """
+        pending = self.pending.setdefault(host, {})
+        if len(pending) >= self.max_in_flight:
+            self.throttled += 1
+            return None
+
+        invoke_id = self.next_invoke_id.get(host, 1)
+        while invoke_id in pending:
+            invoke_id = invoke_id % MAX_INVOKE_ID + 1
+        self.next_invoke_id[host] = invoke_id % MAX_INVOKE_ID + 1
+
+        self._add(host, invoke_id)
+        self.sent += 1
+        return invoke_id
+
+
+    def _add(self, host, invoke_id):
+        call = self.clock.callLater(self.timeout, self.timedOut, host, invoke_id)
+        request = self.pending.setdefault(host, {})[invoke_id] = Request(invoke_id, self.clock.seconds(), call)
+        return request
+
+
+    def _find(self, host, invoke_id):
+        request = self.pending.get(host, {}).get(invoke_id)
+        if request is None and self.unsolicited:
+            request = self._add(host, invoke_id)
+        return request
+
+
+    def _pop(self, host, invoke_id):
+        request = self._find(host, invoke_id)
+        if request is None:
+            return None
+        del self.pending[host][invoke_id]
+        if request.call.active():
+            request.call.cancel()
+        return request
+
+
+    def linked(self, host, invoke_id, state, count, numerics):
+        """
+        Keep a linked result's numerics, until the result that ends it
+        """
+        request = self._find(host, invoke_id)
+        if request is None:
+            self.unmatched += 1
+            log.debug("Dropping unmatched linked result", host=host, invoke_id=invoke_id)
+            return
+        if count in request.parts:
+            self.duplicates += 1
+            return
+
+        request.parts[count] = numerics
+        if state == packets.RORLS_LAST:
+            request.last = True
+        self.linked_results += 1
+
+
+    def result(self, host, invoke_id, numerics):
+        """
+        The result that ends a request: returns its numerics (any linked results', then these),
+        or None if it matches no request
+        """
+        request = self._pop(host, invoke_id)
+        if request is None:
+            self.unmatched += 1
+            log.debug("Dropping unmatched result", host=host, invoke_id=invoke_id)
+            return None
+
+        rtt = self.clock.seconds() - request.sent_at
+        self.rtt_total += rtt
+        self.rtt_max = max(self.rtt_max, rtt)
+        self.completed += 1
+
+        if not request.complete():
+            self.incomplete += 1
+            log.warning("Linked results missing", host=host, invoke_id=invoke_id, parts=sorted(request.parts), last=request.last)
+
+        return request.numerics(numerics)
+
+
+    def error(self, host, invoke_id):
+        if self._pop(host, invoke_id) is not None:
+            self.errors += 1
+
+
+    def failed(self, host, invoke_id):
+        """
+        The result that ends a request couldn't be decoded: it's over, without anything to show for it
+        """
+        if self._pop(host, invoke_id) is not None:
+            self.undecodable += 1
+
+
+    def timedOut(self, host, invoke_id):
+        request = self.pending[host].pop(invoke_id)
+        self.timed_out += 1
+        log.info("Request timed out", host=host, invoke_id=invoke_id, parts=len(request.parts))
+
+
+    def forget(self, host):
+        for request in self.pending.pop(host, {}).values():
+            if request.call.active():
+                request.call.cancel()
+        self.next_invoke_id.pop(host, None)
+
+
+    def stop(self):
+        for host in self.pending.keys():
+            self.forget(host)
+
+
+    def stats(self):
+        answered = self.completed + self.errors
+        return {
+            "in_flight": sum(len(pending) for pending in self.pending.values()),
+            "sent": self.sent,
+            "completed": self.completed,
+            "linked_results": self.linked_results,
+            "incomplete": self.incomplete,
+            "timed_out": self.timed_out,
+            "errors": self.errors,
+            "undecodable": self.undecodable,
+            "unmatched": self.unmatched,
+            "duplicates": self.duplicates,
+            "throttled": self.throttled,
+            "loss": float(self.timed_out) / (answered + self.timed_out) if answered + self.timed_out else None,
+            "rtt_mean": self.rtt_total / self.completed if self.completed else None,
+            "rtt_max": self.rtt_max,
+        }
@@ -1,22 +1,59 @@
 from klein import Klein
+from twisted.python import failure
 import json
 from util import json_serialize
 import attr
+import aggregate
 import api
+import history as history_
+import queries as queries_
+import serialize
+import streams as streams_
+import subscriptions as registry
+
+
+def isInteger(value):
+    # JSON's true and false are bools, which are ints in Python
+    return isinstance(value, (int, long)) and not isinstance(value, bool)
+
+
+def isNumber(value):
+    return isInteger(value) or isinstance(value, float)
 
 
 class EinsteinWebServer(object):
 
     app = Klein()
 
-    def __init__(self, monitors=None, subscriptions=None):
+    def __init__(self, monitors=None, subscriptions=None, stats=None, streams=None, history=None, aggregates=None, obslog=None, shards=None):
         self.monitors = monitors
         if self.monitors is None:
             self.monitors = {}
 
         self.subscriptions = subscriptions
         if self.subscriptions is None:
-            self.subscriptions = {}
+            self.subscriptions = registry.SubscriptionRegistry()
+
+        self.stats = stats
+        if self.stats is None:
+            self.stats = {}
+
+        self.streams = streams
+        if self.streams is None:
+            self.streams = streams_.StreamHub()
+
+        self.history = history
+        if self.history is None:
+            self.history = history_.ObservationHistory()
+
+        self.aggregates = aggregates
+        if self.aggregates is None:
+            self.aggregates = aggregate.Aggregates()
+
+        self.obslog = obslog  # An optional observation_log.ObservationLog
+        self.queries = queries_.Queries(self.history, self.aggregates, self.obslog)
+
+        self.shards = shards  # When sharded, the shards.Shards that answer queries instead
 
 
     @app.route('/api/monitors')
@@ -26,6 +63,14 @@ class EinsteinWebServer(object):
         return json.dumps(monitors, default=json_serialize)
 
 
+    @app.route('/api/stats')
+    def stats(self, request):
+        request.setHeader('Content-Type', 'application/json')
+        # Live statistics are registered as callables
+        stats = dict((name, value() if callable(value) else value) for (name, value) in self.stats.items())
+        return json.dumps(stats, default=json_serialize)
+
+
     @app.route('/subscriptions')
     def subscriptions(self, request):
         request.setHeader('Content-Type', 'application/json')
@@ -34,16 +79,138 @@ class EinsteinWebServer(object):
 
     @app.route('/api/monitor/<string:monitor_id>/subscribe', methods=['POST'])
     def subscribe(self, request, monitor_id):
+        # monitor_id may be registry.ALL_MONITORS, to subscribe to every monitor
         # TODO Validate monitor_id
         # TODO Validate body
         body = json.load(request.content)
         url = body["url"]
-        sub = api.Subscription(monitor_id=monitor_id, url=url)
+        content_encoding = body.get("content_encoding")
+        if content_encoding not in serialize.CONTENT_ENCODINGS:
+            request.setResponseCode(400)
+            return
+        physio_ids = body.get("physio_ids")  # Optional; a list of physio_id labels, e.g. "NOM_ECG_CARD_BEAT_RATE"
+        if physio_ids is not None and not (isinstance(physio_ids, list) and all(isinstance(p, basestring) for p in physio_ids)):
+            request.setResponseCode(400)
+            return
+
+        # Optional; setting either batches Payloads into JSON arrays
+        batch_size = body.get("batch_size")
+        batch_delay = body.get("batch_delay")
+        if batch_size is not None and (not isInteger(batch_size) or batch_size < 1):
+            request.setResponseCode(400)
+            return
+        if batch_delay is not None and (not isNumber(batch_delay) or batch_delay <= 0):
+            request.setResponseCode(400)
+            return
+
+        # Optional; see filters
+        changed_only = body.get("changed_only", False)
+        deadbands = body.get("deadbands")
+        max_interval = body.get("max_interval")
+        if not isinstance(changed_only, bool):
+            request.setResponseCode(400)
+            return
+        if deadbands is not None and not (isinstance(deadbands, dict) and all(isNumber(d) and d >= 0 for d in deadbands.values())):
+            request.setResponseCode(400)
+            return
+        if max_interval is not None and (not isNumber(max_interval) or max_interval <= 0):
+            request.setResponseCode(400)
+            return
+
+        # Optional; one of aggregate.WINDOWS
+        aggregate_window = body.get("aggregate")
+        if aggregate_window is not None and aggregate_window not in aggregate.WINDOWS:
+            request.setResponseCode(400)
+            return
+
+        sub = api.Subscription(
+            monitor_id=monitor_id,
+            url=url,
+            physio_ids=physio_ids,
+            changed_only=changed_only,
+            deadbands=deadbands,
+            max_interval=max_interval,
+            content_encoding=content_encoding,
+            batch_size=batch_size,
+            batch_delay=batch_delay,
+            aggregate=aggregate_window,
+        )
         self.subscriptions[sub.subscription_id] = sub
 
         request.setHeader('Content-Type', 'application/json')
         return json.dumps(attr.asdict(sub))
 
+    @app.route('/api/monitor/<string:monitor_id>/observations')
+    def observations(self, request, monitor_id):
+        """
+        Recent observations, optionally restricted to physio_id(s) and to times (in seconds since the epoch) since/until
+        """
+        return self.query(request, "observations", monitor_id)
+
+
+    @app.route('/api/monitor/<string:monitor_id>/log')
+    def log(self, request, monitor_id):
+        """
+        Logged observations (if there's an observation log),
+        optionally restricted to physio_id(s) and to times (in seconds since the epoch) since/until
+        """
+        return self.query(request, "log", monitor_id)
+
+
+    @app.route('/api/monitor/<string:monitor_id>/aggregates')
+    def aggregates(self, request, monitor_id):
+        """
+        Rolling count/mean/min/max over the last window (one of aggregate.WINDOWS) seconds, optionally restricted to physio_id(s)
+        """
+        return self.query(request, "aggregates", monitor_id)
+
+
+    def query(self, request, name, monitor_id):
+        """
+        Answer one of queries.Queries, here or (when sharded) by the monitor's worker
+        """
+        request.setHeader('Content-Type', 'application/json')
+
+        if self.shards is not None:
+            d = self.shards.query(name, monitor_id, request.args)
+            d.addErrback(self.queryFailed, request)
+            return d
+
+        try:
+            result = self.queries.run(name, monitor_id, request.args)
+        except (queries_.BadQuery, queries_.NotFound) as e:
+            return self.queryFailed(failure.Failure(e), request)
+        return json.dumps(result, default=json_serialize)
+
+
+    def queryFailed(self, f, request):
+        f.trap(queries_.BadQuery, queries_.NotFound, queries_.Unavailable)
+        request.setResponseCode({
+            queries_.BadQuery: 400,
+            queries_.NotFound: 404,
+            queries_.Unavailable: 503,
+        }[f.type])
+
+
+    @app.route('/api/monitor/<string:monitor_id>/stream')
+    def stream(self, request, monitor_id):
+        return self.follow(request, [monitor_id])
+
+
+    @app.route('/api/stream')
+    def streamMany(self, request):
+        """
+        Several monitors (given as monitor_id query parameters) on one stream, or every monitor if none are given
+        """
+        return self.follow(request, request.args.get('monitor_id', [registry.ALL_MONITORS]))
+
+
+    def follow(self, request, monitor_ids):
+        client = streams_.StreamClient(request, monitor_ids)
+        self.streams.add(client)
+        return client.done
+
+
     @app.route('/api/subscribe/<string:subscription_id>', methods=['DELETE'])
     def unsubscribe(self, request, subscription_id):
         if subscription_id not in self.subscriptions: